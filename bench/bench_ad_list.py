@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# 广告列表翻页基准：LIMIT/OFFSET + COUNT(*)(原实现) vs keyset 游标 + ad_counts 计数表
+#
+# 向临时库灌入 N 条广告(默认 100k，分布在若干分类)，分别测第 1/10/100/1000/末页 的翻页耗时。
+#
+# 运行：python bench/bench_ad_list.py [广告数] [每页重复次数]
+
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH-token")
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="navbot-bench-"), "bench.db"))
+
+import bot  # noqa: E402
+
+PER = 10
+
+
+def seed(n: int) -> None:
+    with bot.pool.connection() as c:
+        cats = [r["id"] for r in c.execute("SELECT id FROM ad_categories")]
+        rnd = random.Random(1)
+        c.executemany("INSERT INTO ads(title, caption, url, photo_file_id, category_id, active) VALUES(?,?,?,?,?,1)",
+                      ((f"广告 {i}", "文案", "https://example.com", "", rnd.choice(cats)) for i in range(n)))
+        c.commit()
+
+
+async def legacy_page(page: int, cat_id) -> None:
+    # 原实现：每次翻页 COUNT(*) + OFFSET 扫描
+    off = (page - 1) * PER
+    if cat_id:
+        await bot.pool.fetchone("SELECT COUNT(*) AS c FROM ads WHERE category_id=?", (cat_id,))
+        await bot.pool.fetchall("""SELECT a.*, coalesce(c.name,'未分类') as cat_name
+                                   FROM ads a LEFT JOIN ad_categories c ON a.category_id=c.id
+                                   WHERE a.category_id=? ORDER BY a.id DESC LIMIT ? OFFSET ?""", (cat_id, PER, off))
+    else:
+        await bot.pool.fetchone("SELECT COUNT(*) AS c FROM ads")
+        await bot.pool.fetchall("""SELECT a.*, coalesce(c.name,'未分类') as cat_name
+                                   FROM ads a LEFT JOIN ad_categories c ON a.category_id=c.id
+                                   ORDER BY a.id DESC LIMIT ? OFFSET ?""", (PER, off))
+
+
+async def keyset_page(page: int, cat_id, cursor: int) -> None:
+    await bot.ad_count(cat_id)
+    await bot.kb_ad_list(page, cat_id, cursor)
+
+
+def cursor_for(page: int, cat_id) -> int:
+    """第 page 页的游标 = 上一页最后一条的 id(计时外预先取好，相当于按钮里携带的值)。"""
+    if page <= 1:
+        return 0
+    where = "WHERE category_id=?" if cat_id else ""
+    params = (cat_id,) if cat_id else ()
+    with bot.pool.connection() as c:
+        row = c.execute(f"SELECT id FROM ads {where} ORDER BY id DESC LIMIT 1 OFFSET ?",
+                        (*params, (page - 1) * PER - 1)).fetchone()
+    return row["id"]
+
+
+async def timeit(coro_fn, reps: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        await coro_fn()
+    return (time.perf_counter() - t0) / reps * 1000
+
+
+async def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    reps = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    bot.init_db()
+    t0 = time.perf_counter()
+    seed(n)
+    print(f"seeded {n} ads in {time.perf_counter() - t0:.1f}s")
+    cat = bot.pool.run_sync(lambda c: c.execute("SELECT id FROM ad_categories ORDER BY id LIMIT 1").fetchone()["id"])
+
+    for cat_id, label in ((None, "全部"), (cat, f"分类 {cat}")):
+        total = await bot.ad_count(cat_id)
+        last = max(1, (total + PER - 1) // PER)
+        print(f"\n[{label}] {total} 条，{last} 页")
+        print(f"{'page':>8}{'offset+count ms':>18}{'keyset+table ms':>18}")
+        for page in (1, 10, 100, 1000, last):
+            if page > last:
+                continue
+            cur = cursor_for(page, cat_id)
+            old = await timeit(lambda: legacy_page(page, cat_id), reps)
+            new = await timeit(lambda: keyset_page(page, cat_id, cur), reps)
+            print(f"{page:>8}{old:>18.2f}{new:>18.2f}")
+    bot.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# 广告模板存储基准：旧的整文件 JSON 读写 vs AdTemplateStore(SQLite + LRU)
+#
+# 对 N 个模板分别测：保存一条、按 ID 读取(缓存命中/未命中)、列出一页。
+# 另做正确性检查：旧 JSON 导入、并发保存不丢版本、历史版本读取、keyset 翻页覆盖全部模板。
+#
+# 运行：python bench/bench_ad_templates.py [N，可多个，如 100 10000 50000]
+
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from navbot.ad_templates import AdTemplateStore  # noqa: E402
+from navbot.dbpool import SQLitePool  # noqa: E402
+
+BUDGET = 0.5
+
+
+async def per_call(fn, *args) -> float:
+    await fn(*args)
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < BUDGET:
+        await fn(*args)
+        n += 1
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def make_json(path: Path, n: int) -> None:
+    data = {f"ad{i:06d}": {"text": f"广告 {i} " + "文案" * 40, "buttons": []} for i in range(n)}
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+async def run(n: int, tmp: str) -> None:
+    jpath = Path(tmp) / f"tpl{n}.json"
+    make_json(jpath, n)
+
+    # 旧实现：每个命令都整文件解析，保存时整文件重写
+    async def json_get(name):
+        return json.loads(jpath.read_text(encoding="utf-8")).get(name)
+
+    async def json_save(name):
+        data = json.loads(jpath.read_text(encoding="utf-8"))
+        data[name] = {"text": "新文案", "buttons": []}
+        jpath.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    async def json_list():
+        return list(json.loads(jpath.read_text(encoding="utf-8")))[:20]
+
+    pool = SQLitePool(os.path.join(tmp, f"tpl{n}.db"), size=2)
+    with pool.connection() as c:
+        AdTemplateStore.ensure_schema(c)
+        assert AdTemplateStore.import_json(c, str(jpath)) == n
+    store = AdTemplateStore(pool, cache_size=256)
+    cold = AdTemplateStore(pool, cache_size=0)
+    hot = f"ad{n // 2:06d}"
+
+    async def db_save(name):
+        await store.save(name, "新文案")
+
+    rows = [
+        ("save", await per_call(json_save, hot), await per_call(db_save, hot)),
+        ("get (cold)", await per_call(json_get, hot), await per_call(cold.get, hot)),
+        ("get (hot)", await per_call(json_get, hot), await per_call(store.get, hot)),
+        ("list page", await per_call(json_list), await per_call(store.page, 20, n // 2)),
+    ]
+    for op, a, b in rows:
+        print(f"{n:>8}  {op:<12}{a:>12.1f}{b:>12.1f}")
+    pool.close()
+
+
+async def check(tmp: str) -> None:
+    pool = SQLitePool(os.path.join(tmp, "check.db"), size=4)
+    with pool.connection() as c:
+        AdTemplateStore.ensure_schema(c)
+    a, b = AdTemplateStore(pool), AdTemplateStore(pool)
+    await asyncio.gather(*(s.save("x", f"v{i}") for i, s in enumerate([a, b] * 10)))
+    assert (await AdTemplateStore(pool).get("x")).version == 20
+    assert len(await a.history("x", 100)) == 20
+    t = await a.save("x", buttons=[["官网", "https://example.com"]])
+    assert t.buttons == ({"text": "官网", "url": "https://example.com"},) and t.version == 21
+    assert (await a.get("x", 1)).text in {f"v{i}" for i in range(20)}
+    try:
+        await a.save("x", buttons=[["坏链接", "javascript:1"]])
+        raise AssertionError("invalid url accepted")
+    except ValueError:
+        pass
+    for i in range(45):
+        await a.save(f"p{i}", "t")
+    seen, cur, more = [], 0, True
+    while more:
+        rows, more = await a.page(20, after=cur)
+        seen += [r["name"] for r in rows]
+        cur = rows[-1]["id"]
+    assert len(seen) == 46 and len(set(seen)) == 46
+    back, _ = await a.page(20, before=cur)
+    assert [r["name"] for r in back] == seen[-21:-1]
+    assert await a.delete("x") and await a.get("x") is None and await a.history("x") == []
+    pool.close()
+    print("store: ok")
+
+
+async def main() -> None:
+    sizes = [int(x) for x in sys.argv[1:]] or [100, 10000, 50000]
+    with tempfile.TemporaryDirectory() as tmp:
+        await check(tmp)
+        print(f"{'templates':>8}  {'op':<12}{'json µs':>12}{'store µs':>12}")
+        for n in sizes:
+            await run(n, tmp)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
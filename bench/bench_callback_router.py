@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# 回调分发基准：aiogram 过滤器链(F.data.startswith，按注册顺序逐个求值) vs CallbackRouter 查表
+#
+# 各注册 N 个前缀 handler(外加若干完全匹配)，投递命中最后一个/中间一个/未命中的回调，
+# 测 dp.feed_update 单次耗时。handler 不调用 Bot API，测到的就是分发本身的开销。
+#
+# 运行：python bench/bench_callback_router.py [N，可多个，如 10 100 1000]
+
+import os
+import sys
+import time
+import asyncio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiogram import Bot, Dispatcher, F  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+from fake_api import callback_update  # noqa: E402
+from navbot.callback_router import CallbackRouter  # noqa: E402
+
+BUDGET = 1.0  # 每种情况最多测 1 秒
+
+
+async def _noop(cq, **kw):
+    return True
+
+
+def build_filters(n: int) -> Dispatcher:
+    dp = Dispatcher()
+    for i in range(n):
+        dp.callback_query.register(_noop, F.data == f"menu{i}")
+        dp.callback_query.register(_noop, F.data.startswith(f"p{i}:"))
+    return dp
+
+
+def build_router(n: int) -> Dispatcher:
+    dp = Dispatcher()
+    cb = CallbackRouter()
+    cb.attach(dp)
+    for i in range(n):
+        cb.exact(f"menu{i}")(_noop)
+        cb.prefix(f"p{i}:", int)(_noop)
+    return dp
+
+
+async def per_update(dp: Dispatcher, bot: Bot, data: str) -> float:
+    upd = Update.model_validate(callback_update(1, data), context={"bot": bot})
+    for _ in range(5):
+        await dp.feed_update(bot, upd)
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < BUDGET:
+        await dp.feed_update(bot, upd)
+        n += 1
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+async def main() -> None:
+    sizes = [int(a) for a in sys.argv[1:]] or [10, 100, 1000]
+    bot = Bot("123456:BENCH-token")
+    print(f"{'handlers':>9}  {'case':<10}{'filters µs':>12}{'router µs':>12}")
+    for n in sizes:
+        a, b = build_filters(n), build_router(n)
+        for case, data in (("last", f"p{n - 1}:42"), ("middle", f"p{n // 2}:42"), ("miss", "nothing:1")):
+            print(f"{2 * n:>9}  {case:<10}{await per_update(a, bot, data):>12.1f}{await per_update(b, bot, data):>12.1f}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
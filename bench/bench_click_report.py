@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# 广告报表基准：ad_clicks 全表 GROUP BY(原实现) vs 汇总表 + HLL 草图
+#
+# 向临时库写入 N 条点击(单个广告、3 个按钮、分布在 30 天、U 个用户)与若干曝光，
+# 经 backfill 生成草图后，对比两种报表耗时，并核对独立用户估计值与精确值的误差。
+#
+# 运行：python bench/bench_click_report.py [点击数] [用户数]
+
+import os
+import sys
+import time
+import random
+import asyncio
+import datetime
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from navbot.dbpool import SQLitePool  # noqa: E402
+from navbot.write_behind import WriteBehind  # noqa: E402
+from navbot.click_analytics import ClickAnalytics  # noqa: E402
+
+AD = "spring"
+BUTTONS = ["ad_buy_spring", "ad_more_spring", "ad_contact_spring"]
+BATCH = 1000
+
+
+def seed(pool: SQLitePool, n: int, users: int) -> float:
+    rnd = random.Random(3)
+    now = datetime.datetime.utcnow()
+    t0 = time.perf_counter()
+    with pool.connection() as c:
+        for start in range(0, n, BATCH):
+            rows = [(rnd.randrange(users), None, AD, rnd.choice(BUTTONS),
+                     (now - datetime.timedelta(seconds=rnd.randrange(86400 * 30))).isoformat())
+                    for _ in range(min(BATCH, n - start))]
+            c.executemany("INSERT INTO ad_clicks(user_id, username, ad_id, button_label, clicked_at) VALUES(?,?,?,?,?)",
+                          rows)
+            c.commit()
+        c.executemany("INSERT INTO ad_impressions(ad_id, chat_id, sent_at) VALUES(?,?,?)",
+                      [(AD, str(-100 - i), (now - datetime.timedelta(hours=i)).isoformat()) for i in range(n // 20)])
+        c.commit()
+    return n / (time.perf_counter() - t0)
+
+
+def legacy_report(pool: SQLitePool) -> None:
+    with pool.connection() as c:
+        c.execute("SELECT button_label, COUNT(*) FROM ad_clicks WHERE ad_id=? GROUP BY button_label", (AD,)).fetchall()
+
+
+async def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    path = os.path.join(tempfile.mkdtemp(prefix="navbot-bench-"), "clicks.db")
+    pool = SQLitePool(path, size=2)
+    analytics = ClickAnalytics(pool, WriteBehind())
+    with pool.connection() as c:
+        ClickAnalytics.ensure_schema(c)
+        c.commit()
+    rate = seed(pool, n, users)
+    print(f"seeded {n} clicks ({rate:.0f} rows/s with rollup triggers)")
+    bf = await analytics.backfill()
+    print(f"backfill: {bf['seconds']:.1f}s")
+
+    # 原实现没有 ad_id 索引；去掉新索引后测一次，模拟升级前
+    with pool.connection() as c:
+        c.execute("DROP INDEX idx_ad_clicks_ad_time")
+        t0 = time.perf_counter()
+        legacy_report(pool)
+        legacy_noidx = (time.perf_counter() - t0) * 1000
+        c.execute("CREATE INDEX idx_ad_clicks_ad_time ON ad_clicks(ad_id, clicked_at)")
+        c.commit()
+    t0 = time.perf_counter()
+    legacy_report(pool)
+    legacy_idx = (time.perf_counter() - t0) * 1000
+
+    reps = 20
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        r = await analytics.report(AD, hours=24)
+    report_ms = (time.perf_counter() - t0) * 1000 / reps
+
+    with pool.connection() as c:
+        exact = c.execute("SELECT COUNT(DISTINCT user_id) FROM ad_clicks WHERE ad_id=?", (AD,)).fetchone()[0]
+    err = (r["unique_clickers"] - exact) / exact * 100
+    print(f"legacy GROUP BY (no index) : {legacy_noidx:8.1f} ms")
+    print(f"legacy GROUP BY (indexed)  : {legacy_idx:8.1f} ms")
+    print(f"report (rollups + HLL)     : {report_ms:8.2f} ms   "
+          f"clicks={r['clicks']} impressions={r['impressions']} ctr={r['ctr']:.2f}")
+    print(f"unique clickers: exact {exact}, HLL {r['unique_clickers']} ({err:+.2f}%)")
+    pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Bot API HTTP 会话基准：aiogram 原生 AiohttpSession vs TunedSession(navbot/http_session.py)
+#
+# 经进程内模拟 Bot API(bench/fake_api.py)用真实的 aiogram Bot，固定并发下发 N 次 sendMessage，测 请求/秒 与延迟。
+# 并发分别取 连接上限以内 和 超过原生会话的 100 连接上限 两档。
+# 另测断连注入：按概率在返回前断开连接，看 editMessageText(幂等，会重试)与 sendMessage(非幂等，不重试)的失败数。
+# 正确性检查：按方法的超时、显式超时优先、幂等判定、钩子调用次数。
+#
+# 运行：python bench/bench_http_session.py [N，默认 5000] [--concurrency 64] [--latency ms，默认 50] [--drop 0.02]
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web  # noqa: E402
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.exceptions import TelegramNetworkError  # noqa: E402
+
+from fake_api import FakeBotAPI  # noqa: E402
+from navbot.dbpool import LatencyWindow  # noqa: E402
+from navbot.http_session import TunedSession, is_idempotent, parse_timeouts  # noqa: E402
+
+
+class FlakyAPI(FakeBotAPI):
+    """drop>0 时按概率不回响应、直接断开连接(模拟中间网络设备掐断连接)。"""
+
+    def __init__(self, drop: float = 0.0, **kw):
+        super().__init__(**kw)
+        self.drop = drop
+        self.dropped = 0
+        self._drop_rnd = random.Random(7)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if self.drop and method != "getMe" and self._drop_rnd.random() < self.drop:
+            await request.read()
+            self.dropped += 1
+            request.transport.close()  # type: ignore[union-attr]
+            return web.Response()
+        return await super()._handle(request)
+
+
+async def fire(bot: Bot, n: int, concurrency: int, call) -> tuple:
+    """固定并发跑 n 次 call(bot, i)，返回 (秒, 失败数)。"""
+    sem = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def one(i: int) -> None:
+        nonlocal failed
+        async with sem:
+            try:
+                await call(bot, i)
+            except TelegramNetworkError:
+                failed += 1
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return time.perf_counter() - t0, failed
+
+
+def send(bot: Bot, i: int):
+    return bot.send_message(10_000 + i % 500, "ping")
+
+
+def edit(bot: Bot, i: int):
+    return bot.edit_message_text("pong", chat_id=10_000 + i % 500, message_id=i + 1)
+
+
+def make(kind: str, base: str, limit: int) -> AiohttpSession:
+    server = TelegramAPIServer.from_base(base)
+    if kind == "default":
+        return AiohttpSession(api=server)
+    return TunedSession(api=server, limit=limit, keepalive=60, retries=2, backoff=0.01)
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("n", nargs="?", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--latency", type=float, default=50.0)
+    ap.add_argument("--drop", type=float, default=0.02)
+    args = ap.parse_args()
+
+    # ---- 正确性 ----
+    s = TunedSession(timeouts=parse_timeouts("sendPhoto=90, bad, answerCallbackQuery=x, getChat=3"))
+    assert s.timeout_for("sendPhoto").total == 90 and s.timeout_for("getChat").total == 3
+    assert s.timeout_for("sendMessage").total == s.timeout
+    assert s.timeout_for("sendPhoto", 25).total == 25           # 轮询等显式超时优先
+    assert s.timeout_for("answerCallbackQuery").total == 10     # 默认表
+    assert s.timeout_for("getChat").sock_connect == 3
+    assert is_idempotent("editMessageText") and is_idempotent("getChatMember") and not is_idempotent("sendMessage")
+    assert all(s.delay(a) <= s.backoff_max * 1.5 for a in range(10))
+
+    api = FlakyAPI(latency=args.latency / 1000)
+    base = await api.start()
+    ts = make("tuned", base, 100)
+    seen = []
+    ts.on_request.append(lambda name, attempt: seen.append(("req", name, attempt)))
+    ts.on_response.append(lambda name, dt, attempt, err: seen.append(("resp", name, attempt)))
+    bot = Bot("123456:BENCH-token", session=ts)
+    await bot.get_me()
+    assert seen == [("req", "getMe", 0), ("resp", "getMe", 0)], seen
+    api.drop = 1.0
+    try:
+        await bot.send_message(1, "x")
+        raise AssertionError("dropped sendMessage succeeded")
+    except TelegramNetworkError:
+        pass
+    assert ts.retried == 0 and api.dropped == 1                 # 响应丢了的发送不重发
+    try:
+        await bot.edit_message_text("x", chat_id=1, message_id=1)
+        raise AssertionError("dropped edit succeeded")
+    except TelegramNetworkError:
+        pass
+    assert ts.retried == 2 and api.dropped == 4                 # 幂等方法重试 2 次后放弃
+    api.drop = 0.0
+    await ts.close()
+    print("session: ok")
+
+    # ---- 吞吐 ----
+    print(f"{args.n} 次 sendMessage，API 延迟 {args.latency:.0f} ms")
+    print(f"{'':<30}{'并发':>6}{'秒':>8}{'请求/秒':>10}{'p50 ms':>9}{'p99 ms':>9}  连接")
+    for conc, limit in ((args.concurrency, 100), (256, 256)):
+        for kind in ("default", "tuned"):
+            session = make(kind, base, limit)
+            win = {"w": LatencyWindow(size=args.n)}
+            if isinstance(session, TunedSession):
+                session.on_response.append(lambda name, dt, attempt, err: win["w"].add(dt))
+            else:
+                async def timed(make_request, bot, method):
+                    t0 = time.perf_counter()
+                    try:
+                        return await make_request(bot, method)
+                    finally:
+                        win["w"].add(time.perf_counter() - t0)
+                session.middleware(timed)
+            b = Bot("123456:BENCH-token", session=session)
+            await fire(b, min(conc * 4, args.n), conc, send)  # 预热：建好连接
+            win["w"] = LatencyWindow(size=args.n)
+            dt, _ = await fire(b, args.n, conc, send)
+            sm = win["w"].summary()
+            name = f"{'AiohttpSession' if kind == 'default' else 'TunedSession'}(limit={100 if kind == 'default' else limit})"
+            conns = (f"新建 {session.stats()['conn_created']} 复用 {session.stats()['conn_reused']}"
+                     if isinstance(session, TunedSession) else "")
+            print(f"{name:<30}{conc:>6}{dt:>8.2f}{args.n / dt:>10.0f}{sm['p50_ms']:>9.1f}{sm['p99_ms']:>9.1f}  {conns}")
+            await session.close()
+
+    # ---- 断连注入 ----
+    print(f"\n断连注入 {args.drop:.0%}，{args.n} 次调用，并发 {args.concurrency}")
+    print(f"{'':<30}{'方法':>18}{'秒':>8}{'失败':>8}{'断连':>8}")
+    api.drop = args.drop
+    for kind in ("default", "tuned"):
+        for label, call in (("editMessageText", edit), ("sendMessage", send)):
+            session = make(kind, base, 100)
+            b = Bot("123456:BENCH-token", session=session)
+            d0 = api.dropped
+            dt, failed = await fire(b, args.n, args.concurrency, call)
+            name = "AiohttpSession" if kind == "default" else "TunedSession"
+            print(f"{name:<30}{label:>18}{dt:>8.2f}{failed:>8}{api.dropped - d0:>8}")
+            await session.close()
+    await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
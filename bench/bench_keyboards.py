@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# 键盘构建微基准：对比每次回调重新构建(原实现)与 KeyboardRegistry 缓存命中的耗时
+#
+# 运行：python bench/bench_keyboards.py [次数]
+
+import os
+import sys
+import time
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH-token")
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="navbot-bench-"), "bench.db"))
+
+import bot  # noqa: E402
+
+CASES = [
+    ("main_menu", ()),
+    ("idx_home_menu", ()),
+    ("idx_page", ("AG", "C")),
+    ("idx_page", ("HZ", "H")),
+    ("big_bank_menu", ()),
+    ("bank_detail_menu", ("中国银行",)),
+    ("tools_home_kb", ()),
+    ("cooperation_info_kb", ()),
+    ("shares_bank_menu", ()),
+    ("contact_menu_kb", ()),
+    ("build_bank_detail_kb", ("建设银行",)),
+]
+
+
+def timeit(fn, args, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(*args)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bot.init_db()
+    print(f"{'keyboard':<22}{'rebuild µs':>12}{'cached µs':>12}{'speedup':>10}")
+    for name, args in CASES:
+        cached = getattr(bot, name)
+        raw = cached.__wrapped__
+        before = timeit(raw, args, n)
+        cached(*args)  # 预热
+        after = timeit(cached, args, n)
+        print(f"{name:<22}{before:>12.2f}{after:>12.2f}{before / after:>9.1f}x")
+    print("registry:", bot.keyboards.stats())
+
+
+if __name__ == "__main__":
+    main()
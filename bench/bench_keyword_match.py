@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# 关键词菜单匹配基准：逐个 `key in text`(原 handle_custom_queries 的做法) vs Aho-Corasick 自动机
+#
+# 先用临时 DB 走一遍 KeywordMenus 的 种子/增删改/增量刷新/优先级 流程做正确性检查，
+# 再对 N 个关键词、不同长度的消息测单次匹配耗时。自动机耗时应只随消息长度增长，与 N 无关。
+#
+# 运行：python bench/bench_keyword_match.py [N，可多个，如 10 1000 10000]
+
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from navbot.aho_corasick import AhoCorasick  # noqa: E402
+from navbot.dbpool import SQLitePool  # noqa: E402
+from navbot.keyword_menus import KeywordMenus  # noqa: E402
+
+BUDGET = 0.5
+CJK = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+
+
+def per_call(fn, *args) -> float:
+    fn(*args)
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < BUDGET:
+        fn(*args)
+        n += 1
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def naive(keys, text):
+    low = text.lower().strip()
+    for k in keys:
+        if k in low:
+            return k
+    return None
+
+
+async def check_catalogue() -> None:
+    tmp = tempfile.mkdtemp()
+    pool = SQLitePool(os.path.join(tmp, "kw.db"), size=2)
+    with pool.connection() as c:
+        KeywordMenus.ensure_schema(c)
+        n = KeywordMenus.seed(c, {"电销话术": {"title": "A", "buttons": [("x", "https://t.me/a")]},
+                                  "话术": {"title": "B"}})
+        assert n == 2 and KeywordMenus.seed(c, {"x": {"title": "y"}}) == 0
+    km = KeywordMenus(pool)
+    assert await km.load() == 2
+    # 更长的关键词优先
+    assert km.match("请发我电销话术谢谢").name == "电销话术"
+    assert km.match("话术").name == "话术"
+    # 优先级高者胜出；增量刷新只读新 rev
+    await km.upsert({"name": "话术", "title": "B", "priority": 5, "aliases": ["模板"]})
+    assert km.match("请发我电销话术谢谢").name == "话术"
+    assert km.match("给个模板").name == "话术"
+    assert await km.load() == 0
+    # 删除后别名失效，被遮蔽的关键词恢复
+    assert await km.delete("话术") and km.match("给个模板") is None
+    assert km.match("电销话术").name == "电销话术" and km.match("话术") is None
+    # 另一个进程的写入在 TTL 到期后被发现
+    other = KeywordMenus(pool, ttl=0.01)
+    await other.load()
+    await km.upsert({"name": "结算", "title": "C"})
+    await asyncio.sleep(0.02)
+    await other.maybe_refresh()
+    assert other.match("结算规则").name == "结算"
+    assert km.get("结算").keyboard.inline_keyboard[-1][0].callback_data == "go_home"
+    pool.close()
+    print("catalogue: ok")
+
+
+def main() -> None:
+    asyncio.run(check_catalogue())
+    sizes = [int(a) for a in sys.argv[1:]] or [10, 1000, 10000]
+    rnd = random.Random(7)
+    print(f"{'keywords':>9}  {'msg len':>7}{'naive µs':>12}{'automaton µs':>14}{'build ms':>10}")
+    for n in sizes:
+        keys = list({"".join(rnd.choices(CJK, k=rnd.randint(2, 6))) for _ in range(n)})
+        ac = AhoCorasick()
+        for k in keys:
+            ac.add(k, k)
+        t0 = time.perf_counter()
+        ac.find_all("")
+        build_ms = (time.perf_counter() - t0) * 1e3
+        for length in (10, 100, 1000):
+            # 未命中是最坏情况：朴素做法要把全部关键词都试一遍
+            text = "".join(rnd.choices(CJK, k=length))
+            print(f"{n:>9}  {length:>7}{per_call(naive, keys, text):>12.1f}"
+                  f"{per_call(ac.find_all, text):>14.1f}{build_ms:>10.1f}")
+            build_ms = 0.0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# 日志开销基准：同步 FileHandler(原 basicConfig 配置) vs QueueHandler + 后台线程(navbot/logsetup.py)
+#
+# 一次突发投递 N 个"handler"协程，每个写 2 行日志(与 track_ad_click / cmd_start 相同的写法)后让出循环。
+# 统计每个 handler 内日志调用耗时的 p50/p99/max，以及整批完成用时。
+# "slow disk" 用每次写入 sleep 模拟磁盘抖动(日志盘被备份/压缩任务占满时常见)。
+#
+# 运行：python bench/bench_logging.py [N，默认 5000]
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from navbot.logsetup import TEXT_FORMAT, _SizeRotatingOut, setup_logging  # noqa: E402
+from navbot.metrics import Histogram  # noqa: E402
+
+SLOW_WRITE_S = 0.0005
+
+
+class SlowFileHandler(logging.FileHandler):
+    def flush(self) -> None:
+        super().flush()
+        time.sleep(SLOW_WRITE_S)
+
+
+class SlowQueuedFileHandler(_SizeRotatingOut):
+    def flush_now(self) -> None:
+        super().flush_now()
+        time.sleep(SLOW_WRITE_S)
+
+
+def reset_root() -> None:
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+        h.close()
+
+
+def sync_setup(path: str, slow: bool):
+    reset_root()
+    h = (SlowFileHandler if slow else logging.FileHandler)(path, encoding="utf-8")
+    h.setFormatter(logging.Formatter(TEXT_FORMAT))
+    logging.getLogger().addHandler(h)
+    logging.getLogger().setLevel(logging.INFO)
+    return None
+
+
+def queued_setup(path: str, slow: bool, sample: str = ""):
+    reset_root()
+    log = setup_logging(path=path, console=False, sample=sample, queue_size=100000)
+    if slow:
+        # 换成慢盘版本的文件输出，其余配置不变
+        fh = log.listener.handlers[0]
+        slow_h = SlowQueuedFileHandler(path, encoding="utf-8")
+        slow_h.setFormatter(fh.formatter)
+        log.listener.handlers = (slow_h,)
+        fh.close()
+    return log
+
+
+async def burst(n: int, logger: logging.Logger):
+    hist = Histogram("log_call_seconds", "", [], buckets=[1e-6 * 2 ** i for i in range(24)])
+    samples = []
+
+    async def handler(i: int) -> None:
+        t0 = time.perf_counter()
+        logger.info("[广告点击] user=%s, ad=%s, label=%s", i, "ad_001", "ad_contact_ad_001",
+                    extra={"event": "click", "user_id": i, "ad_id": "ad_001"})
+        logger.info("[START] %s %s (%s)", i, "用户", None, extra={"event": "start", "user_id": i})
+        dt = time.perf_counter() - t0
+        samples.append(dt)
+        hist.observe(dt)
+        await asyncio.sleep(0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(handler(i) for i in range(n)))
+    total = time.perf_counter() - t0
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)], samples[-1], total
+
+
+async def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    logger = logging.getLogger("bench")
+    print(f"{'config':<28}{'p50 µs':>9}{'p99 µs':>9}{'max µs':>10}{'burst ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [
+            ("sync FileHandler", lambda p: sync_setup(p, False)),
+            ("queued", lambda p: queued_setup(p, False)),
+            ("queued + sample 1%", lambda p: queued_setup(p, False, "click=0.01,start=0.01")),
+            ("sync FileHandler, slow disk", lambda p: sync_setup(p, True)),
+            ("queued, slow disk", lambda p: queued_setup(p, True)),
+        ]
+        for name, setup in cases:
+            path = os.path.join(tmp, name.replace(" ", "_").replace(",", "") + ".log")
+            log = setup(path)
+            p50, p99, mx, total = await burst(n, logger)
+            t0 = time.perf_counter()
+            if log is not None:
+                log.stop()
+            drain = time.perf_counter() - t0
+            lines = sum(1 for _ in open(path, encoding="utf-8"))
+            print(f"{name:<28}{p50 * 1e6:>9.1f}{p99 * 1e6:>9.1f}{mx * 1e6:>10.1f}{total * 1e3:>10.1f}"
+                  f"   ({lines} lines, drained {drain * 1e3:.0f} ms after burst)")
+        reset_root()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
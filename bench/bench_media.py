@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# 媒体库基准：图片广告群发 N 个会话，每次上传本地文件 vs 媒体库(上传一次，之后用 file_id)
+#
+# 经进程内模拟 Bot API(bench/fake_api.py，统计上传次数/字节)用真实的 aiogram Bot 发送，8 个并发。
+# 另做正确性检查：同内容不同文件名只上传一次、并发登记同一文件合并为一次上传、
+# 相册按 send_media_group 发送、Telegram 图片按 file_unique_id 去重。
+#
+# 运行：python bench/bench_media.py [N 个会话，默认 1000] [--kb 图片大小 KB，默认 300] [--latency ms，默认 5]
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import FSInputFile, InputMediaPhoto  # noqa: E402
+
+from fake_api import FakeBotAPI  # noqa: E402
+from navbot.dbpool import SQLitePool  # noqa: E402
+from navbot.media_library import MediaLibrary  # noqa: E402
+
+STORAGE_CHAT = -100999
+
+
+async def fan_out(n: int, send) -> float:
+    sem = asyncio.Semaphore(8)
+
+    async def one(i: int) -> None:
+        async with sem:
+            await send(10_000 + i)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return time.perf_counter() - t0
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("n", nargs="?", type=int, default=1000)
+    ap.add_argument("--kb", type=int, default=300)
+    ap.add_argument("--latency", type=float, default=5.0)
+    args = ap.parse_args()
+
+    api = FakeBotAPI(latency=args.latency / 1000)
+    base = await api.start()
+    bot = Bot("123456:BENCH-token", session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+
+    async def upload(chat_id, path, kind):
+        msg = await bot.send_photo(chat_id, photo=FSInputFile(path))
+        return msg.photo[-1].file_id, msg.photo[-1].file_unique_id
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(5):
+            p = os.path.join(tmp, f"banner{i}.jpg")
+            with open(p, "wb") as f:
+                f.write(bytes([i]) + os.urandom(args.kb * 1024 - 1))
+            paths.append(p)
+        pool = SQLitePool(os.path.join(tmp, "media.db"), size=4)
+        with pool.connection() as c:
+            MediaLibrary.ensure_schema(c)
+            c.commit()
+        lib = MediaLibrary(pool, upload, storage_chat=STORAGE_CHAT)
+
+        # ---- 正确性 ----
+        copy = os.path.join(tmp, "same-content.jpg")
+        with open(paths[0], "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+        results = await asyncio.gather(*(lib.add_file(p) for p in [paths[0]] * 5 + [copy]))
+        assert len({a.id for a, _ in results}) == 1 and sum(up for _, up in results) == 1, results
+        assert api.uploads == 1
+        tg = await lib.add_telegram("AgAC-x", "uniq-1")
+        assert (await lib.add_telegram("AgAC-y", "uniq-1")).id == tg.id
+        ids = [(await lib.add_file(p))[0].id for p in paths[1:]]
+        await lib.set_album("launch", ids)
+        lib._albums.clear()  # 走一次 DB 读取
+        media = await lib.resolve("album:launch")
+        assert media is not None and media.kind == "album" and len(media.file_ids) == 4
+        assert await lib.resolve("media:999999") is None and not await lib.check_ref("AgAC-raw")
+        try:
+            await lib.set_album("bad", [ids[0]])
+            raise AssertionError("1-photo album accepted")
+        except ValueError:
+            pass
+        print("library: ok")
+
+        # ---- 群发 ----
+        print(f"群发 {args.n} 个会话，图片 {args.kb} KB，API 延迟 {args.latency:.0f} ms，并发 8")
+        print(f"{'':<26}{'秒':>8}{'上传次数':>10}{'上传 MB':>10}")
+
+        async def row(name: str, send) -> None:
+            u0, b0 = api.uploads, api.upload_bytes
+            dt = await fan_out(args.n, send)
+            print(f"{name:<26}{dt:>8.2f}{api.uploads - u0:>10}{(api.upload_bytes - b0) / 2 ** 20:>10.1f}")
+
+        await row("每次上传本地文件", lambda chat: bot.send_photo(chat, photo=FSInputFile(paths[0]), caption="ad"))
+
+        async def via_library(chat):
+            asset, _ = await lib.add_file(paths[0])
+            m = await lib.resolve(f"media:{asset.id}")
+            await bot.send_photo(chat, photo=m.file_ids[0], caption="ad")
+        await row("媒体库(每次按内容登记)", via_library)
+
+        async def via_ref(chat):
+            m = await lib.resolve(f"media:{results[0][0].id}")
+            await bot.send_photo(chat, photo=m.file_ids[0], caption="ad")
+        await row("媒体库(群发载荷存引用)", via_ref)
+
+        async def album(chat):
+            m = await lib.resolve("album:launch")
+            await bot.send_media_group(chat, media=[InputMediaPhoto(media=f) for f in m.file_ids])
+        await row("相册 4 张(file_id)", album)
+        print(f"媒体库：{lib.stats()}")
+        pool.close()
+    await bot.session.close()
+    await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
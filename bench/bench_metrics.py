@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# 埋点开销基准：同一批更新(bench_webhook 的固定混合：/start、查询关键词、索引导航回调，
+# 覆盖 on_query_kw 与各导航 handler)在埋点关闭/开启下交替跑几轮，比较吞吐；
+# 同时给出埋点关闭时各轮之间的波动，开销小于波动时不能算作"无开销"，两个数一起看。
+# 另测单次 Histogram.observe 的耗时，最后抓一次 /metrics 输出核对格式。
+#
+# 运行：python bench/bench_metrics.py [更新数] [API 延迟毫秒] [轮数，默认 5]
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH-token")
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="navbot-bench-"), "bench.db"))
+os.environ.setdefault("THROTTLE", "0")  # 少量虚拟用户连续发送，不做防刷限速
+os.environ["METRICS"] = "0"  # 由本脚本按轮次挂/卸中间件
+
+import aiohttp  # noqa: E402
+
+from fake_api import FakeBotAPI  # noqa: E402
+from bench_webhook import run_polling  # noqa: E402
+from navbot.metrics import Histogram, MetricsServer  # noqa: E402
+
+
+def observe_cost(n: int = 200_000) -> float:
+    h = Histogram("x", "x", ["handler"])
+    t0 = time.perf_counter()
+    for i in range(n):
+        h.observe(0.003, "on_query_kw")
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+async def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    api = FakeBotAPI(latency=latency_ms / 1000)
+    os.environ["TELEGRAM_API_URL"] = await api.start()
+    import bot as bot_mod
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    bot_mod.init_db()
+    bot_mod.build_search_index()
+    bot_mod.writer.start()
+    await run_polling(bot_mod, api, 200)  # 预热
+
+    rates = {"off": [], "on": []}
+    for i in range(rounds):
+        for mode in (("off", "on") if i % 2 == 0 else ("on", "off")):  # 交替先后，排除"后跑的一轮更慢"的偏差
+            if mode == "on":
+                bot_mod.metrics.install(bot_mod.dp, bot_mod.bot, bot_mod.pool)
+            t = await run_polling(bot_mod, api, n)
+            if mode == "on":
+                bot_mod.metrics.uninstall()
+            rates[mode].append(n / t)
+    off, on = statistics.median(rates["off"]), statistics.median(rates["on"])
+    print(f"{n} 条更新 × {rounds} 轮，API 延迟 {latency_ms:.1f} ms")
+    print(f"埋点关闭 {off:8.0f} updates/s   {[round(r) for r in rates['off']]}")
+    print(f"埋点开启 {on:8.0f} updates/s   {[round(r) for r in rates['on']]}")
+    spread = (max(rates["off"]) - min(rates["off"])) / off * 100
+    print(f"吞吐变化 {(on - off) / off * 100:+.1f}%，单条更新增加 {(1 / on - 1 / off) * 1e6:+.0f} µs"
+          f"(埋点关闭时轮间波动 ±{spread / 2:.1f}%)")
+    # 与轮间波动无关的估计：开启时每条更新的记录次数 × 单次 observe 耗时(不含中间件调用链本身)
+    m = bot_mod.metrics
+    hists = (m.update_seconds, m.handler_seconds, m.api_seconds, m.sql_seconds)
+    per_update = sum(h.count(*k) for h in hists for k in h.labelsets()) / (n * rounds)
+    cost = observe_cost()
+    print(f"Histogram.observe 单次 {cost:.0f} ns；每条更新记录 {per_update:.1f} 次，约 {per_update * cost / 1000:.0f} µs")
+
+    server = MetricsServer(bot_mod.metrics)
+    await server.start("127.0.0.1", 19108)
+    async with aiohttp.ClientSession() as http:
+        async with http.get("http://127.0.0.1:19108/metrics") as r:
+            body = await r.text()
+    await server.stop()
+    lines = [ln for ln in body.splitlines() if not ln.startswith("#")]
+    print(f"/metrics: {len(lines)} 个样本，例如：")
+    for key in ("navbot_updates_total", 'navbot_handler_seconds_count{handler="on_query_kw"}',
+                'navbot_tg_api_seconds_count{method="sendMessage"}', "navbot_sqlite_query_seconds_count",
+                'navbot_section_seconds_count{name="swap_view"}'):
+        print("  " + next((ln for ln in lines if ln.startswith(key)), key + " (none)"))
+    ms = bot_mod.metrics.summary()
+    print("最慢 handler(p95)：", [(h, c, round(p * 1000, 2)) for h, c, p in ms["slowest"]])
+
+    await bot_mod.writer.stop()
+    await bot_mod.bot.session.close()
+    bot_mod.pool.close()
+    await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
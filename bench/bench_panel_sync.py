@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# 频道面板同步基准：逐个串行 edit_message_text(旧 /update_panel) vs PanelSync(哈希比对 + 并发)
+#
+# N 个面板，经进程内模拟 Bot API(bench/fake_api.py)用真实的 aiogram Bot 编辑，令牌桶 25 条/秒(与群发默认一致)。
+# 场景：全部首次同步、内容未变再同步、设置改动后同步、后台 sync_if_changed 空转。
+# 另做正确性检查："message is not modified" 视为已同步、消息被删记为 missing 且保持待同步、
+# 指定 chat 同步、同步期间重新发布的面板不被旧结果覆盖。
+#
+# 运行：python bench/bench_panel_sync.py [N 个面板，默认 50] [--latency ms，默认 50]
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web  # noqa: E402
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.exceptions import TelegramBadRequest  # noqa: E402
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+
+from fake_api import FakeBotAPI  # noqa: E402
+from navbot.dbpool import SQLitePool  # noqa: E402
+from navbot.panel_sync import PanelSync  # noqa: E402
+from navbot.ratelimit import TokenBucket  # noqa: E402
+
+MISSING_CHAT = -100777
+NOT_MODIFIED_CHAT = -100778
+ERROR_CHAT = -100779  # 非终态失败(未归类的 400)
+
+
+class PanelAPI(FakeBotAPI):
+    async def respond(self, method, params):
+        chat = int(params.get("chat_id") or 0)
+        if method.lower() == "editmessagetext" and chat in (MISSING_CHAT, NOT_MODIFIED_CHAT, ERROR_CHAT):
+            what = {MISSING_CHAT: "message to edit not found", NOT_MODIFIED_CHAT: "message is not modified",
+                    ERROR_CHAT: "something went wrong"}[chat]
+            return web.json_response({"ok": False, "error_code": 400, "description": f"Bad Request: {what}"},
+                                     status=400)
+        return await super().respond(method, params)
+
+
+def edits(api: FakeBotAPI) -> int:
+    return api.calls["editMessageText"]
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("n", nargs="?", type=int, default=50)
+    ap.add_argument("--latency", type=float, default=50.0)
+    args = ap.parse_args()
+
+    api = PanelAPI(latency=args.latency / 1000)
+    bot = Bot("123456:BENCH-token", session=AiohttpSession(api=TelegramAPIServer.from_base(await api.start())))
+    content = {"text": "<b>频道导航中心</b>", "rev": 0}
+
+    def render():
+        kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=f"入口 {content['rev']}", url="https://t.me")]])
+        return content["text"], kb
+
+    async def edit(chat_id, message_id, text, kb):
+        await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=kb)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = SQLitePool(os.path.join(tmp, "panels.db"), size=4)
+        with pool.connection() as c:
+            c.execute("""CREATE TABLE panels(chat_id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL,
+                         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP)""")
+            PanelSync.ensure_schema(c)
+            PanelSync.ensure_schema(c)  # 重复执行无副作用
+            c.commit()
+        ps = PanelSync(pool, render, edit, bucket=TokenBucket(25.0, capacity=25), concurrency=8)
+
+        # ---- 正确性 ----
+        await pool.executemany("INSERT INTO panels(chat_id, message_id) VALUES(?,?)",
+                               [(MISSING_CHAT, 1), (NOT_MODIFIED_CHAT, 2)])
+        r = await ps.sync()
+        assert (r["total"], r["edited"], r["failed"]) == (2, 1, 1), r
+        st = {x["chat_id"]: x for x in await ps.status()}
+        assert st[MISSING_CHAT]["sync_status"] == "missing" and st[MISSING_CHAT]["content_hash"] == r["hash"]
+        assert st[NOT_MODIFIED_CHAT]["sync_status"] == "ok" and st[NOT_MODIFIED_CHAT]["content_hash"] == r["hash"]
+        e0 = edits(api)
+        for _ in range(5):  # 终态失败记了哈希：后台循环不再对死面板调 API
+            assert await ps.sync_if_changed() is None
+        assert (await ps.sync([MISSING_CHAT]))["edited"] == 0 and edits(api) == e0
+        assert (await ps.sync([NOT_MODIFIED_CHAT], force=True))["edited"] == 1  # /update_panel 指定目标
+        await ps.invalidate(NOT_MODIFIED_CHAT, 2)  # 面板被 swap_view 原地编辑过
+        st = {x["chat_id"]: x for x in await ps.status()}
+        assert st[NOT_MODIFIED_CHAT]["sync_status"] == "stale" and st[NOT_MODIFIED_CHAT]["content_hash"] is None
+        r = await ps.sync_if_changed()  # 后台循环下一轮恢复它，死面板仍跳过
+        assert r is not None and (r["edited"], r["failed"]) == (1, 0), r
+        await ps.invalidate(-1, 1)  # 不是面板消息：不触发同步
+        assert await ps.sync_if_changed() is None
+        await pool.execute("INSERT INTO panels(chat_id, message_id) VALUES(?,?)", (ERROR_CHAT, 3))
+        content["rev"] += 1
+        r = await ps.sync_if_changed()
+        assert r["failed"] == 2, r  # 内容变了：死面板再试一次
+        assert ps._last_hash != r["hash"]  # 有临时失败：不记哈希，下一轮重试
+        e0 = edits(api)
+        assert (await ps.sync_if_changed())["failed"] == 1 and edits(api) == e0 + 1  # 只重试 ERROR_CHAT
+        await pool.execute("DELETE FROM panels WHERE chat_id IN (?,?,?)", (MISSING_CHAT, NOT_MODIFIED_CHAT, ERROR_CHAT))
+        await pool.executemany("INSERT INTO panels(chat_id, message_id) VALUES(?,?)",
+                               [(-1001000000000 - i, 10 + i) for i in range(args.n)])
+        print("panel sync: ok")
+
+        # ---- 性能 ----
+        print(f"{args.n} 个面板，API 延迟 {args.latency:.0f} ms，令牌桶 25 条/秒")
+        print(f"{'':<28}{'秒':>8}{'editMessageText':>17}")
+
+        async def row(name, fn):
+            e0 = edits(api)
+            t0 = time.perf_counter()
+            await fn()
+            print(f"{name:<28}{time.perf_counter() - t0:>8.2f}{edits(api) - e0:>17}")
+
+        async def serial_all():
+            text, kb = render()
+            for r in await pool.fetchall("SELECT chat_id, message_id FROM panels"):
+                try:
+                    await edit(r["chat_id"], r["message_id"], text, kb)
+                except TelegramBadRequest:
+                    pass
+
+        await row("旧：逐个串行编辑全部", serial_all)
+        await row("PanelSync 首次(无哈希)", ps.sync)
+        await row("PanelSync 内容未变", ps.sync)
+        await row("sync_if_changed 内容未变", ps.sync_if_changed)
+        content["rev"] += 1
+        await row("设置改动后 sync_if_changed", ps.sync_if_changed)
+
+        # 同步期间重新发布的面板(message_id 变了)不会被本轮结果覆盖
+        content["rev"] += 1
+        first = (await ps.status())[0]
+        e0 = edits(api)
+        task = asyncio.create_task(ps.sync())
+        while edits(api) == e0:  # 本轮已读出面板列表并开始编辑
+            await asyncio.sleep(0.001)
+        await pool.execute("UPDATE panels SET message_id=999999, content_hash='fresh' WHERE chat_id=?", (first["chat_id"],))
+        await task
+        assert (await ps.status())[0]["content_hash"] == "fresh"
+        print(f"stats: {ps.stats()}")
+        pool.close()
+    await bot.session.close()
+    await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
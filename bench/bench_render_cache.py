@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# 视图渲染缓存基准：swap_view 的 editMessageText 调用次数，无缓存 vs RenderCache
+#
+# 经 dp.feed_update 把回调更新投给 bot.py(进程内模拟 Bot API，bench/fake_api.py)。每个用户有一条固定的菜单消息：
+# - 导航：按真实习惯连点(同一按钮点两次、"返回首页"点三次)，用户之间并发、用户内串行
+# - 连击：同一条消息上同时到达 4 个不同按钮的回调(网络抖动后集中送达)，合并后只应发首个和最新的编辑
+# 另测摘要开销(键盘对象命中/未命中)。
+#
+# 运行：python bench/bench_render_cache.py [--users 50] [--rounds 10] [--latency 20]
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import itertools
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH-token")
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="navbot-bench-"), "bench.db"))
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault("THROTTLE", "0")  # 少量虚拟用户连续发送，不做防刷限速
+
+from fake_api import FakeBotAPI, user  # noqa: E402
+from navbot.render_cache import RenderCache  # noqa: E402
+
+TAPS = ["idx_home", "idx_home", "idx_range:AG", "idx_range:AG", "idx:AG:B", "go_home", "go_home", "go_home",
+        "big_bank_list", "big_bank_list", "go_home"]
+BURST = ["idx_home", "big_bank_list", "idx_range:HZ", "go_home"]
+_ids = itertools.count(1)
+
+
+class NoCache(RenderCache):
+    """对照组：每次都编辑。"""
+
+    async def submit(self, key, digest, edit):
+        self.edits += 1
+        await edit()
+        return "sent"
+
+
+def tap(uid: int, msg_id: int, data: str) -> dict:
+    msg = {"message_id": msg_id, "date": int(time.time()), "chat": {"id": uid, "type": "private"},
+           "from": {"id": 1, "is_bot": True, "first_name": "bot"}, "text": "menu"}
+    return {"update_id": next(_ids), "callback_query": {"id": str(next(_ids)), "from": user(uid),
+                                                        "chat_instance": str(uid), "message": msg, "data": data}}
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--rounds", type=int, default=10)
+    ap.add_argument("--latency", type=float, default=20.0)
+    args = ap.parse_args()
+
+    api = FakeBotAPI(latency=args.latency / 1000)
+    os.environ["TELEGRAM_API_URL"] = await api.start()
+    import bot as bot_mod
+    from aiogram.types import Update
+    logging.getLogger().setLevel(logging.CRITICAL)
+    bot_mod.init_db()
+
+    async def feed(raw: dict) -> None:
+        await bot_mod.dp.feed_update(bot_mod.bot, Update.model_validate(raw, context={"bot": bot_mod.bot}))
+
+    async def scenario(cache: RenderCache, name: str) -> None:
+        bot_mod.render_cache = cache
+        e0 = api.calls["editMessageText"]
+        t0 = time.perf_counter()
+
+        async def nav(uid: int) -> None:
+            msg_id = 1000 + uid
+            for _ in range(args.rounds):
+                for data in TAPS:
+                    await feed(tap(uid, msg_id, data))
+        await asyncio.gather(*(nav(50_000 + u) for u in range(args.users)))
+        nav_edits, nav_s = api.calls["editMessageText"] - e0, time.perf_counter() - t0
+
+        e0 = api.calls["editMessageText"]
+        for r in range(args.rounds):
+            await asyncio.gather(*(feed(tap(60_000 + u, 9000 + r, d)) for u in range(args.users) for d in BURST))
+        burst_edits = api.calls["editMessageText"] - e0
+        total = args.users * args.rounds
+        print(f"{name:<14}{nav_edits:>10}/{total * len(TAPS):<8}{nav_s:>8.2f}{burst_edits:>10}/{total * len(BURST):<8}"
+              f"  {cache.stats()}")
+
+    print(f"{args.users} 个用户 × {args.rounds} 轮，API 延迟 {args.latency:.0f} ms")
+    print(f"{'':<14}{'导航 编辑/点击':>18}{'秒':>8}{'连击 编辑/点击':>18}")
+    await scenario(NoCache(), "无缓存")
+    await scenario(RenderCache(), "RenderCache")
+
+    # 摘要开销
+    rc = RenderCache()
+    kb = bot_mod.main_menu()
+    n = 20000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        rc.digest(bot_mod.WELCOME_TEXT, kb)
+    hit = (time.perf_counter() - t0) / n * 1e6
+    t0 = time.perf_counter()
+    for _ in range(n // 10):
+        rc._kb.clear()
+        rc.digest(bot_mod.WELCOME_TEXT, kb)
+    miss = (time.perf_counter() - t0) / (n // 10) * 1e6
+    print(f"摘要：键盘命中 {hit:.2f} µs，未命中(序列化键盘) {miss:.1f} µs")
+
+    await bot_mod.bot.session.close()
+    await api.stop()
+    bot_mod.pool.close()
+    bot_mod.log_setup.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
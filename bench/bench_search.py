@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# 查询索引基准：合成 1k~100k 条目录，验证查询耗时不随目录规模线性增长
+#
+# 运行：python bench/bench_search.py
+
+import os
+import sys
+import time
+import random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from navbot.search_index import SearchIndex, fold  # noqa: E402
+
+PROVINCES = ["北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林", "江苏", "浙江", "安徽", "福建",
+             "江西", "山东", "河南", "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西", "甘肃",
+             "青海", "广西", "宁夏", "新疆", "内蒙古", "黑龙江"]
+KINDS = ["银行", "农商", "农信", "村镇银行", "商业银行", "农村信用社"]
+# GB2312 一级字库(3755 字)，模拟真实地名的字符分布
+HANZI = [bytes([hi, lo]).decode("gb2312") for hi in range(0xB0, 0xD8) for lo in range(0xA1, 0xFF)
+         if not (hi == 0xD7 and lo > 0xF9)]
+
+
+def synthetic(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    names = set()
+    while len(names) < n:
+        city = "".join(rnd.choice(HANZI) for _ in range(2))
+        names.add(rnd.choice(PROVINCES) + city + rnd.choice(KINDS))
+    return sorted(names)
+
+
+def bench(size: int, rounds: int = 2000) -> None:
+    names = synthetic(size)
+    t0 = time.perf_counter()
+    idx = SearchIndex()
+    for n in names:
+        idx.add(n, ("az", ""))
+    build_ms = (time.perf_counter() - t0) * 1000
+    rnd = random.Random(size)
+    # 真实查询形态：城市/机构名片段(3~5 字)与完整名称各半
+    queries = []
+    for _ in range(rounds // 2):
+        key = fold(rnd.choice(names))
+        start = rnd.randint(0, max(0, len(key) - 3))
+        queries.append(key[start:start + rnd.randint(3, 5)])
+    queries += [rnd.choice(names) for _ in range(rounds // 2)]
+    t0 = time.perf_counter()
+    for q in queries:
+        idx.search(q, limit=20)
+    per_q = (time.perf_counter() - t0) / len(queries) * 1e6
+    # 对照：原实现的线性扫描
+    t0 = time.perf_counter()
+    for q in queries[:200]:
+        qs = q.lower().replace("银行", "")
+        sorted({x for x in names if qs in x.lower().replace("银行", "")})
+    linear = (time.perf_counter() - t0) / 200 * 1e6
+    print(f"{size:>7} entries  build {build_ms:8.1f} ms  indexed {per_q:8.1f} µs/q  linear scan {linear:9.1f} µs/q")
+
+
+def main() -> None:
+    for size in (1000, 10000, 50000, 100000):
+        bench(size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# 冷启动基准：进程启动 → 处理完第一条更新(time-to-first-update)
+#
+# 每轮起一个子进程：进程内启动模拟 Bot API(bench/fake_api.py，可设每次调用延迟)，
+# 导入 bot.py、运行 main()(轮询模式)，预先放入一条 /start，记录各时间点后停止轮询。
+# 第 1 轮在空库上(首次部署)，之后各轮复用同一个库(滚动重启)。库里预先灌入 --ads 条广告、
+# --queries 条查询日志，体现启动时与数据量相关的工作。
+#
+# 运行：python bench/bench_startup.py [--repo 其他检出目录] [--runs 5] [--latency 50] [--ads 200000]
+# 对比改动前后：git worktree add /tmp/prev HEAD~1 && python bench/bench_startup.py --repo /tmp/prev
+# (导入 aiogram 约占数秒且与本仓库无关，比较时看 Δpolling / Δfirst 两列)
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+T_START = time.perf_counter()
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def child(args: argparse.Namespace) -> None:
+    """以 `python bot.py` 的方式运行(runpy，__name__ == "__main__")，测到的就是线上的启动路径。"""
+    import asyncio
+    import runpy
+    import threading
+    sys.path.insert(0, HERE)
+    from fake_api import FakeBotAPI, message_update
+    from aiogram import Dispatcher
+
+    # 模拟 API 跑在独立线程的事件循环里，bot.py 自己 asyncio.run()
+    api = FakeBotAPI(latency=args.latency / 1000)
+    api_loop = asyncio.new_event_loop()
+    threading.Thread(target=api_loop.run_forever, daemon=True).start()
+    base_url = asyncio.run_coroutine_threadsafe(api.start(), api_loop).result()
+    api_loop.call_soon_threadsafe(api.push_updates, [message_update(42, "/start")])
+    os.environ.update({
+        "TELEGRAM_API_URL": base_url, "BOT_TOKEN": "123456:BENCH-token", "DB_FILE": args.db,
+        "METRICS_PORT": "0", "LOG_FILE": "", "LOG_LEVEL": "WARNING",
+    })
+
+    marks = {"aiogram": time.perf_counter()}
+    orig = Dispatcher.start_polling
+
+    async def start_polling(self, *bots, **kw):
+        marks["polling"] = time.perf_counter()
+
+        async def spy(handler, event, data):
+            try:
+                return await handler(event, data)
+            finally:
+                if "first" not in marks:
+                    marks["first"] = time.perf_counter()
+                    asyncio.get_running_loop().create_task(self.stop_polling())
+        self.update.outer_middleware(spy)
+        kw["handle_signals"] = False
+        return await orig(self, *bots, **kw)
+    Dispatcher.start_polling = start_polling
+
+    sys.path.insert(0, args.repo)
+    runpy.run_path(os.path.join(args.repo, "bot.py"), run_name="__main__")
+    asyncio.run_coroutine_threadsafe(api.stop(), api_loop).result()
+    print(json.dumps({
+        "aiogram_s": marks["aiogram"] - T_START,
+        "polling_s": marks["polling"] - T_START,
+        "ttfu_s": marks["first"] - T_START,
+        "api_calls": {k: v for k, v in api.calls.items() if k.lower() != "getupdates"},
+    }))
+
+
+def seed_rows(db: str, ads: int, queries: int) -> None:
+    c = sqlite3.connect(db)
+    c.executemany("INSERT INTO ads(title, caption, category_id, active) VALUES(?,?,?,1)",
+                  ((f"ad {i}", "x" * 50, i % 3 + 1) for i in range(ads)))
+    c.executemany("INSERT INTO query_log(user_id, keyword, created_at) VALUES(?,?,datetime('now'))",
+                  ((i % 5000, f"kw{i % 300}") for i in range(queries)))
+    c.commit()
+    c.close()
+
+
+def run_once(args: argparse.Namespace, db: str, cwd: str) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--repo", args.repo, "--db", db,
+           "--latency", str(args.latency)]
+    out = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, timeout=180)
+    lines = [ln for ln in out.stdout.splitlines() if ln.startswith("{")]
+    if out.returncode or not lines:
+        raise SystemExit(f"child failed:\n{out.stdout}\n{out.stderr}")
+    return json.loads(lines[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repo", default=os.path.dirname(HERE))
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--latency", type=float, default=50.0, help="每次 Bot API 调用的模拟延迟(ms)")
+    ap.add_argument("--ads", type=int, default=200000)
+    ap.add_argument("--queries", type=int, default=200000)
+    ap.add_argument("--child", action="store_true")
+    ap.add_argument("--db")
+    args = ap.parse_args()
+    args.repo = os.path.abspath(args.repo)
+    if args.child:
+        child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.db")
+        first = run_once(args, db, tmp)
+        seed_rows(db, args.ads, args.queries)
+        runs = [run_once(args, db, tmp) for _ in range(args.runs)]
+    print(f"repo: {args.repo}  (API 延迟 {args.latency:.0f} ms，{args.ads} 条广告 / {args.queries} 条查询日志)")
+    print("时间均从子进程开始计：导入 aiogram 之后 → 开始轮询 → 处理完第一条更新")
+    print(f"{'':<20}{'aiogram ms':>12}{'polling ms':>12}{'first update ms':>17}{'Δpolling':>10}{'Δfirst':>10}")
+    for r in [first] + runs:
+        r["d_polling"] = r["polling_s"] - r["aiogram_s"]
+        r["d_ttfu"] = r["ttfu_s"] - r["aiogram_s"]
+    med = {k: statistics.median(r[k] for r in runs)
+           for k in ("aiogram_s", "polling_s", "ttfu_s", "d_polling", "d_ttfu")}
+    for name, r in (("首次部署(空库)", first), (f"重启(中位数/{len(runs)}轮)", med)):
+        print(f"{name:<20}{r['aiogram_s'] * 1e3:>12.0f}{r['polling_s'] * 1e3:>12.0f}{r['ttfu_s'] * 1e3:>17.0f}"
+              f"{r['d_polling'] * 1e3:>10.0f}{r['d_ttfu'] * 1e3:>10.0f}")
+    print(f"重启期间 Bot API 调用：{runs[-1]['api_calls']}")
+
+
+if __name__ == "__main__":
+    main()
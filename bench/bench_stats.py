@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# /stats 基准：全表 COUNT/GROUP BY(原实现) vs 预聚合汇总表
+#
+# 向临时库按 write-behind 的批量方式写入 N 条 query_log(分布在最近 60 天)，
+# 分别测量写入吞吐(含触发器)、两种 /stats 查询耗时，以及 backfill 重建耗时并校验与触发器结果一致。
+#
+# 运行：python bench/bench_stats.py [查询日志条数，可多次给出做对比，如 100000 1000000]
+
+import os
+import sys
+import time
+import random
+import asyncio
+import datetime
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH-token")
+
+from navbot.dbpool import SQLitePool  # noqa: E402
+from navbot.rollups import StatsRollups  # noqa: E402
+
+KEYWORDS = ["工商银行", "招行", "建设银行", "农业银行", "中国银行", "交通银行", "邮储", "浦发", "中信", "民生"]
+BATCH = 500
+
+
+def schema(pool: SQLitePool) -> None:
+    with pool.connection() as c:
+        c.execute("CREATE TABLE IF NOT EXISTS user_meta(user_id INTEGER PRIMARY KEY, username TEXT, first_seen DATETIME)")
+        c.execute("""CREATE TABLE IF NOT EXISTS query_log(id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
+                     keyword TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)""")
+        StatsRollups.ensure_schema(c)
+        c.commit()
+
+
+def seed(pool: SQLitePool, n: int) -> float:
+    rnd = random.Random(7)
+    now = datetime.datetime.now()
+    users = max(1000, n // 50)
+    t0 = time.perf_counter()
+    with pool.connection() as c:
+        c.executemany("INSERT OR IGNORE INTO user_meta(user_id, username, first_seen) VALUES(?,?,?)",
+                      ((u, f"u{u}", now - datetime.timedelta(minutes=rnd.randrange(60 * 24 * 60))) for u in range(users)))
+        c.commit()
+        for start in range(0, n, BATCH):
+            rows = [(rnd.randrange(users), rnd.choice(KEYWORDS),
+                     now - datetime.timedelta(seconds=rnd.randrange(86400 * 60)))
+                    for _ in range(min(BATCH, n - start))]
+            c.executemany("INSERT INTO query_log(user_id, keyword, created_at) VALUES(?,?,?)", rows)
+            c.commit()
+    return n / (time.perf_counter() - t0)
+
+
+def legacy_stats(pool: SQLitePool) -> None:
+    with pool.connection() as c:
+        c.execute("SELECT COUNT(*) FROM user_meta").fetchone()
+        c.execute("SELECT COUNT(*) FROM query_log").fetchone()
+        c.execute("SELECT DATE(created_at) d, COUNT(*) c FROM query_log WHERE created_at>=DATE('now','-6 day') "
+                  "GROUP BY d ORDER BY d").fetchall()
+
+
+def snapshot(pool: SQLitePool):
+    with pool.connection() as c:
+        return [c.execute(f"SELECT * FROM {t} ORDER BY 1, 2").fetchall()
+                for t in ("stats_daily", "stats_hourly", "stats_daily_keywords")]
+
+
+async def run(n: int) -> None:
+    path = os.path.join(tempfile.mkdtemp(prefix="navbot-bench-"), "stats.db")
+    pool = SQLitePool(path, size=2)
+    schema(pool)
+    rollups = StatsRollups(pool, keep_user_days=60)  # 保留全部去重记录，便于与回填结果逐行比对
+    rate = seed(pool, n)
+
+    t0 = time.perf_counter()
+    legacy_stats(pool)
+    legacy_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    reps = 20
+    for _ in range(reps):
+        await rollups.summary(days=7)
+    rollup_ms = (time.perf_counter() - t0) * 1000 / reps
+
+    before = snapshot(pool)
+    r = await rollups.backfill()
+    same = [list(map(tuple, a)) == list(map(tuple, b)) for a, b in zip(before, snapshot(pool))]
+    print(f"{n:>10}{rate:>14.0f}{legacy_ms:>14.1f}{rollup_ms:>14.2f}{r['seconds']:>14.1f}   {'ok' if all(same) else same}")
+    pool.close()
+
+
+async def main() -> None:
+    sizes = [int(a) for a in sys.argv[1:]] or [100_000, 1_000_000]
+    print(f"{'rows':>10}{'insert rows/s':>14}{'legacy ms':>14}{'rollup ms':>14}{'backfill s':>14}   backfill==triggers")
+    for n in sizes:
+        await run(n)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# 防刷限速基准：navbot/throttle.py
+#
+# 1) 正确性：突发额度、每段只提示一次、按速率回补、类别互不影响、exempt、LRU 上限
+# 2) 内存：100 万个不同用户依次各点一次，有界 Throttle vs 朴素 dict[(uid, 类别)] -> [tokens, stamp]
+# 3) 单次 hit() 耗时
+# 4) 经 dp.feed_update 投给 bot.py(进程内模拟 Bot API)：1 个刷子连发回调/查询 + 正常用户，
+#    比较不限速/限速下的 API 调用数、写入 query_log 的行数，以及正常用户的处理耗时
+#
+# 运行：python bench/bench_throttle.py [--users 1000000] [--spam 300] [--latency 5]
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH-token")
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="navbot-bench-"), "bench.db"))
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("LOG_FILE", "")
+os.environ["THROTTLE"] = "0"  # 由本脚本按轮次挂/卸中间件
+
+from fake_api import FakeBotAPI, callback_update, message_update  # noqa: E402
+from navbot.dbpool import LatencyWindow  # noqa: E402
+from navbot.throttle import DROP, NOTIFY, PASS, Rule, Throttle, parse_rules  # noqa: E402
+
+ABUSER = 66_666
+
+
+def check() -> None:
+    t = Throttle({"callback": Rule(20.0, 3), "query": Rule(1.0, 2)}, maxsize=4, exempt=lambda uid: uid == 7)
+    assert [t.hit(1, "callback") for _ in range(5)] == [PASS, PASS, PASS, NOTIFY, DROP]
+    assert t.hit(1, "query") == PASS                       # 类别互不影响
+    assert t.hit(1, "start") == PASS                       # 没有规则的类别不限速
+    time.sleep(0.06)                                       # 20/s 回补 1 个多令牌
+    assert t.hit(1, "callback") == PASS and t.hit(1, "callback") == NOTIFY  # 新的一段，重新提示一次
+    for uid in range(100, 110):
+        t.hit(uid, "callback")
+    assert len(t._buckets) == 4 and t.evicted > 0          # LRU 上限
+    r = parse_rules("query=2:8, callback=0, bad, start=x:1")
+    assert r["query"] == Rule(2.0, 8.0) and "callback" not in r and r["start"] == Rule(0.2, 3)
+    print("throttle: ok")
+
+
+def memory(n: int) -> None:
+    def run(fn) -> tuple:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return dt, peak
+
+    naive: dict = {}
+
+    def naive_fill() -> None:
+        now = time.monotonic()
+        for uid in range(n):
+            naive[(uid, "callback")] = [9.0, now]
+
+    t = Throttle(maxsize=100_000)
+
+    def bounded_fill() -> None:
+        for uid in range(n):
+            t.hit(uid, "callback")
+
+    print(f"\n{n} 个不同用户各点一次回调")
+    print(f"{'':<34}{'秒':>8}{'峰值 MB':>10}{'条目':>10}")
+    dt, peak = run(naive_fill)
+    print(f"{'朴素 dict[(uid, 类别)]':<34}{dt:>8.2f}{peak / 2 ** 20:>10.1f}{len(naive):>10}")
+    naive.clear()
+    dt, peak = run(bounded_fill)
+    print(f"{'Throttle(maxsize=100000)':<34}{dt:>8.2f}{peak / 2 ** 20:>10.1f}{len(t._buckets):>10}")
+
+    t = Throttle()
+    n = 200_000
+    t.hit(1, "callback")
+    t0 = time.perf_counter()
+    for _ in range(n):
+        t.hit(1, "callback")
+    print(f"hit() 单用户：{(time.perf_counter() - t0) / n * 1e9:.0f} ns/次")
+
+
+async def integration(spam: int, latency: float) -> None:
+    api = FakeBotAPI(latency=latency / 1000)
+    os.environ["TELEGRAM_API_URL"] = await api.start()
+    import bot as bot_mod
+    from aiogram.types import Update
+    logging.getLogger().setLevel(logging.CRITICAL)
+    bot_mod.init_db()
+    bot_mod.build_search_index()
+    bot_mod.writer.start()
+    kw = next(iter(bot_mod.BANK_DETAIL), "中国银行")
+
+    async def feed(raw: dict, lat: LatencyWindow = None) -> None:
+        t0 = time.perf_counter()
+        await bot_mod.dp.feed_update(bot_mod.bot, Update.model_validate(raw, context={"bot": bot_mod.bot}))
+        if lat is not None:
+            lat.add(time.perf_counter() - t0)
+
+    async def abuser() -> None:
+        for i in range(spam):
+            await feed(callback_update(ABUSER, "idx_home") if i % 2 else message_update(ABUSER, f"查询 {kw}"))
+            await asyncio.sleep(0)  # 真实更新经轮询/webhook 到达，之间总会让出事件循环
+
+    async def normal(uid: int, lat: LatencyWindow) -> None:
+        for payload in ("/start", f"查询 {kw}"):
+            await feed(message_update(uid, payload), lat)
+            await asyncio.sleep(0.05)
+        for data in ("idx_home", "go_home"):
+            await feed(callback_update(uid, data), lat)
+            await asyncio.sleep(0.05)
+
+    print(f"\n刷子连发 {spam} 次(查询/回调交替) + 50 个正常用户，API 延迟 {latency:.0f} ms")
+    print(f"{'':<12}{'API 调用':>10}{'查询日志行':>10}{'正常用户 p50/p99 ms':>24}")
+
+    async def logged() -> int:
+        await bot_mod.writer.stop()  # stop 会 flush
+        bot_mod.writer.start()
+        return (await bot_mod.pool.fetchone("SELECT COUNT(*) AS n FROM query_log"))["n"]
+
+    for mode in ("不限速", "限速") * 2:
+        if mode == "限速":
+            bot_mod.throttle.install(bot_mod.dp)
+        await feed(message_update(1, "/start"))  # 预热
+        calls0, q0 = sum(api.calls.values()), await logged()
+        lat = LatencyWindow()
+        await asyncio.gather(abuser(), *(normal(30_000 + i, lat) for i in range(50)))
+        s = lat.summary()
+        print(f"{mode:<12}{sum(api.calls.values()) - calls0:>10}{await logged() - q0:>10}"
+              f"{s['p50_ms']:>12.1f}/{s['p99_ms']:<11.1f}")
+        bot_mod.throttle.uninstall()
+        bot_mod.throttle._buckets.clear()
+    print(f"限速统计：{bot_mod.throttle.stats()}")
+    await bot_mod.writer.stop()
+    await bot_mod.bot.session.close()
+    await api.stop()
+    bot_mod.pool.close()
+    bot_mod.log_setup.stop()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1_000_000)
+    ap.add_argument("--spam", type=int, default=300)
+    ap.add_argument("--latency", type=float, default=5.0)
+    args = ap.parse_args()
+    check()
+    memory(args.users)
+    asyncio.run(integration(args.spam, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# 更新吞吐对比：长轮询(getUpdates) vs webhook(aiohttp + worker 池)
+#
+# 两种模式都连到进程内的模拟 Bot API(bench/fake_api.py)，每次 API 调用注入固定延迟，
+# 统计处理完 N 条更新所需时间，输出 updates/s。
+#
+# 运行：python bench/bench_webhook.py [更新数] [API 延迟毫秒] [webhook worker 数]
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH-token")
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="navbot-bench-"), "bench.db"))
+os.environ.setdefault("THROTTLE", "0")  # 少量虚拟用户连续发送，不做防刷限速
+
+import aiohttp  # noqa: E402
+
+from fake_api import FakeBotAPI, callback_update, message_update  # noqa: E402
+
+# 与 bot.py 真实的命令/查询/callback_data 一致，每条更新都走到 handler(与 bench/loadtest.py 的导航会话相同)
+TEXTS = ["/start", "查询 工商银行", "查询 招行", "查询 不存在的银行"]
+CALLBACKS = ["idx_home", "big_bank_list", "bank:工商银行", "idx_range:AG", "idx:AG:G", "go_home"]
+
+
+def make_updates(n: int):
+    out = []
+    for i in range(n):
+        uid = 10_000 + i % 500
+        if i % 2:
+            out.append(callback_update(uid, CALLBACKS[i % len(CALLBACKS)]))
+        else:
+            out.append(message_update(uid, TEXTS[i % len(TEXTS)]))
+    return out
+
+
+class Counter:
+    """dp.update 外层中间件：统计处理完成的更新数，达到目标时置位事件。"""
+
+    def __init__(self, target: int):
+        self.target = target
+        self.done = 0
+        self.finished = asyncio.Event()
+
+    async def __call__(self, handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            self.done += 1
+            if self.done >= self.target:
+                self.finished.set()
+
+
+async def run_polling(bot_mod, api: FakeBotAPI, n: int) -> float:
+    counter = Counter(n)
+    bot_mod.dp.update.outer_middleware(counter)
+    api.push_updates(make_updates(n))
+    t0 = time.perf_counter()
+    task = asyncio.create_task(bot_mod.dp.start_polling(bot_mod.bot, handle_signals=False, polling_timeout=1))
+    await counter.finished.wait()
+    elapsed = time.perf_counter() - t0
+    await bot_mod.dp.stop_polling()
+    await task
+    bot_mod.dp.update.outer_middleware._middlewares.remove(counter)  # type: ignore[attr-defined]
+    return elapsed
+
+
+async def run_webhook(bot_mod, n: int, workers: int) -> float:
+    from navbot.webhook import WebhookServer
+
+    counter = Counter(n)
+    bot_mod.dp.update.outer_middleware(counter)
+    server = WebhookServer(bot_mod.dp, bot_mod.bot, path="/hook", secret="s3cret", workers=workers, queue_size=n)
+    await server.start("127.0.0.1", 18080)
+    updates = make_updates(n)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+    sem = asyncio.Semaphore(100)  # Telegram 单个 webhook 最多 100 个并发连接
+    t0 = time.perf_counter()
+    async with aiohttp.ClientSession() as http:
+        async def post(u):
+            async with sem:
+                async with http.post("http://127.0.0.1:18080/hook", json=u, headers=headers) as r:
+                    assert r.status == 200, r.status
+        await asyncio.gather(*(post(u) for u in updates))
+    await counter.finished.wait()
+    elapsed = time.perf_counter() - t0
+    await server.stop()
+    bot_mod.dp.update.outer_middleware._middlewares.remove(counter)  # type: ignore[attr-defined]
+    return elapsed
+
+
+async def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    api = FakeBotAPI(latency=latency_ms / 1000)
+    os.environ["TELEGRAM_API_URL"] = await api.start()
+    import bot as bot_mod
+
+    # 只看吞吐：关闭逐条访问日志与处理日志
+    logging.getLogger().setLevel(logging.CRITICAL)
+    bot_mod.init_db()
+    bot_mod.build_search_index()
+    bot_mod.writer.start()
+
+    print(f"{n} 条更新，API 延迟 {latency_ms:.1f} ms")
+    print(f"{'mode':<22}{'seconds':>10}{'updates/s':>12}")
+    t = await run_polling(bot_mod, api, n)
+    print(f"{'polling':<22}{t:>10.2f}{n / t:>12.0f}")
+    t = await run_webhook(bot_mod, n, workers)
+    print(f"{f'webhook ({workers} workers)':<22}{t:>10.2f}{n / t:>12.0f}")
+    print("API 调用：", dict(api.calls.most_common(6)))
+
+    await bot_mod.writer.stop()
+    await bot_mod.bot.session.close()
+    bot_mod.pool.close()
+    await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
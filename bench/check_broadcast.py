@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# 群发引擎异常检查：经进程内模拟 Bot API(bench/fake_api.py)注入群发 worker 未单独处理的错误，
+# 断言任务仍能结束(done/failed)、每个目标都有结果、_tasks 被清理、resume() 不会重跑。
+#
+# 注入：404(TelegramNotFound)、413(TelegramEntityTooLarge)、401(TelegramUnauthorizedError)、
+# 载荷按钮校验失败(pydantic)、send 函数自身抛错(如媒体解析失败)、结果落库失败、载荷 JSON 损坏。
+#
+# 运行：python bench/check_broadcast.py
+# 不满足时以非零状态退出。
+
+import os
+import sys
+import asyncio
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web  # noqa: E402
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+
+from fake_api import FakeBotAPI  # noqa: E402
+from navbot.broadcast import Broadcaster  # noqa: E402
+from navbot.dbpool import SQLitePool  # noqa: E402
+
+# chat_id -> (HTTP 状态, 描述)
+API_ERRORS = {
+    404: (404, "Not Found: chat not found"),
+    413: (413, "Request Entity Too Large"),
+    401: (401, "Unauthorized"),
+}
+BAD_BUTTON = 500     # 载荷按钮缺 text，构造 InlineKeyboardButton 时 pydantic 报错
+SEND_RAISES = 501    # send 函数自身抛错(如媒体库解析失败)
+GOOD = list(range(1000, 1020))
+
+
+class ErrorAPI(FakeBotAPI):
+    async def respond(self, method, params):
+        chat = int(params.get("chat_id") or 0)
+        if chat in API_ERRORS:
+            status, desc = API_ERRORS[chat]
+            return web.json_response({"ok": False, "error_code": status, "description": desc}, status=status)
+        return await super().respond(method, params)
+
+
+async def main() -> None:
+    api = ErrorAPI()
+    bot = Bot("123456:BENCH-token", session=AiohttpSession(api=TelegramAPIServer.from_base(await api.start())))
+
+    async def send(chat_id, payload):
+        if chat_id == SEND_RAISES:
+            raise LookupError("media:42 not found")
+        buttons = payload.get("buttons", [])
+        if chat_id == BAD_BUTTON:
+            buttons = [{"url": "https://t.me"}]
+        kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(**b)] for b in buttons]) if buttons else None
+        return await bot.send_message(chat_id, payload["text"], reply_markup=kb)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = SQLitePool(os.path.join(tmp, "bc.db"), size=4)
+        with pool.connection() as c:
+            Broadcaster.ensure_schema(c)
+            c.commit()
+        bc = Broadcaster(pool, send, rate=1000, per_chat_interval=0, concurrency=4, status_batch=5)
+
+        # 1) 单个目标的未分类错误：记为 failed，任务照常 done
+        targets = GOOD + list(API_ERRORS) + [BAD_BUTTON, SEND_RAISES]
+        job = await bc.create_job("text", {"text": "hi", "buttons": [{"text": "go", "url": "https://t.me"}]}, targets)
+        await asyncio.wait_for(bc.start(job), 10)
+        st = await bc.job_status(job)
+        assert st["status"] == "done", st
+        assert st["targets"] == {"sent": len(GOOD), "failed": len(API_ERRORS) + 2}, st
+        rows = await pool.fetchall(
+            "SELECT chat_id, error, attempts FROM broadcast_targets WHERE job_id=? AND status='failed'", (job,))
+        errors = {r["chat_id"]: r["error"] for r in rows}
+        assert all(r["attempts"] == 1 for r in rows), [tuple(r) for r in rows]  # 都不是临时错误，不重试
+        assert errors["404"].startswith("TelegramNotFound"), errors
+        assert "Too Large" in errors["413"], errors
+        assert errors["401"].startswith("TelegramUnauthorizedError") and "ValidationError" in errors[str(BAD_BUTTON)]
+        assert errors[str(SEND_RAISES)].startswith("LookupError"), errors
+        assert job not in bc._tasks
+        print(f"per-target errors   ok  ({st['targets']})")
+
+        # 2) 结果落库失败：任务以 failed 结束，_tasks 清理
+        real_run = pool.run
+
+        async def broken_run(fn, label="run"):
+            if label == "broadcast.record":
+                raise RuntimeError("disk I/O error")
+            return await real_run(fn, label)
+        pool.run = broken_run
+        job2 = await bc.create_job("text", {"text": "hi"}, GOOD)
+        await asyncio.wait_for(bc.start(job2), 10)
+        pool.run = real_run
+        assert (await bc.job_status(job2))["status"] == "failed" and job2 not in bc._tasks
+
+        # 3) 载荷损坏：任务直接 failed
+        job3 = await bc.create_job("text", {"text": "hi"}, GOOD[:2])
+        await pool.execute("UPDATE broadcast_jobs SET payload='{broken' WHERE id=?", (job3,))
+        await asyncio.wait_for(bc.start(job3), 10)
+        assert (await bc.job_status(job3))["status"] == "failed" and job3 not in bc._tasks
+        print("job-level errors    ok  (record failure / corrupt payload -> failed)")
+
+        assert await bc.resume() == [], "failed jobs must not be resumed"
+        print("resume              ok  (nothing left running)")
+        pool.close()
+    await bot.session.close()
+    await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
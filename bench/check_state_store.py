@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# 多实例一致性检查：两个进程内「实例」(各自的连接池 + SQLiteStateStore)共用同一个库文件，
+# 并发执行冷却占用、轮询分配和 FSM 更新，断言结果与单实例一致。
+#
+# 运行：python bench/check_state_store.py [并发次数]
+# 不满足时以非零状态退出。
+
+import os
+import sys
+import asyncio
+import tempfile
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+
+from navbot.dbpool import SQLitePool  # noqa: E402
+from navbot.state_store import SQLiteStateStore  # noqa: E402
+
+STAFF = [111, 222, 333]
+
+
+def make_instance(path: str) -> SQLiteStateStore:
+    return SQLiteStateStore(SQLitePool(path, size=4, timeout=10))
+
+
+async def check_cooldown(a: SQLiteStateStore, b: SQLiteStateStore, n: int) -> None:
+    # 两个实例同时抢同一个广告的推送窗口：恰好一个成功
+    results = await asyncio.gather(*((a if i % 2 else b).cooldown("ad_push:42", 3600) for i in range(n)))
+    assert sum(results) == 1, f"cooldown granted {sum(results)} times"
+    # 窗口过期后可再次占用，且仍只有一个
+    results = await asyncio.gather(*((a if i % 2 else b).cooldown("ad_push:short", 0.2) for i in range(n)))
+    assert sum(results) == 1
+    await asyncio.sleep(0.25)
+    results = await asyncio.gather(*((a if i % 2 else b).cooldown("ad_push:short", 0.2) for i in range(n)))
+    assert sum(results) == 1
+    print(f"cooldown    ok  ({n} concurrent claims per window, 1 granted)")
+
+
+async def check_round_robin(a: SQLiteStateStore, b: SQLiteStateStore, n: int) -> None:
+    ks = await asyncio.gather(*((a if i % 2 else b).incr("support_rr") for i in range(n)))
+    assert sorted(ks) == list(range(1, n + 1)), "counter values duplicated or skipped"
+    dist = Counter(STAFF[(k - 1) % len(STAFF)] for k in ks)
+    assert max(dist.values()) - min(dist.values()) <= 1, dist
+    print(f"round-robin ok  ({n} assignments, distribution {dict(dist)})")
+
+
+async def check_fsm(a: SQLiteStateStore, b: SQLiteStateStore, n: int) -> None:
+    key = StorageKey(bot_id=1, chat_id=1001, user_id=1001)
+    fa, fb = a.fsm_storage(), b.fsm_storage()
+    await fa.set_state(key, "NewAd:title")
+    await fa.set_data(key, {"title": "draft"})
+    # 实例 B(如重启后的进程或另一个 worker)能读到 A 写入的草稿
+    assert await fb.get_state(key) == "NewAd:title"
+    assert (await fb.get_data(key))["title"] == "draft"
+    # 两个实例并发写不同字段：全部保留
+    await asyncio.gather(*((fa if i % 2 else fb).update_data(key, {f"f{i}": i}) for i in range(n)))
+    data = await fa.get_data(key)
+    missing = [i for i in range(n) if data.get(f"f{i}") != i]
+    assert not missing, f"lost updates: {missing[:10]}"
+    await fb.set_state(key, None)
+    assert await fa.get_state(key) is None
+    print(f"fsm         ok  ({n} concurrent update_data calls, no lost fields)")
+
+
+async def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    path = os.path.join(tempfile.mkdtemp(prefix="navbot-state-"), "state.db")
+    a, b = make_instance(path), make_instance(path)
+    with a.pool.connection() as c:
+        SQLiteStateStore.ensure_schema(c)
+        c.commit()
+    try:
+        await check_cooldown(a, b, n)
+        await check_round_robin(a, b, n)
+        await check_fsm(a, b, n)
+    finally:
+        a.pool.close()
+        b.pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
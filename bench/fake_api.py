@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# 进程内模拟 Telegram Bot API(aiohttp)，供压测/联调使用，不访问真实 Telegram
+#
+#     api = FakeBotAPI(latency=0.005, jitter=0.002, rate_limit=0.01)
+#     base = await api.start()            # http://127.0.0.1:<port>
+#     os.environ["TELEGRAM_API_URL"] = base
+#     api.push_updates([...])             # getUpdates 将返回这些更新
+#
+# 支持的方法：getMe / getUpdates / sendMessage / sendPhoto / editMessageText / answerCallbackQuery
+# 以及 getChat / getChatMember / setWebhook 等，其余方法一律返回 true。
+# 上传的文件(multipart)计入 uploads / upload_bytes，返回的 file_id 由内容哈希得出(同内容同 ID)。
+# rate_limit>0 时按该概率对非 getUpdates/getMe 调用返回 429(retry_after 秒)，模拟 Telegram 限流。
+
+import time
+import json
+import hashlib
+import random
+import asyncio
+import itertools
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+_ids = itertools.count(1)
+
+
+def user(uid: int) -> Dict[str, Any]:
+    return {"id": uid, "is_bot": False, "first_name": f"u{uid}", "username": f"user{uid}"}
+
+
+def chat(cid: Any) -> Dict[str, Any]:
+    if isinstance(cid, str) and cid.startswith("@"):
+        return {"id": -1000000000000 - (abs(hash(cid)) % 10 ** 6), "type": "channel", "username": cid[1:], "title": cid}
+    cid = int(cid)
+    return {"id": cid, "type": "private" if cid > 0 else "supergroup", "first_name": f"c{cid}"}
+
+
+def message_update(uid: int, text: str) -> Dict[str, Any]:
+    """合成一条私聊文本消息更新。"""
+    msg = {"message_id": next(_ids), "date": int(time.time()), "chat": chat(uid), "from": user(uid), "text": text}
+    if text.startswith("/"):
+        cmd = text.split()[0]
+        msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(cmd)}]
+    return {"update_id": next(_ids), "message": msg}
+
+
+def callback_update(uid: int, data: str) -> Dict[str, Any]:
+    """合成一条内联按钮回调更新(消息来自机器人自身)。"""
+    msg = {"message_id": next(_ids), "date": int(time.time()), "chat": chat(uid),
+           "from": {"id": 1, "is_bot": True, "first_name": "bot"}, "text": "menu"}
+    return {"update_id": next(_ids),
+            "callback_query": {"id": str(next(_ids)), "from": user(uid), "chat_instance": str(uid),
+                               "message": msg, "data": data}}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit: float = 0.0,
+                 retry_after: int = 1, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self._rnd = random.Random(seed)
+        self.limited: Counter = Counter()
+        self.calls: Counter = Counter()
+        self.latencies: List[float] = []
+        self.uploads = 0
+        self.upload_bytes = 0
+        self._updates: List[Dict[str, Any]] = []
+        self._has_updates = asyncio.Event()
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    # ---- 更新源 ----
+    def push_updates(self, updates: List[Dict[str, Any]]) -> None:
+        self._updates.extend(updates)
+        self._has_updates.set()
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), min(timeout, 1.0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    # ---- 方法结果 ----
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        out = {"message_id": next(_ids), "date": int(time.time()), "chat": chat(params.get("chat_id", 1))}
+        if "text" in params:
+            out["text"] = params["text"]
+        if "caption" in params:
+            out["caption"] = params["caption"]
+        for kind in ("photo", "document"):
+            ref = params.get(kind)
+            if ref is None:
+                continue
+            key = params.get("_upload") or hashlib.sha1(str(ref).encode()).hexdigest()
+            f = {"file_id": ref if "_upload" not in params else f"file-{key[:16]}", "file_unique_id": f"u-{key[:16]}"}
+            out[kind] = [dict(f, width=1, height=1)] if kind == "photo" else f
+        return out
+
+    async def result(self, method: str, params: Dict[str, Any]) -> Any:
+        m = method.lower()
+        if m == "getme":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if m == "getupdates":
+            return await self._get_updates(params)
+        if m in ("sendmessage", "sendphoto", "senddocument", "copymessage"):
+            return self._message(params)
+        if m in ("editmessagetext", "editmessagecaption", "editmessagereplymarkup"):
+            return self._message(params) if params.get("chat_id") else True
+        if m == "sendmediagroup":
+            return [self._message(params) for _ in params.get("media") or [None]]
+        if m == "getchat":
+            return chat(params.get("chat_id", 1))
+        if m == "getchatmember":
+            return {"status": "member", "user": user(int(params.get("user_id", 1)))}
+        return True
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params: Dict[str, Any] = {}
+        if request.method == "POST" and request.can_read_body:
+            form = await request.post()
+            for k, v in form.items():
+                if isinstance(v, str):
+                    try:
+                        params[k] = json.loads(v)
+                    except ValueError:
+                        params[k] = v
+                else:  # 上传的文件
+                    data = v.file.read()
+                    self.uploads += 1
+                    self.upload_bytes += len(data)
+                    params["_upload"] = hashlib.sha1(data).hexdigest()
+        params.update(request.query)
+        self.calls[method] += 1
+        t0 = time.perf_counter()
+        m = method.lower()
+        if (self.latency or self.jitter) and m != "getupdates":
+            await asyncio.sleep(self.latency + self._rnd.random() * self.jitter)
+        if self.rate_limit and m not in ("getupdates", "getme") and self._rnd.random() < self.rate_limit:
+            self.limited[method] += 1
+            resp = web.json_response({"ok": False, "error_code": 429,
+                                      "description": f"Too Many Requests: retry after {self.retry_after}",
+                                      "parameters": {"retry_after": self.retry_after}})
+        else:
+            resp = await self.respond(method, params)
+        self.latencies.append(time.perf_counter() - t0)
+        return resp
+
+    async def respond(self, method: str, params: Dict[str, Any]) -> web.Response:
+        """子类可覆盖以注入错误(如 429)。"""
+        return web.json_response({"ok": True, "result": await self.result(method, params)})
+
+    # ---- 生命周期 ----
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
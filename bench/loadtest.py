@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+# 离线压测：dp 直连进程内模拟 Bot API(bench/fake_api.py)，按流量配比回放合成会话
+#
+# - 每个虚拟用户串行执行会话(保证 FSM 步骤有序)，用户之间并发；更新经 dp.feed_update 投递
+# - 会话类型：/start、查询关键词、索引导航回调、广告创建 FSM 全流程、群发(/bc_ad … users)
+# - 模拟 API 可配固定延迟 + 抖动 + 429 注入
+# - 先单用户串行跑 --solo 条更新测各 handler 的 p50/p95/p99(不含并发排队)，再多用户并发测吞吐
+# - 输出 updates/s、单条更新 p50/p95/p99、每条更新的 DB 查询数/耗时、各 handler 耗时、热点微基准
+# - --save 写基线 JSON；--compare 与基线比对，超出容差的指标列出并以退出码 1 结束
+#
+# 运行：python bench/loadtest.py --mix default --users 50 --updates 3000 --latency 5 --rate-limit 0.005
+#       python bench/loadtest.py --compare bench/baselines/default.json
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import datetime
+import tempfile
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH-token")
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(prefix="navbot-bench-"), "bench.db"))
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("THROTTLE", "0")  # 少量虚拟用户连续发送，不做防刷限速
+
+from fake_api import FakeBotAPI, callback_update, message_update  # noqa: E402
+from navbot.dbpool import LatencyWindow  # noqa: E402
+
+# 会话类型权重
+MIXES: Dict[str, Dict[str, int]] = {
+    "default": {"start": 20, "query": 35, "nav": 35, "ad_fsm": 8, "broadcast": 2},
+    "browse": {"start": 30, "nav": 70},
+    "search": {"query": 100},
+    "admin": {"ad_fsm": 80, "broadcast": 20},
+}
+QUERY_MISSES = ["不存在的关键词", "xyz", "查无此行"]
+# 越小越好的指标允许的绝对抖动(毫秒/微秒)，避免基线极小时相对容差过敏
+ABS_FLOOR = {"ms": 0.5, "us": 2.0}
+
+Script = List[Tuple[str, str]]  # [("msg"|"cb", 文本或 callback_data)]
+
+
+class Scenarios:
+    def __init__(self, bot_mod: Any, rnd: random.Random):
+        self.rnd = rnd
+        self.banks = list(bot_mod.BANK_DETAIL.keys()) or ["中国银行"]
+        self.cat_id = 0
+        self.ad_id = 0
+
+    def start(self) -> Script:
+        return [("msg", "/start")]
+
+    def query(self) -> Script:
+        kw = self.rnd.choice(self.banks) if self.rnd.random() < 0.8 else self.rnd.choice(QUERY_MISSES)
+        return [("msg", f"查询 {kw}")]
+
+    def nav(self) -> Script:
+        r = self.rnd
+        letters = "ABCDEFG" if r.random() < 0.5 else "HJKLMNPQRSTWXYZ"
+        rng = "AG" if letters.startswith("A") else "HZ"
+        return [("cb", "idx_home"), ("cb", "big_bank_list"), ("cb", f"bank:{r.choice(self.banks)}"),
+                ("cb", f"idx_range:{rng}"), ("cb", f"idx:{rng}:{r.choice(letters)}"), ("cb", "go_home")]
+
+    def ad_fsm(self) -> Script:
+        return [("msg", "/admgr"), ("cb", "ad:new"), ("msg", f"压测广告 {self.rnd.randrange(10 ** 6)}"),
+                ("cb", f"adcat:pick:{self.cat_id}"), ("msg", "/skip"), ("msg", "<b>文案</b> 压测"),
+                ("msg", "/skip"), ("cb", "ad:save_new")]
+
+    def broadcast(self) -> Script:
+        return [("msg", f"/bc_ad {self.ad_id} users")]
+
+    def pick(self, weights: Dict[str, int]) -> Tuple[str, Script]:
+        name = self.rnd.choices(list(weights), weights=list(weights.values()))[0]
+        return name, getattr(self, name)()
+
+
+class HandlerTimer:
+    """内层中间件：按 handler 名记录精确耗时样本。"""
+
+    def __init__(self, size: int = 200_000):
+        self.size = size
+        self.windows: Dict[str, LatencyWindow] = {}
+
+    async def __call__(self, handler: Callable, event: Any, data: Dict[str, Any]) -> Any:
+        route = data.get("cb_route")
+        cb = route.fn if route is not None else getattr(data.get("handler"), "callback", None)
+        name = getattr(cb, "__name__", "?")
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            w = self.windows.get(name)
+            if w is None:
+                w = self.windows[name] = LatencyWindow(self.size)
+            w.add(time.perf_counter() - t0)
+
+    def summaries(self) -> Dict[str, Dict[str, float]]:
+        return {name: {k: s[k] for k in ("count", "p50_ms", "p95_ms", "p99_ms")}
+                for name, s in sorted((k, w.summary()) for k, w in self.windows.items())}
+
+
+async def drain_writer(bot_mod: Any) -> None:
+    """把 write-behind 积压全部落库(stop 会 flush)，再重新启动。"""
+    await bot_mod.writer.stop()
+    bot_mod.writer.start()
+
+
+async def seed(bot_mod: Any, scen: Scenarios) -> None:
+    scen.cat_id = await bot_mod.pool.execute("INSERT INTO ad_categories(name, sort) VALUES('压测', 0)")
+    scen.ad_id = await bot_mod.ad_add("压测群发", "压测文案", "https://example.com", "", scen.cat_id)
+
+
+def micro(bot_mod: Any, n: int = 5000, repeat: int = 7) -> Dict[str, float]:
+    """热点函数单次耗时(微秒)，取 repeat 轮中最快的一轮，降低机器抖动影响。"""
+    out: Dict[str, float] = {}
+    cases = [("main_menu_us", lambda: bot_mod.main_menu()),
+             ("idx_page_us", lambda: bot_mod.idx_page("AG", "C")),
+             ("search_index_us", lambda: bot_mod.search_index.search("中国银行", limit=20))]
+    for name, fn in cases:
+        fn()
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                fn()
+            best = min(best, time.perf_counter() - t0)
+        out[name] = best / n * 1e6
+    return out
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    api = FakeBotAPI(latency=args.latency / 1000, jitter=args.jitter / 1000, rate_limit=args.rate_limit,
+                     retry_after=args.retry_after, seed=args.seed)
+    os.environ["TELEGRAM_API_URL"] = await api.start()
+    import bot as bot_mod
+    from aiogram.types import Update
+    from navbot.ratelimit import TokenBucket
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    bot_mod.init_db()
+    bot_mod.build_search_index()
+    bot_mod.writer.start()
+    if args.bc_rate:
+        bot_mod.broadcaster.bucket = TokenBucket(args.bc_rate, capacity=args.bc_rate)
+
+    timer = HandlerTimer()
+    for name, observer in bot_mod.dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(timer)
+
+    rnd = random.Random(args.seed)
+    scen = Scenarios(bot_mod, rnd)
+    await seed(bot_mod, scen)
+    weights = MIXES[args.mix]
+    sessions: Counter = Counter()
+    errors: Counter = Counter()
+    update_lat = LatencyWindow(size=max(args.updates * 2, 1000))
+    remaining = [0]
+
+    async def feed(uid: int, kind: str, payload: str) -> None:
+        raw = message_update(uid, payload) if kind == "msg" else callback_update(uid, payload)
+        upd = Update.model_validate(raw, context={"bot": bot_mod.bot})
+        t0 = time.perf_counter()
+        try:
+            await bot_mod.dp.feed_update(bot_mod.bot, upd)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        finally:
+            update_lat.add(time.perf_counter() - t0)
+
+    async def virtual_user(uid: int) -> None:
+        while remaining[0] > 0:
+            name, script = scen.pick(weights)
+            sessions[name] += 1
+            for kind, payload in script:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                await feed(uid, kind, payload)
+
+    # 预热：填充键盘/设置缓存与 user_meta，避免首轮冷启动计入结果
+    for i in range(min(args.users, 50)):
+        await feed(20_000 + i, "msg", "/start")
+    await drain_writer(bot_mod)
+
+    # 单用户阶段：handler 耗时只含自身的 DB/API 等待，作为回归比较的依据
+    timer.windows.clear()
+    remaining[0] = args.solo
+    await virtual_user(19_999)
+    await drain_writer(bot_mod)
+    solo = timer.summaries()
+
+    timer.windows.clear()
+    sessions.clear()
+    update_lat = LatencyWindow(size=max(args.updates * 2, 1000))
+    api.calls.clear()
+    api.limited.clear()
+    remaining[0] = args.updates
+    q0 = bot_mod.pool.query_stats.count, bot_mod.pool.query_stats.total
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(virtual_user(20_000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - t0
+    await drain_writer(bot_mod)
+    q1 = bot_mod.pool.query_stats.count, bot_mod.pool.query_stats.total
+
+    bc_t0 = time.perf_counter()
+    running = [t for t in bot_mod.broadcaster._tasks.values() if not t.done()]
+    if running:
+        await asyncio.wait(running, timeout=args.bc_timeout)
+    bc_elapsed = time.perf_counter() - bc_t0
+    bc = await bot_mod.pool.fetchone("SELECT COUNT(*) AS jobs, COALESCE(SUM(sent),0) AS sent, "
+                                     "COALESCE(SUM(total),0) AS total FROM broadcast_jobs")
+
+    n = args.updates
+    u = update_lat.summary()
+    result = {
+        "meta": {"mix": args.mix, "users": args.users, "updates": n, "solo": args.solo, "latency_ms": args.latency,
+                 "jitter_ms": args.jitter, "rate_limit": args.rate_limit, "seed": args.seed,
+                 "python": platform.python_version(), "at": datetime.datetime.now().isoformat(timespec="seconds")},
+        "updates_per_s": n / elapsed,
+        "update_ms": {k: u[k] for k in ("p50_ms", "p95_ms", "p99_ms")},
+        "db_queries_per_update": (q1[0] - q0[0]) / n,
+        "db_ms_per_update": (q1[1] - q0[1]) * 1000 / n,
+        "handlers": solo,
+        "handlers_under_load": timer.summaries(),
+        "sessions": dict(sessions),
+        "errors": dict(errors),
+        "api": {"calls": sum(api.calls.values()), "rate_limited": sum(api.limited.values())},
+        "broadcast": {"jobs": bc["jobs"], "sent": bc["sent"], "total": bc["total"],
+                      "drain_seconds": bc_elapsed},
+        "micro": micro(bot_mod),
+    }
+
+    for t in bot_mod.broadcaster._tasks.values():
+        t.cancel()
+    await bot_mod.writer.stop()
+    await bot_mod.bot.session.close()
+    bot_mod.pool.close()
+    await api.stop()
+    return result
+
+
+def compare(cur: Dict[str, Any], base: Dict[str, Any], tol: float) -> List[str]:
+    """返回超出容差的指标说明；吞吐越大越好，其余越小越好。"""
+    bad: List[str] = []
+
+    def worse(name: str, new: float, old: float, unit: str) -> None:
+        if new > old * (1 + tol) and new - old > ABS_FLOOR.get(unit, 0):
+            bad.append(f"{name}: {old:.3f} → {new:.3f} {unit} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+
+    if cur["updates_per_s"] < base["updates_per_s"] * (1 - tol):
+        bad.append(f"updates_per_s: {base['updates_per_s']:.0f} → {cur['updates_per_s']:.0f} "
+                   f"({(cur['updates_per_s'] / base['updates_per_s'] - 1) * 100:.0f}%)")
+    for k in ("p50_ms", "p95_ms", "p99_ms"):
+        worse(f"update {k}", cur["update_ms"][k], base["update_ms"][k], "ms")
+    worse("db_ms_per_update", cur["db_ms_per_update"], base["db_ms_per_update"], "ms")
+    if cur["db_queries_per_update"] > base["db_queries_per_update"] * (1 + tol):
+        bad.append(f"db_queries_per_update: {base['db_queries_per_update']:.2f} → {cur['db_queries_per_update']:.2f}")
+    # handler 比较用单用户阶段的 p50(并发阶段的耗时主要是排队，随调度抖动)
+    for name, old in base.get("handlers", {}).items():
+        new: Optional[Dict[str, Any]] = cur["handlers"].get(name)
+        if new and min(old["count"], new["count"]) >= 30:
+            worse(f"{name} p50", new["p50_ms"], old["p50_ms"], "ms")
+    for k, old_v in base.get("micro", {}).items():
+        if k in cur["micro"]:
+            worse(k, cur["micro"][k], old_v, "us")
+    return bad
+
+
+def report(r: Dict[str, Any]) -> None:
+    m = r["meta"]
+    print(f"mix={m['mix']} users={m['users']} updates={m['updates']} API 延迟 {m['latency_ms']}±{m['jitter_ms']} ms "
+          f"429 注入 {m['rate_limit'] * 100:.1f}%")
+    u = r["update_ms"]
+    print(f"吞吐 {r['updates_per_s']:.0f} updates/s · 单条更新 p50/p95/p99 "
+          f"{u['p50_ms']:.1f}/{u['p95_ms']:.1f}/{u['p99_ms']:.1f} ms")
+    print(f"DB：每条更新 {r['db_queries_per_update']:.2f} 次查询、{r['db_ms_per_update']:.2f} ms")
+    print(f"会话 {r['sessions']}  API 调用 {r['api']['calls']}（429 {r['api']['rate_limited']}）  异常 {r['errors'] or '无'}")
+    b = r["broadcast"]
+    if b["jobs"]:
+        print(f"群发：{b['jobs']} 个任务，已发 {b['sent']}/{b['total']}，排空 {b['drain_seconds']:.1f}s")
+    print(f"{'handler(单用户)':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'并发 p95':>12}")
+    loaded = r.get("handlers_under_load", {})
+    for name, h in sorted(r["handlers"].items(), key=lambda kv: -kv[1]["p50_ms"]):
+        lp = loaded.get(name, {}).get("p95_ms", 0.0)
+        print(f"{name:<24}{h['count']:>8}{h['p50_ms']:>10.2f}{h['p95_ms']:>10.2f}{h['p99_ms']:>10.2f}{lp:>12.2f}")
+    print("微基准：" + "  ".join(f"{k} {v:.2f}" for k, v in r["micro"].items()))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="navbot 离线压测")
+    ap.add_argument("--mix", choices=sorted(MIXES), default="default")
+    ap.add_argument("--users", type=int, default=50, help="并发虚拟用户数")
+    ap.add_argument("--updates", type=int, default=3000, help="并发阶段投递的更新总数")
+    ap.add_argument("--solo", type=int, default=600, help="单用户阶段的更新数")
+    ap.add_argument("--latency", type=float, default=5.0, help="模拟 API 固定延迟(毫秒)")
+    ap.add_argument("--jitter", type=float, default=2.0, help="模拟 API 额外随机延迟上限(毫秒)")
+    ap.add_argument("--rate-limit", type=float, default=0.0, help="429 注入概率")
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--bc-rate", type=float, default=200.0, help="群发令牌桶速率(0 为生产默认)")
+    ap.add_argument("--bc-timeout", type=float, default=30.0, help="等待群发排空的最长秒数")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--save", metavar="JSON", help="把结果写为基线")
+    ap.add_argument("--compare", metavar="JSON", help="与基线比对")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="相对容差(默认 25%%)")
+    args = ap.parse_args()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        for k in ("mix", "users", "updates", "solo", "latency_ms", "jitter_ms", "rate_limit", "seed"):
+            key = {"latency_ms": "latency", "jitter_ms": "jitter"}.get(k, k)
+            setattr(args, key, base["meta"][k])  # 按基线的参数复现
+
+    result = asyncio.run(run(args))
+    report(result)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"基线已写入 {args.save}")
+    if args.compare:
+        bad = compare(result, base, args.tolerance)
+        if bad:
+            print(f"相对基线退化(容差 {args.tolerance * 100:.0f}%)：")
+            for line in bad:
+                print("  " + line)
+            sys.exit(1)
+        print(f"与基线 {args.compare} 一致(容差 {args.tolerance * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,20 +7,41 @@
 # - 运维：面板发布/更新/删除、自定义按钮与链接、统计/导出/导入、健康检查
 #
 # 运行前：pip install -r requirements.txt，并配置 .env(或环境变量)
-# 环境变量：BOT_TOKEN, DEFAULT_CHANNEL(可选), DB_FILE(可选)
+# 环境变量：BOT_TOKEN, DEFAULT_CHANNEL(可选), DB_FILE(可选), DB_POOL_SIZE(可选，默认 4), SETTINGS_TTL(可选，秒)
+#           FOLLOW_TTL / FOLLOW_NEG_TTL(可选，关注状态缓存秒数)
+#           WB_FLUSH_MS / WB_BATCH / WB_MAXSIZE(可选，统计写入批量落库参数)
+#           BROADCAST_RATE / BROADCAST_CONCURRENCY(可选，群发限速)，TELEGRAM_API_URL(可选，自建 Bot API)
+#           BOT_MODE=polling|webhook；webhook 模式需 WEBHOOK_URL，可选 WEBHOOK_PATH/SECRET/HOST/PORT/WORKERS
+#           STATE_BACKEND=sqlite|redis(共享 FSM/冷却/轮询状态)，redis 时需 REDIS_URL
+#           SNAPSHOT_DIR / SNAPSHOT_INTERVAL_H / SNAPSHOT_KEEP(可选，定时快照)，EXPORT_SPLIT_MB(可选，导出分卷大小)
+#           METRICS=1|0(埋点开关)，METRICS_HOST / METRICS_PORT(本地 /metrics 端点，端口 0 关闭)
+#           LOG_LEVEL / LOG_FILE / LOG_FORMAT=text|json / LOG_MAX_MB / LOG_BACKUPS / LOG_ROTATE_WHEN / LOG_SAMPLE(日志)
+#           MEDIA_DIR / MEDIA_STORAGE_CHAT(媒体库：本地素材目录、上传用的存储会话)
+#           PANEL_SYNC_INTERVAL(秒，频道面板自动同步，0 关闭) / PANEL_SYNC_CONCURRENCY
+#           RENDER_CACHE_SIZE(可选，记住多少条消息的当前视图，0 关闭跳过)
+#           HTTP_SESSION=tuned|default，HTTP_LIMIT / HTTP_LIMIT_PER_HOST / HTTP_KEEPALIVE / HTTP_TIMEOUT / HTTP_CONNECT_TIMEOUT
+#           HTTP_TIMEOUTS(按方法超时，如 sendPhoto=60,answerCallbackQuery=5) / HTTP_RETRIES(网络错误重试次数)
+#           THROTTLE=1|0(防刷限速)，THROTTLE_RULES(如 query=0.5:5,callback=2:10，速率/秒:突发) / THROTTLE_MAX_USERS
+#
+# 启动：导入本模块不访问 DB、不调用 Bot API；表结构由 MIGRATIONS 按版本迁移，on_startup() 中执行
 #
 # Author: Combined by ChatGPT
 
 # ========== 标准库导入 ==========
 import os
 import re
+import time
 import sqlite3
+import atexit
 import logging
 import asyncio
 import datetime
 import json
-from pathlib import Path
-from typing import Dict, List, Tuple, Optional, Set
+import html
+import hashlib
+from typing import Any, Dict, List, Tuple, Optional, Set
+
+_T0 = time.perf_counter()  # 启动计时起点(含第三方库导入)
 
 # ========== 第三方库导入 ==========
 from dotenv import load_dotenv
@@ -28,6 +49,8 @@ from dotenv import load_dotenv
 # ========== aiogram 导入 ==========
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.types import (
@@ -39,35 +62,60 @@ from aiogram.types import (
     FSInputFile,
     InputMediaPhoto,
 )
-from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+# ========== 本地模块 ==========
+from navbot.logsetup import setup_logging
+from navbot.dbpool import SQLitePool
+from navbot.settings_cache import SettingsCache
+from navbot.kb_registry import KeyboardRegistry
+from navbot.search_index import SCORE_CONTAINS, SearchIndex
+from navbot.member_cache import MembershipCache, is_member_status
+from navbot.write_behind import WriteBehind
+from navbot.broadcast import Broadcaster, send_with_retry
+from navbot.webhook import run_webhook
+from navbot.state_store import SQLiteStateStore, make_state_store
+from navbot.rollups import StatsRollups
+from navbot.click_analytics import ClickAnalytics
+from navbot.snapshot import Snapshotter, cleanup as cleanup_exports
+from navbot.metrics import BotMetrics, MetricsServer
+from navbot.callback_router import CallbackArgs, CallbackRouter
+from navbot.keyword_menus import KeywordMenu, KeywordMenus
+from navbot.ad_templates import AdTemplateStore
+from navbot.media_library import Media, MediaLibrary
+from navbot.panel_sync import PanelSync
+from navbot.render_cache import RenderCache
+from navbot.startup import Migration, StartupTimer, migrate
+from navbot.http_session import TunedSession, parse_timeouts
+from navbot.throttle import Throttle, parse_rules
+
 load_dotenv()
 
 
 
 
 
-# --- auto-fallback for build_bank_detail_kb (injected) ---
-try:
-    build_bank_detail_kb  # type: ignore  # noqa: F821
-except NameError:
-    def build_bank_detail_kb(bank_name: str):
-        return InlineKeyboardMarkup(
-            inline_keyboard=[[InlineKeyboardButton(text="⬅ 返回", callback_data="go_home")]]
-        )
-# --- end fallback ---
 
 
 # ========== 日志 ==========
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("bot.log", encoding="utf-8")]
+# 事件循环只入队，写盘/轮转/压缩在后台线程(见 navbot/logsetup.py)
+log_setup = setup_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    path=os.getenv("LOG_FILE", "bot.log").strip() or None,
+    fmt=os.getenv("LOG_FORMAT", "text").strip().lower(),
+    max_bytes=int(float(os.getenv("LOG_MAX_MB", "50")) * 1024 * 1024),
+    backups=int(os.getenv("LOG_BACKUPS", "10")),
+    when=os.getenv("LOG_ROTATE_WHEN", "").strip(),
+    compress=os.getenv("LOG_COMPRESS", "1").strip() != "0",
+    sample=os.getenv("LOG_SAMPLE", ""),
+    queue_size=int(os.getenv("LOG_QUEUE", "10000")),
 )
+atexit.register(log_setup.stop)
 logger = logging.getLogger(__name__)
+startup_timer = StartupTimer(_T0)
 
 START_TIME = datetime.datetime.now()
 
@@ -77,18 +125,222 @@ if not BOT_TOKEN:
     raise RuntimeError("Missing env BOT_TOKEN")
 DEFAULT_CHANNEL = os.getenv("DEFAULT_CHANNEL", "").strip() or "-1001234567890"
 DB_FILE = os.getenv("DB_FILE", "channel_helper_pro.db").strip()
+# 运行模式：polling(默认) 或 webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/tg/webhook").strip()
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0").strip()
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise RuntimeError("Missing env WEBHOOK_URL (required when BOT_MODE=webhook)")
+
+# TELEGRAM_API_URL：自建/本地模拟 Bot API 服务器(压测、联调用)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").strip()
+# HTTP_SESSION=tuned(默认，连接池/按方法超时/网络错误重试，见 navbot/http_session.py)|default(aiogram 原生会话)
+HTTP_SESSION = os.getenv("HTTP_SESSION", "tuned").strip().lower()
+
+def make_session() -> AiohttpSession:
+    kw: Dict[str, Any] = {}
+    if TELEGRAM_API_URL:
+        kw["api"] = TelegramAPIServer.from_base(TELEGRAM_API_URL)
+    if os.getenv("HTTP_TIMEOUT"):
+        kw["timeout"] = float(os.getenv("HTTP_TIMEOUT", "60"))
+    if HTTP_SESSION != "tuned":
+        return AiohttpSession(**kw)
+    return TunedSession(
+        limit=int(os.getenv("HTTP_LIMIT", "100")),
+        limit_per_host=int(os.getenv("HTTP_LIMIT_PER_HOST", "0")),
+        keepalive=float(os.getenv("HTTP_KEEPALIVE", "60")),
+        connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+        timeouts=parse_timeouts(os.getenv("HTTP_TIMEOUTS", "")),
+        retries=int(os.getenv("HTTP_RETRIES", "2")),
+        **kw,
+    )
 
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
+bot = Bot(token=BOT_TOKEN, session=make_session(), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 
 # ========== 数据库 ==========
-def db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_FILE, timeout=10)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db() -> None:
-    c = db()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+pool = SQLitePool(DB_FILE, size=DB_POOL_SIZE, timeout=10)
+# FSM 草稿、推送冷却、客服轮询计数放在共享后端，多实例部署时保持一致
+state_store = make_state_store(os.getenv("STATE_BACKEND", "sqlite"), pool, os.getenv("REDIS_URL", "").strip())
+dp = Dispatcher(storage=state_store.fsm_storage())
+# 内联按钮回调：完全匹配/最长前缀查表分发(见 navbot/callback_router.py)，不再逐个求值过滤器
+cb_router = CallbackRouter()
+cb_router.attach(dp)
+# 埋点：更新吞吐、handler 耗时、Bot API 调用、SQLite 查询、事件循环延迟；/metrics 与 /ping 读取
+metrics = BotMetrics()
+if os.getenv("METRICS", "1").strip() != "0":
+    metrics.install(dp, bot, pool)
+# 防刷：按 用户 × handler 类别 令牌桶限速(见 navbot/throttle.py)；OWNER 不限速
+throttle = Throttle(
+    parse_rules(os.getenv("THROTTLE_RULES", "")),
+    maxsize=int(os.getenv("THROTTLE_MAX_USERS", "100000")),
+    exempt=lambda uid: uid in owners_get(),
+)
+if os.getenv("THROTTLE", "1").strip() != "0":
+    throttle.install(dp)
+# SETTINGS_TTL>0 时定期比对 settings_version，多进程共用一个 DB 时使用
+settings = SettingsCache(pool.run_sync, ttl=float(os.getenv("SETTINGS_TTL", "0") or 0), run=pool.run)
+# 分析类写入(query_log/user_meta/ad_clicks)异步批量落库，不占用回复链路
+writer = WriteBehind(
+    flush_interval=int(os.getenv("WB_FLUSH_MS", "500")) / 1000,
+    max_batch=int(os.getenv("WB_BATCH", "500")),
+    maxsize=int(os.getenv("WB_MAXSIZE", "10000")),
+)
+writer.register("user_meta", pool, "INSERT OR IGNORE INTO user_meta(user_id, username, first_seen) VALUES(?,?,?)")
+writer.register("query_log", pool, "INSERT INTO query_log(user_id, keyword, created_at) VALUES(?,?,?)")
+# /stats 汇总表(按天/小时)，由 query_log/user_meta 上的触发器随写入维护
+rollups = StatsRollups(pool)
+# 广告曝光/点击明细 + 汇总 + 独立点击用户草图，/报表 读取
+click_analytics = ClickAnalytics(pool, writer)
+# 在线快照：/export_db 与定时备份(SNAPSHOT_INTERVAL_H>0 时启用，保留最近 SNAPSHOT_KEEP 份)
+snapshots = Snapshotter(
+    pool.path,
+    out_dir=os.getenv("SNAPSHOT_DIR", "./backups"),
+    keep=int(os.getenv("SNAPSHOT_KEEP", "7")),
+    split_limit=int(float(os.getenv("EXPORT_SPLIT_MB", "49")) * 1024 * 1024),
+)
+# 群发：全局 BROADCAST_RATE 条/秒、BROADCAST_CONCURRENCY 个并发发送协程
+async def _bc_send(chat_id, payload: Dict) -> Message:
+    rows = [[InlineKeyboardButton(text=b["text"], url=b.get("url"), callback_data=b.get("callback_data"))]
+            for b in payload.get("buttons", [])]
+    kb = InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+    # photo 为媒体引用(media:/album:/旧的 file_id)，经媒体库缓存解析，群发时不会重新上传
+    return await send_media(chat_id, payload.get("photo"), payload.get("text", ""), kb)
+
+broadcaster = Broadcaster(
+    pool, _bc_send,
+    rate=float(os.getenv("BROADCAST_RATE", "25")),
+    concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "8")),
+)
+# 频道面板：按内容哈希只编辑过期的面板，并发执行，与群发共用令牌桶
+async def _panel_edit(chat_id: int, message_id: int, text: str, kb: Optional[InlineKeyboardMarkup]) -> None:
+    render_cache.forget((chat_id, message_id))
+    await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=kb,
+                                disable_web_page_preview=True)
+
+panel_sync = PanelSync(pool, lambda: (WELCOME_TEXT, main_menu()), _panel_edit, bucket=broadcaster.bucket,
+                       concurrency=int(os.getenv("PANEL_SYNC_CONCURRENCY", "8")))
+# 键盘按设置版本缓存；改动 LINKS/INDEX_AZ/BANK_DETAIL 后需调用 keyboards.bump()
+keyboards = KeyboardRegistry(lambda: settings.version)
+# 关键词快捷菜单：存 keyword_menus 表(owner 用 /kw_set、/kw_del 在线维护)，Aho-Corasick 一次扫描匹配
+# 下面的字典只在表为空时写入一次，作为首次部署的默认菜单
+CUSTOM_QUERY_MENUS = {
+    "电销话术": {
+        "title": "📞 电销话术模板合集",
+        "desc": "建议收藏常用话术，灵活应对客户问题。",
+        "buttons": [
+            ("📄 文字模板", "https://t.me/c/2025069980/25"),
+            ("🎧 话术录音", "https://t.me/c/2025069980/137"),
+            ("📋 交单格式", "https://t.me/c/2025069980/134"),
+            ("❌ 扣单标准", "https://t.me/c/2025069980/26"),
+        ],
+    },
+    "贷款话术": {
+        "title": "💰 贷款话术与引流资料",
+        "desc": "包括大纲、话术模板、引流技巧等。",
+        "buttons": [
+            ("📄 大纲1", "https://t.me/c/2025069980/45"),
+            ("📄 大纲2", "https://t.me/c/2025069980/60"),
+            ("🧲 引流方式", "https://t.me/c/2025069980/49"),
+            ("📚 包装合同", "https://t.me/c/2025069980/61"),
+        ],
+    },
+    "避税话术": {
+        "title": "🧾 避税话术合集",
+        "desc": "请合法合规使用，仅供学习参考。",
+        "buttons": [
+            ("📄 兼职避税", "https://t.me/c/2025069980/71"),
+            ("📄 工程避税", "https://t.me/c/2025069980/132"),
+            ("📄 避税1", "https://t.me/c/2025069980/145"),
+            ("📄 避税2", "https://t.me/c/2025069980/87"),
+        ],
+    },
+    "朋友圈文案": {
+        "title": "🗣️ 朋友圈文案合集",
+        "desc": "素材更新中，建议保存。",
+        "buttons": [
+            ("📲 文案1-8", "https://t.me/c/2025069980/91"),
+            ("📲 文案9-16", "https://t.me/c/2025069980/98"),
+            ("📲 文案17-23", "https://t.me/c/2025069980/100"),
+        ],
+    },
+    "测卡教程": {
+        "title": "📚 测卡教程 & 公户标准",
+        "desc": "全网最全教程合集，请按需查看。",
+        "buttons": [
+            ("🧰 百宝箱总入口", "https://t.me/BLQnX6H5oBgyZjhl/738"),
+            ("🔠 A-G模板", "https://t.me/BLQnX6H5oBgyZjhl/138"),
+            ("🔠 H-Z模板", "https://t.me/BLQnX6H5oBgyZjhl/139"),
+            ("🏢 公户标准", "https://t.me/BLQnX6H5oBgyZjhl/831"),
+        ],
+    },
+    "结算规则": {
+        "title": "💼 卡商结算规则汇总",
+        "desc": "适用于发车、供卡、柜台操作。",
+        "buttons": [
+            ("📋 结算规则", "https://t.me/BLQnX6H5oBgyZjhl/124"),
+            ("🚚 车队规则", "https://t.me/BLQnX6H5oBgyZjhl/871"),
+            ("📦 供料规则", "https://t.me/BLQnX6H5oBgyZjhl/186"),
+        ],
+    },
+}
+keyword_menus = KeywordMenus(pool, ttl=float(os.getenv("SETTINGS_TTL", "0") or 0))
+# 广告模板(/保存广告、/模板列表、/推送广告)：SQLite 表 + 版本历史，热模板走进程内 LRU
+AD_TEMPLATE_FILE = "ad_templates.json"  # 旧版存储，仅首次建表时导入
+ad_templates = AdTemplateStore(pool, cache_size=int(os.getenv("AD_TEMPLATE_CACHE", "1024")))
+# 媒体库：本地素材按内容哈希只上传一次(到 MEDIA_STORAGE_CHAT)，之后一律用缓存的 file_id 发送
+MEDIA_DIR = os.getenv("MEDIA_DIR", "./media").strip()
+MEDIA_STORAGE_CHAT = os.getenv("MEDIA_STORAGE_CHAT", "").strip()
+
+async def _media_upload(chat_id, path: str, kind: str) -> Tuple[str, str]:
+    if kind == "photo":
+        msg = await send_with_retry(lambda: bot.send_photo(chat_id, photo=FSInputFile(path), disable_notification=True))
+        f = msg.photo[-1]
+    else:
+        msg = await send_with_retry(lambda: bot.send_document(chat_id, document=FSInputFile(path),
+                                                              disable_notification=True))
+        f = msg.document
+    return f.file_id, f.file_unique_id
+
+media_library = MediaLibrary(pool, _media_upload, storage_chat=MEDIA_STORAGE_CHAT or None)
+
+async def send_media(chat_id, ref: Optional[str], text: str, kb: Optional[InlineKeyboardMarkup] = None) -> Message:
+    """按媒体引用发送：单图 send_photo，相册 send_media_group(相册不能带按钮，按钮另发一条)，无图发文本。"""
+    media: Optional[Media] = await media_library.resolve(ref)
+    if media is None:
+        return await bot.send_message(chat_id, text, reply_markup=kb, disable_web_page_preview=True)
+    if media.kind == "album":
+        group = [InputMediaPhoto(media=fid, caption=text if i == 0 else None) for i, fid in enumerate(media.file_ids)]
+        msgs = await bot.send_media_group(chat_id, media=group)
+        if kb is not None:
+            await bot.send_message(chat_id, "👇", reply_markup=kb)
+        return msgs[0]
+    if media.kind == "document":
+        return await bot.send_document(chat_id, document=media.file_ids[0], caption=text, reply_markup=kb)
+    return await bot.send_photo(chat_id, photo=media.file_ids[0], caption=text, reply_markup=kb)
+
+async def media_ref_from(m: Message) -> Optional[str]:
+    """消息里的图片登记进媒体库并返回 media:<id>；消息是 media:/album: 引用时校验后原样返回。"""
+    if m.photo:
+        p = m.photo[-1]
+        asset = await media_library.add_telegram(p.file_id, p.file_unique_id, "photo", size=p.file_size)
+        return f"media:{asset.id}"
+    if m.document:
+        d = m.document
+        kind = "photo" if (d.mime_type or "").startswith("image/") else "document"
+        asset = await media_library.add_telegram(d.file_id, d.file_unique_id, kind, d.file_name, d.file_size)
+        return f"media:{asset.id}"
+    ref = (m.text or "").strip()
+    return ref if await media_library.check_ref(ref) else None
+
+# ========== 表结构迁移 ==========
+# 版本号存于 PRAGMA user_version；新增/修改表结构时在 MIGRATIONS 末尾追加，已发布的迁移不再改动
+def _m001_baseline(c: sqlite3.Connection) -> None:
+    """首版表结构(引入迁移前 init_db 每次启动都执行的全部建表)；对已有库执行也安全。"""
     cur = c.cursor()
     # 基础表
     cur.execute("CREATE TABLE IF NOT EXISTS settings(key TEXT PRIMARY KEY, value TEXT)")
@@ -126,6 +378,36 @@ def init_db() -> None:
         updated_at DATETIME,
         FOREIGN KEY(category_id) REFERENCES ad_categories(id)
     )""")
+    # 分类过滤 + 按 id 倒序的 keyset 分页
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ads_cat_id ON ads(category_id, id)")
+    # 每分类广告数(category_id=0 表示未分类)，由触发器随 ads 的增删改维护，翻页时不再 COUNT(*)
+    cur.execute("""CREATE TABLE IF NOT EXISTS ad_counts(
+        category_id INTEGER PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0
+    )""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS trg_ads_count_ins AFTER INSERT ON ads BEGIN
+        INSERT INTO ad_counts(category_id, n) VALUES(coalesce(NEW.category_id, 0), 1)
+        ON CONFLICT(category_id) DO UPDATE SET n=n+1;
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS trg_ads_count_del AFTER DELETE ON ads BEGIN
+        UPDATE ad_counts SET n=n-1 WHERE category_id=coalesce(OLD.category_id, 0);
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS trg_ads_count_upd AFTER UPDATE OF category_id ON ads
+        WHEN coalesce(OLD.category_id, 0) != coalesce(NEW.category_id, 0) BEGIN
+        UPDATE ad_counts SET n=n-1 WHERE category_id=coalesce(OLD.category_id, 0);
+        INSERT INTO ad_counts(category_id, n) VALUES(coalesce(NEW.category_id, 0), 1)
+        ON CONFLICT(category_id) DO UPDATE SET n=n+1;
+    END""")
+    # 按实际数据重建一次，兼容触发器创建前已有的数据(此后由触发器维护)
+    cur.execute("DELETE FROM ad_counts")
+    cur.execute("INSERT INTO ad_counts(category_id, n) SELECT coalesce(category_id, 0), COUNT(*) FROM ads GROUP BY 1")
+    SettingsCache.ensure_schema(c)
+    Broadcaster.ensure_schema(c)
+    SQLiteStateStore.ensure_schema(c)
+    StatsRollups.ensure_schema(c)
+    ClickAnalytics.ensure_schema(c)
+    KeywordMenus.ensure_schema(c)
+    AdTemplateStore.ensure_schema(c)
     # 默认设置
     cur.execute("INSERT OR IGNORE INTO settings(key, value) VALUES('default_channel', ?)", (DEFAULT_CHANNEL,))
     # 默认广告分类(如不存在)
@@ -133,60 +415,58 @@ def init_db() -> None:
     if (cur.fetchone()["c"] or 0) == 0:
         cur.executemany("INSERT INTO ad_categories(name, sort) VALUES(?,?)",
                         [("默认", 0), ("活动", 10), ("教程", 20)])
-    c.commit()
-    c.close()
-    logger.info("Database initialized")
+    KeywordMenus.seed(c, CUSTOM_QUERY_MENUS, commit=False)  # 事务由 migrate() 持有，失败整体回滚
+    AdTemplateStore.import_json(c, AD_TEMPLATE_FILE, commit=False)
+
+def _m002_media_library(c: sqlite3.Connection) -> None:
+    MediaLibrary.ensure_schema(c)
+
+def _m003_panel_sync(c: sqlite3.Connection) -> None:
+    PanelSync.ensure_schema(c)
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", _m001_baseline),
+    Migration(2, "media_library", _m002_media_library),
+    Migration(3, "panel_sync", _m003_panel_sync),
+]
+
+def init_db() -> None:
+    """启动时调用：库已是最新版本时只读一次 user_version。"""
+    with pool.connection() as c:
+        r = migrate(c, MIGRATIONS)
+    settings.load()
+    if r["applied"]:
+        logger.info("Database initialized (schema v%d → v%d)", r["from"], r["to"])
 
 def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
-    c = db()
-    try:
-        row = c.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
-        return row["value"] if row else default
-    finally:
-        c.close()
+    return settings.get(key, default)
 
-def set_setting(key: str, value: str) -> None:
-    c = db()
-    try:
-        c.execute("""INSERT INTO settings(key, value) VALUES(?,?)
-                     ON CONFLICT(key) DO UPDATE SET value=excluded.value""", (key, value))
-        c.commit()
-    finally:
-        c.close()
+async def set_setting(key: str, value: str) -> None:
+    await settings.set(key, value)
 
-def panel_get(chat_id: int) -> Optional[int]:
-    c = db()
-    try:
-        row = c.execute("SELECT message_id FROM panels WHERE chat_id=?", (chat_id,)).fetchone()
-        return row["message_id"] if row else None
-    finally:
-        c.close()
+async def panel_get(chat_id: int) -> Optional[int]:
+    row = await pool.fetchone("SELECT message_id FROM panels WHERE chat_id=?", (chat_id,))
+    return row["message_id"] if row else None
 
-def panel_set(chat_id: int, message_id: int) -> None:
-    c = db()
-    try:
-        c.execute("""INSERT INTO panels(chat_id, message_id) VALUES(?,?)
-                     ON CONFLICT(chat_id) DO UPDATE SET message_id=excluded.message_id, updated_at=CURRENT_TIMESTAMP""",
-                  (chat_id, message_id))
-        c.commit()
-    finally:
-        c.close()
+async def panel_set(chat_id: int, message_id: int, digest: Optional[str] = None) -> None:
+    # digest：刚发布的面板内容哈希，之后内容不变时 panel_sync 不会再编辑它
+    await pool.execute("""INSERT INTO panels(chat_id, message_id, content_hash, sync_status, synced_at)
+                          VALUES(?,?,?,'ok',CURRENT_TIMESTAMP)
+                          ON CONFLICT(chat_id) DO UPDATE SET message_id=excluded.message_id,
+                              content_hash=excluded.content_hash, sync_status='ok', sync_error=NULL,
+                              synced_at=CURRENT_TIMESTAMP, updated_at=CURRENT_TIMESTAMP""",
+                       (chat_id, message_id, digest))
 
-def panel_del(chat_id: int) -> None:
-    c = db()
-    try:
-        c.execute("DELETE FROM panels WHERE chat_id=?", (chat_id,))
-        c.commit()
-    finally:
-        c.close()
+async def panel_del(chat_id: int) -> None:
+    await pool.execute("DELETE FROM panels WHERE chat_id=?", (chat_id,))
 
 # ========== 权限 ==========
 def owners_get() -> Set[int]:
     v = get_setting("owners", "") or ""
     return {int(x) for x in v.split(",") if x.strip().isdigit()}
 
-def owners_set(s: Set[int]) -> None:
-    set_setting("owners", ",".join(str(x) for x in sorted(s)))
+async def owners_set(s: Set[int]) -> None:
+    await set_setting("owners", ",".join(str(x) for x in sorted(s)))
 
 def is_owner(uid: int) -> bool:
     s = owners_get()
@@ -205,7 +485,7 @@ async def cmd_owner_add(m: Message):
     parts = m.text.split()
     if len(parts) < 2 or not parts[1].isdigit():
         return await m.reply("用法：/owner_add 123456789")
-    s = owners_get(); s.add(int(parts[1])); owners_set(s)
+    s = owners_get(); s.add(int(parts[1])); await owners_set(s)
     await m.reply("✅ 已添加。")
 
 @dp.message(Command("owner_del"))
@@ -216,7 +496,7 @@ async def cmd_owner_del(m: Message):
     if len(parts) < 2 or not parts[1].isdigit():
         return await m.reply("用法：/owner_del 123456789")
     s = owners_get(); uid = int(parts[1])
-    if uid in s: s.remove(uid); owners_set(s); await m.reply("✅ 已移除。")
+    if uid in s: s.remove(uid); await owners_set(s); await m.reply("✅ 已移除。")
     else: await m.reply("该用户不在 OWNER 列表。")
 
 # ========== 默认按钮与链接 ==========
@@ -243,7 +523,7 @@ LINK_KEYS_DEFAULT: Dict[str, str] = {
 }
 
 def get_setting_cached(key: str, default: Optional[str] = None) -> str:
-    return get_setting(key, default)
+    return settings.get(key, default)
 
 def btn_text(key: str) -> str:
     return get_setting_cached(key, BUTTON_KEYS_DEFAULT.get(key, key))
@@ -252,23 +532,33 @@ def link_get(key: str) -> str:
     return get_setting_cached(key, LINK_KEYS_DEFAULT.get(key, ""))
 
 # ========== 链接与索引 ==========
-LINKS: Dict[str, str] = {
+class SettingLinks(dict):
+    """固定链接存为普通键值；可在后台修改的链接(settings 表)在访问时才读取，导入模块时不查库。"""
+
+    def __init__(self, fixed: Dict[str, str], from_settings: Dict[str, str]):
+        super().__init__(fixed)
+        self.from_settings = from_settings  # 链接名 → 设置键
+
+    def __getitem__(self, key: str) -> str:
+        if key in self.from_settings:
+            return link_get(self.from_settings[key])
+        return super().__getitem__(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.from_settings or super().__contains__(key)
+
+LINKS = SettingLinks({
     "main_channel": "https://t.me/BLQnX6H5oBgyZjhl",
     "contact_cards": "https://t.me/HYZFzuanshi",
     "contact_fleet": "https://t.me/HUIYINGFUWA",
-    "guide_coop": link_get("guide_coop"),
     "hub_baibao": "https://t.me/BLQnX6H5oBgyZjhl/738",
     "hub_course": "https://t.me/BLQnX6H5oBgyZjhl/133",
     "tpl_ag": "https://t.me/BLQnX6H5oBgyZjhl/138",
     "tpl_hz": "https://t.me/BLQnX6H5oBgyZjhl/139",
     "corp_standard": "https://t.me/BLQnX6H5oBgyZjhl/831",
-    "tool_aircharge_pic": link_get("tool_aircharge_pic"),
-    "tool_aircharge_video": link_get("tool_aircharge_pic"),
-    "tool_ysf_query": link_get("tool_ysf_query"),
-    "tool_nx_cert": link_get("tool_nx_cert"),
-    "tool_nx_north": link_get("tool_nx_north"),
-    "flow_measure": link_get("flow_measure"),
-    "flow_depart": link_get("flow_depart"),
     "docking_newbie": "https://t.me/BLQnX6H5oBgyZjhl/125",
     "rule_settlement": "https://t.me/BLQnX6H5oBgyZjhl/124",
     "rule_fleet": "https://t.me/BLQnX6H5oBgyZjhl/871",
@@ -370,7 +660,16 @@ LINKS: Dict[str, str] = {
     "zhejiang_nsh": "https://t.me/BLQnX6H5oBgyZjhl/638",
     "zhangjiakou_bank": "https://t.me/c/2025069980/414",
     "zhongyuan_bank": "https://t.me/c/2025069980/449",
-}
+}, {
+    "guide_coop": "guide_coop",
+    "tool_aircharge_pic": "tool_aircharge_pic",
+    "tool_aircharge_video": "tool_aircharge_pic",
+    "tool_ysf_query": "tool_ysf_query",
+    "tool_nx_cert": "tool_nx_cert",
+    "tool_nx_north": "tool_nx_north",
+    "flow_measure": "flow_measure",
+    "flow_depart": "flow_depart",
+})
 
 INDEX_AZ: Dict[str, List[Tuple[str, str]]] = {
     "A": [("安徽农信", LINKS.get("anhui_nx", ""))],
@@ -435,6 +734,34 @@ BANK_DETAIL: Dict[str, List[Tuple[str, str]]] = {
     "华夏银行": [("本行专题", LINKS.get("hxb_topic", ""))],
 }
 
+# 国家大行常用简称(查询时与全称等价)
+BANK_ALIASES: Dict[str, List[str]] = {
+    "中国银行": ["中行"],
+    "建设银行": ["建行"],
+    "工商银行": ["工行"],
+    "农业银行": ["农行"],
+    "邮政银行": ["邮储", "邮储银行", "邮政储蓄"],
+    "交通银行": ["交行"],
+    "招商银行": ["招行"],
+    "浦发银行": ["浦东发展银行"],
+    "光大银行": ["光大"],
+    "中信银行": ["中信"],
+}
+
+# ========== 查询索引 ==========
+search_index = SearchIndex()
+
+def build_search_index() -> None:
+    """按 BANK_DETAIL/INDEX_AZ 增量同步查询索引；数据变动后重复调用即可。"""
+    entries = [(name, ("bank", "")) for name in BANK_DETAIL]
+    entries += [(name, ("az", url)) for items in INDEX_AZ.values() for name, url in items]
+    changed, removed = search_index.sync(entries)
+    for name, aliases in BANK_ALIASES.items():
+        for a in aliases:
+            search_index.add_alias(a, name)
+    if changed or removed:
+        logger.info("Search index synced: %d changed, %d removed, %d total", changed, removed, len(search_index))
+
 # ========== 内部工具 ==========
 async def safe_edit(message, text: str, reply_markup: InlineKeyboardMarkup) -> None:
     try:
@@ -443,6 +770,15 @@ async def safe_edit(message, text: str, reply_markup: InlineKeyboardMarkup) -> N
         if "message is not modified" not in str(e).lower():
             raise
 
+# 每条消息当前显示的视图摘要：连点同一按钮时不再 editMessageText，同一消息的连续编辑只发最新一次
+render_cache = RenderCache(maxsize=int(os.getenv("RENDER_CACHE_SIZE", "50000")))
+
+def view_key(cq: CallbackQuery):
+    if cq.message:
+        return cq.message.chat.id, cq.message.message_id
+    return cq.inline_message_id
+
+@metrics.timed("swap_view")
 async def swap_view(cq: CallbackQuery, text: str, kb: InlineKeyboardMarkup) -> None:
     # ACK 回调优先，避免 'query is too old'
     try:
@@ -450,45 +786,66 @@ async def swap_view(cq: CallbackQuery, text: str, kb: InlineKeyboardMarkup) -> N
     except Exception:
         pass
 
-    # 尝试编辑原消息；失败则发新消息兜底
-    try:
-        if cq.message:
-            await safe_edit(cq.message, text, kb)
-        else:
-            try:
-                await bot.edit_message_text(
-                    text=text,
-                    inline_message_id=cq.inline_message_id,
-                    reply_markup=kb,
-                    disable_web_page_preview=True,
-                )
-            except TelegramBadRequest:
-                await bot.edit_message_caption(
-                    caption=text,
-                    inline_message_id=cq.inline_message_id,
-                    reply_markup=kb,
-                )
-    except Exception:
-        try:
-            chat_id = cq.message.chat.id if (getattr(cq, "message", None) and cq.message.chat) else cq.from_user.id
-        except Exception:
-            chat_id = cq.from_user.id
+    async def edit() -> bool:
+        # 尝试编辑原消息；失败则发新消息兜底(此时原消息内容未知，返回 False 不记录)
         try:
-            await bot.send_message(chat_id, text, reply_markup=kb, disable_web_page_preview=True)
+            if cq.message:
+                await safe_edit(cq.message, text, kb)
+                if cq.message.chat.type != "private":
+                    # 可能是频道面板被原地换成了子菜单：清掉面板哈希，后台同步下一轮把它恢复成面板
+                    await panel_sync.invalidate(cq.message.chat.id, cq.message.message_id)
+            else:
+                try:
+                    await bot.edit_message_text(
+                        text=text,
+                        inline_message_id=cq.inline_message_id,
+                        reply_markup=kb,
+                        disable_web_page_preview=True,
+                    )
+                except TelegramBadRequest:
+                    await bot.edit_message_caption(
+                        caption=text,
+                        inline_message_id=cq.inline_message_id,
+                        reply_markup=kb,
+                    )
+            return True
         except Exception:
-            pass
+            try:
+                chat_id = cq.message.chat.id if (getattr(cq, "message", None) and cq.message.chat) else cq.from_user.id
+            except Exception:
+                chat_id = cq.from_user.id
+            try:
+                await bot.send_message(chat_id, text, reply_markup=kb, disable_web_page_preview=True)
+            except Exception:
+                pass
+            return False
+
+    key = view_key(cq)
+    if key is None:
+        await edit()
+    else:
+        await render_cache.submit(key, render_cache.digest(text, kb), edit)
 
 
-async def ensure_followed(user_id: int) -> bool:
-    chan = get_setting("default_channel", DEFAULT_CHANNEL)
+async def _fetch_followed(chan: str, user_id: int) -> bool:
     try:
         member = await bot.get_chat_member(chan, user_id)
-        st = getattr(member, "status", "")
-        return st in ("member", "administrator", "creator")
-    except TelegramNetworkError:
-        return False
-    except Exception:
-        return False
+    except TelegramBadRequest:
+        return False  # 用户/频道不存在：按未关注缓存
+    return is_member_status(getattr(member, "status", ""))
+
+# 关注状态缓存：已关注 FOLLOW_TTL 秒、未关注 FOLLOW_NEG_TTL 秒；网络异常沿用旧结果；
+# 点"我已关注"时每 FOLLOW_RECHECK_INTERVAL 秒最多重查一次"未关注"
+follow_cache = MembershipCache(
+    _fetch_followed,
+    positive_ttl=float(os.getenv("FOLLOW_TTL", "600")),
+    negative_ttl=float(os.getenv("FOLLOW_NEG_TTL", "30")),
+    recheck_interval=float(os.getenv("FOLLOW_RECHECK_INTERVAL", "5")),
+)
+
+async def ensure_followed(user_id: int, recheck: bool = False) -> bool:
+    chan = get_setting("default_channel", DEFAULT_CHANNEL)
+    return await follow_cache.is_member(chan, user_id, recheck=recheck)
 
 def follow_gate_kb() -> InlineKeyboardMarkup:
     chan_url = link_get("link_follow") or LINKS.get("main_channel", "")
@@ -500,6 +857,7 @@ def follow_gate_kb() -> InlineKeyboardMarkup:
 
 # ========== 键盘 ==========
 
+@keyboards.memo
 def shares_bank_menu() -> InlineKeyboardMarkup:
     names = ["招商银行","浦发银行","中信银行","民生银行","光大银行","华夏银行","广发银行","平安银行"]
     rows, row = [], []
@@ -532,6 +890,7 @@ def rcc_index_menu() -> InlineKeyboardMarkup:
     ])
 
 
+@keyboards.memo
 def main_menu() -> InlineKeyboardMarkup:
     kb = [
         [InlineKeyboardButton(text=btn_text("btn_follow"), url=link_get("link_selfcheck")),
@@ -543,6 +902,7 @@ def main_menu() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
+@keyboards.memo
 def idx_home_menu() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="国家大行", callback_data="big_bank_list")],
@@ -552,6 +912,7 @@ def idx_home_menu() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text=btn_text("btn_contact"), callback_data="contact_menu")],
     ])
 
+@keyboards.memo
 def idx_page(range_key: str, letter: str) -> InlineKeyboardMarkup:
     items = INDEX_AZ.get(letter, [])
     rows: List[List[InlineKeyboardButton]] = []
@@ -573,6 +934,7 @@ def idx_page(range_key: str, letter: str) -> InlineKeyboardMarkup:
     rows.append([InlineKeyboardButton(text=btn_text("btn_contact"), callback_data="contact_menu")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+@keyboards.memo
 def big_bank_menu() -> InlineKeyboardMarkup:
     rows: List[List[InlineKeyboardButton]] = []
     tmp: List[InlineKeyboardButton] = []
@@ -585,6 +947,7 @@ def big_bank_menu() -> InlineKeyboardMarkup:
     rows.append([InlineKeyboardButton(text=btn_text("btn_contact"), callback_data="contact_menu")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+@keyboards.memo
 def bank_detail_menu(bank_name: str) -> InlineKeyboardMarkup:
     details = BANK_DETAIL.get(bank_name, [])
     rows: List[List[InlineKeyboardButton]] = [[InlineKeyboardButton(text=name, url=url)] for name, url in details]
@@ -593,6 +956,7 @@ def bank_detail_menu(bank_name: str) -> InlineKeyboardMarkup:
     rows.append([InlineKeyboardButton(text=btn_text("btn_contact"), callback_data="contact_menu")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+@keyboards.memo
 def tools_home_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="空充图片演示", url=LINKS["tool_aircharge_pic"]),
@@ -613,6 +977,7 @@ def tools_home_kb() -> InlineKeyboardMarkup:
          InlineKeyboardButton(text=btn_text("btn_contact"), callback_data="contact_menu")],
     ])
 
+@keyboards.memo
 def cooperation_info_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="【新·结算规则】", url=LINKS.get("rule_settlement", ""))],
@@ -624,6 +989,7 @@ def cooperation_info_kb() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text=btn_text("btn_contact"), callback_data="contact_menu")],
     ])
 
+@keyboards.memo
 def contact_menu_kb() -> InlineKeyboardMarkup:
     defaults = [
         ("💳 阿宝(卡商)", "https://t.me/fyzf168858"),
@@ -661,104 +1027,91 @@ class EditAd(StatesGroup):
     value = State()
     cat = State()
 
-def categories_list() -> List[sqlite3.Row]:
-    c = db()
-    try:
-        return c.execute("SELECT id,name,sort FROM ad_categories ORDER BY sort ASC, id ASC").fetchall()
-    finally:
-        c.close()
+async def categories_list() -> List[sqlite3.Row]:
+    return await pool.fetchall("SELECT id,name,sort FROM ad_categories ORDER BY sort ASC, id ASC")
 
-def ad_count(cat_id: Optional[int] = None) -> int:
-    c = db()
-    try:
-        if cat_id:
-            row = c.execute("SELECT COUNT(*) AS c FROM ads WHERE category_id=?", (cat_id,)).fetchone()
-        else:
-            row = c.execute("SELECT COUNT(*) AS c FROM ads").fetchone()
-        return row["c"] or 0
-    finally:
-        c.close()
-
-def ads_page(page: int, per: int = 10, cat_id: Optional[int] = None) -> List[sqlite3.Row]:
-    off = (max(page, 1) - 1) * per
-    c = db()
-    try:
-        if cat_id:
-            return c.execute("""SELECT a.*, coalesce(c.name,'未分类') as cat_name
-                                FROM ads a LEFT JOIN ad_categories c ON a.category_id=c.id
-                                WHERE a.category_id=? ORDER BY a.id DESC LIMIT ? OFFSET ?""",
-                             (cat_id, per, off)).fetchall()
-        return c.execute("""SELECT a.*, coalesce(c.name,'未分类') as cat_name
-                            FROM ads a LEFT JOIN ad_categories c ON a.category_id=c.id
-                            ORDER BY a.id DESC LIMIT ? OFFSET ?""", (per, off)).fetchall()
-    finally:
-        c.close()
-
-def ad_add(title: str, caption: str, url: str, photo_file_id: str, category_id: Optional[int]) -> int:
-    c = db()
-    try:
-        cur = c.cursor()
-        cur.execute("""INSERT INTO ads(title, caption, url, photo_file_id, category_id, active)
-                       VALUES(?,?,?,?,?,1)""", (title, caption, url, photo_file_id, category_id))
-        c.commit()
-        return cur.lastrowid
-    finally:
-        c.close()
-
-def ad_get(ad_id: int) -> Optional[sqlite3.Row]:
-    c = db()
-    try:
-        return c.execute("""SELECT a.*, coalesce(c.name,'未分类') as cat_name
-                            FROM ads a LEFT JOIN ad_categories c ON a.category_id=c.id
-                            WHERE a.id=?""", (ad_id,)).fetchone()
-    finally:
-        c.close()
+async def ad_count(cat_id: Optional[int] = None) -> int:
+    if cat_id:
+        row = await pool.fetchone("SELECT n AS c FROM ad_counts WHERE category_id=?", (cat_id,))
+    else:
+        row = await pool.fetchone("SELECT SUM(n) AS c FROM ad_counts")
+    return (row["c"] or 0) if row else 0
 
-def ad_update(ad_id: int, **kwargs) -> None:
+async def ads_page(per: int = 10, cat_id: Optional[int] = None, before: int = 0, after: int = 0) -> List[sqlite3.Row]:
+    """
+    keyset 分页(按 id 倒序)：before>0 取 id<before 的一页(下一页)，after>0 取 id>after 的一页(上一页)，
+    都为 0 时取第一页。多取 1 行用于判断该方向是否还有更多；返回结果统一按 id 倒序。
+    """
+    where, params = [], []
+    if cat_id:
+        where.append("a.category_id=?"); params.append(cat_id)
+    if after:
+        where.append("a.id>?"); params.append(after)
+    elif before:
+        where.append("a.id<?"); params.append(before)
+    sql = f"""SELECT a.*, coalesce(c.name,'未分类') as cat_name
+              FROM ads a LEFT JOIN ad_categories c ON a.category_id=c.id
+              {"WHERE " + " AND ".join(where) if where else ""}
+              ORDER BY a.id {"ASC" if after else "DESC"} LIMIT ?"""
+    rows = await pool.fetchall(sql, (*params, per + 1))
+    if after:
+        # 上一页：离游标最近的 per 行，多出的那行(id 最大)说明前面还有
+        rows = rows[:per][::-1] + rows[per:]
+    return rows
+
+async def ad_add(title: str, caption: str, url: str, photo_file_id: str, category_id: Optional[int]) -> int:
+    return await pool.execute("""INSERT INTO ads(title, caption, url, photo_file_id, category_id, active)
+                                 VALUES(?,?,?,?,?,1)""", (title, caption, url, photo_file_id, category_id))
+
+async def ad_get(ad_id: int) -> Optional[sqlite3.Row]:
+    return await pool.fetchone("""SELECT a.*, coalesce(c.name,'未分类') as cat_name
+                                  FROM ads a LEFT JOIN ad_categories c ON a.category_id=c.id
+                                  WHERE a.id=?""", (ad_id,))
+
+async def ad_update(ad_id: int, **kwargs) -> None:
     if not kwargs: return
     cols = ", ".join(f"{k}=?" for k in kwargs.keys())
     vals = list(kwargs.values())
     vals.append(ad_id)
-    c = db()
-    try:
-        c.execute(f"UPDATE ads SET {cols}, updated_at=CURRENT_TIMESTAMP WHERE id=?", vals)
-        c.commit()
-    finally:
-        c.close()
+    await pool.execute(f"UPDATE ads SET {cols}, updated_at=CURRENT_TIMESTAMP WHERE id=?", vals)
 
-def ad_del(ad_id: int) -> None:
-    c = db()
-    try:
-        c.execute("DELETE FROM ads WHERE id=?", (ad_id,))
-        c.commit()
-    finally:
-        c.close()
+async def ad_del(ad_id: int) -> None:
+    await pool.execute("DELETE FROM ads WHERE id=?", (ad_id,))
 
-def kb_ad_list(page: int, total: int, cat_id: Optional[int]) -> InlineKeyboardMarkup:
+async def kb_ad_list(page: int, cat_id: Optional[int], cursor: int = 0, back: bool = False) -> InlineKeyboardMarkup:
+    """
+    广告列表键盘。翻页按钮的 callback_data 为 ad:list:{分类}:{页码}:{n|p}{游标id}，
+    n=取 id<游标 的下一页，p=取 id>游标 的上一页；页码只用于标题显示和判断是否有上一页。
+    """
     per = 10
     rows: List[List[InlineKeyboardButton]] = []
     # 行：每条广告一个“查看 #id”按钮(最多10条)
-    data = ads_page(page, per, cat_id)
+    data = await ads_page(per, cat_id, after=cursor) if back else await ads_page(per, cat_id, before=cursor)
+    if back:
+        has_prev, has_next = len(data) > per, True
+        page = max(page, 2) if has_prev else 1  # 期间有新增/删除时以实际数据校正页码
+    else:
+        has_prev, has_next = page > 1, len(data) > per
+    data = data[:per]
     for r in data:
         rows.append([InlineKeyboardButton(text=f"#{r['id']} {'✅' if r['active'] else '❌'} [{r['cat_name']}] {r['title'][:14]}",
                                           callback_data=f"ad:preview:{r['id']}")])
     # 分页与操作
-    total_pages = (total + per - 1) // per if total else 1
     nav = []
-    if page > 1:
-        nav.append(InlineKeyboardButton(text="⬅ 上一页", callback_data=f"ad:list:{cat_id or 0}:{page-1}"))
-    if page < total_pages:
-        nav.append(InlineKeyboardButton(text="下一页 ➡", callback_data=f"ad:list:{cat_id or 0}:{page+1}"))
+    if data and has_prev:
+        nav.append(InlineKeyboardButton(text="⬅ 上一页", callback_data=f"ad:list:{cat_id or 0}:{page-1}:p{data[0]['id']}"))
+    if data and has_next:
+        nav.append(InlineKeyboardButton(text="下一页 ➡", callback_data=f"ad:list:{cat_id or 0}:{page+1}:n{data[-1]['id']}"))
     if nav: rows.append(nav)
     rows.append([InlineKeyboardButton(text="🆕 新建广告", callback_data="ad:new"),
                  InlineKeyboardButton(text="筛选分类", callback_data="ad:cats")])
     rows.append([InlineKeyboardButton(text="返回首页", callback_data="go_home")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
-def kb_cats_for_pick(mode: str) -> InlineKeyboardMarkup:
+async def kb_cats_for_pick(mode: str) -> InlineKeyboardMarkup:
     """mode=filter/pick"""
     rows: List[List[InlineKeyboardButton]] = []
-    cats = categories_list()
+    cats = await categories_list()
     if mode == "filter":
         rows.append([InlineKeyboardButton(text="全部", callback_data="adcat:filter:0")])
     for r in cats:
@@ -817,6 +1170,9 @@ WELCOME_TEXT = (
 
 @dp.message(Command("start", "menu"))
 async def cmd_start(m: Message):
+    user = m.from_user
+    logger.info("[START] %s %s (%s)", user.id, user.full_name, user.username,
+                extra={"event": "start", "user_id": user.id})
     parts = (m.text or "").split(maxsplit=1)
     if len(parts) > 1 and parts[1].strip().lower() == "gate":
         if await ensure_followed(m.from_user.id):
@@ -825,14 +1181,10 @@ async def cmd_start(m: Message):
             await m.answer("请先关注频道后再继续：", reply_markup=follow_gate_kb(), disable_web_page_preview=True)
         return
     # 记录用户
-    c = db()
-    try:
-        c.execute("INSERT OR IGNORE INTO user_meta(user_id, username, first_seen) VALUES(?,?,?)",
-                  (m.from_user.id, (m.from_user.username or m.from_user.full_name), datetime.datetime.now()))
-        c.commit()
-    finally:
-        c.close()
-    await m.answer(WELCOME_TEXT, reply_markup=main_menu(), disable_web_page_preview=True)
+    writer.submit("user_meta", (m.from_user.id, (m.from_user.username or m.from_user.full_name), datetime.datetime.now()))
+    kb = main_menu()
+    sent = await m.answer(WELCOME_TEXT, reply_markup=kb, disable_web_page_preview=True)
+    render_cache.remember((sent.chat.id, sent.message_id), render_cache.digest(WELCOME_TEXT, kb))
 
 @dp.message(Command("help"))
 async def cmd_help(m: Message):
@@ -843,9 +1195,12 @@ async def cmd_help(m: Message):
         "/set_btn 键 新文本(btn_follow/btn_index/btn_tools/btn_newcoin/btn_coop/btn_contact)\n"
         "/set_link 键 URL(link_selfcheck/link_follow/link_newcoin/tool_ysf_query 等)\n"
         "/set_channel @xxx 或 -100xxxx\n"
-        "/post_panel | /update_panel | /del_panel\n"
-        "/save_adpic(回复图片) | /set_adtext 文案 | /ad -100xxxx\n"
-        "/admgr(广告管理) | /stats | /dump_settings | /load_settings(回复 JSON) | /export_db | /ping"
+        "/post_panel | /update_panel [目标] | /del_panel | /sync_panels [force] | /panels — 频道面板\n"
+        "/save_adpic(回复图片或 media:ID / album:名称) | /set_adtext 文案 | /ad -100xxxx\n"
+        "/media_add 文件名 | /media_sync | /media_list | /album_set 名称 ID ID ... | /album_list — 媒体库\n"
+        "/bc_ad 广告ID [users|@频道 ...] | /bc_status [任务ID] | /bc_cancel 任务ID\n"
+        "/kw_list | /kw_show 名称 | /kw_set JSON(或回复 JSON) | /kw_del 名称 — 关键词菜单\n"
+        "/admgr(广告管理) | /stats [天数] | /stats_backfill | /dump_settings | /load_settings(回复 JSON) | /export_db [表名 jsonl|csv] | /ping"
     )
     await m.reply(msg, disable_web_page_preview=True)
 
@@ -861,7 +1216,7 @@ async def cmd_set_btn(m: Message):
         return await m.reply("键无效。")
     if len(val) > 32 or "\n" in val:
         return await m.reply("建议<=32字且不含换行。")
-    set_setting(key, val)
+    await set_setting(key, val)
     await m.reply(f"✅ 已更新 {key} → {val}\n预览：", reply_markup=main_menu(), disable_web_page_preview=True)
 
 @dp.message(Command("set_link"))
@@ -870,7 +1225,7 @@ async def cmd_set_link(m: Message):
     parts = m.text.split(" ", 2)
     if len(parts) < 3: return await m.reply("用法:/set_link 键 URL")
     key, val = parts[1], parts[2].strip()
-    set_setting(key, val)
+    await set_setting(key, val)
     await m.reply(f"✅ 已更新 {key}")
 
 @dp.message(Command("set_channel"))
@@ -878,7 +1233,7 @@ async def cmd_set_channel(m: Message):
     if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
     parts = m.text.split(" ", 1)
     if len(parts) < 2: return await m.reply("用法:/set_channel @频道用户名 或 -100xxxx")
-    set_setting("default_channel", parts[1].strip())
+    await set_setting("default_channel", parts[1].strip())
     await m.reply("✅ 已更新默认频道。")
 
 # 放在其它 @dp.message(...) 之前更稳妥
@@ -888,55 +1243,29 @@ async def on_query_kw(m: types.Message):
     kw = re.search(r"^(?:查询|查)\s*(.+)$", m.text, re.I).group(1).strip()
 
     # 记查询日志(可选)
-    try:
-        conn = sqlite3.connect(DB_FILE, timeout=10)
-        conn.execute(
-            "INSERT INTO query_log(user_id, keyword, created_at) VALUES(?,?,?)",
-            (m.from_user.id, kw, datetime.datetime.now()),
-        )
-        conn.commit()
-    except Exception:
-        pass
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
-
-    # 命中国家大行二级(支持简称)
-    kw_norm = normalize_keyword(kw)
-    for bank_name in BANK_DETAIL.keys():
-        bn = bank_name.lower()
-        if kw.lower() in bn or (kw_norm and kw_norm in bn):
-            await m.reply(
-                f"查询结果：<b>{bank_name}</b>\n请选择入口：",
-                reply_markup=build_bank_detail_kb(bank_name),
-                disable_web_page_preview=True,
-            )
-            return
+    writer.submit("query_log", (m.from_user.id, kw, datetime.datetime.now()))
 
-    # A-Z 模糊(忽略“银行”二字)
-    kw_s = kw.lower().replace("银行", "")
-    hits = sorted({
-        name for lst in INDEX_AZ.values()
-        for name, _ in lst
-        if kw_s in name.lower().replace("银行","")
-    })
+    # 索引检索(全称/简称/拼音首字母/模糊)，结果按相关度排序
+    if not search_index:
+        build_search_index()
+    hits = search_index.search(kw, limit=20)
 
     if not hits:
         await m.reply("未找到相关条目。示例：<code>查询 中国银行</code> 或 <code>查询 成都</code>")
         return
 
-    if len(hits) == 1 and hits[0] in BANK_DETAIL:
+    # 命中国家大行二级(支持简称)
+    top = hits[0]
+    if top.payload[0] == "bank" and (top.score >= SCORE_CONTAINS or len(hits) == 1):
         await m.reply(
-            f"查询结果：<b>{hits[0]}</b>\n请选择入口：",
-            reply_markup=build_bank_detail_kb(hits[0]),
+            f"查询结果：<b>{top.name}</b>\n请选择入口：",
+            reply_markup=build_bank_detail_kb(top.name),
             disable_web_page_preview=True,
         )
         return
 
     await m.reply(
-        "匹配到多项：\n" + "\n".join(f"- <code>{x}</code>" for x in hits[:20]),
+        "匹配到多项：\n" + "\n".join(f"- <code>{h.name}</code>" for h in hits),
         disable_web_page_preview=True,
     )
 
@@ -950,8 +1279,9 @@ async def cmd_post_panel(m: Message):
     parts = m.text.split(maxsplit=1)
     target = parts[1].strip() if len(parts) > 1 else get_setting("default_channel", DEFAULT_CHANNEL)
     try:
-        sent = await bot.send_message(target, WELCOME_TEXT, reply_markup=main_menu(), disable_web_page_preview=True)
-        chat = await bot.get_chat(target); panel_set(chat.id, sent.message_id)
+        text, kb, digest = panel_sync.current()
+        sent = await bot.send_message(target, text, reply_markup=kb, disable_web_page_preview=True)
+        await panel_set(sent.chat.id, sent.message_id, digest)
         await m.reply(f"已发布到 {target} (msg_id={sent.message_id})，请去频道置顶。")
     except Exception as e:
         await m.reply(f"发布失败: {e}")
@@ -966,14 +1296,36 @@ async def cmd_update_panel(m: Message):
     except Exception:
         try: chat_id = int(target)
         except Exception: return await m.reply("目标无效。用法: /update_panel @channel 或 /update_panel -100xxx")
-    msg_id = panel_get(chat_id)
+    msg_id = await panel_get(chat_id)
     if not msg_id: return await m.reply("未找到面板记录，请先 /post_panel")
-    try:
-        await bot.edit_message_text(chat_id=chat_id, message_id=msg_id, text=WELCOME_TEXT,
-                                    reply_markup=main_menu(), disable_web_page_preview=True)
-        await m.reply("已更新频道面板。")
-    except Exception as e:
-        await m.reply(f"更新失败: {e}")
+    r = await panel_sync.sync([chat_id], force=True)  # 显式指定目标：不看哈希，总是重编辑
+    if r["failed"]:
+        row = next(x for x in await panel_sync.status() if x["chat_id"] == chat_id)
+        return await m.reply(f"更新失败({row['sync_status']}): {html.escape(row['sync_error'] or '')}")
+    await m.reply("已更新频道面板。")
+
+@dp.message(Command("sync_panels"))
+async def cmd_sync_panels(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    force = (m.text or "").split()[1:2] == ["force"]
+    r = await panel_sync.sync(force=force)
+    await m.reply(f"✅ 面板同步：共 {r['total']} 个，编辑 {r['edited']}，无变化 {r['unchanged']}，"
+                  f"失败 {r['failed']}，用时 {r['seconds']:.1f}s" + ("\n/panels 查看失败原因" if r["failed"] else ""))
+
+@dp.message(Command("panels"))
+async def cmd_panels(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    rows = await panel_sync.status()
+    if not rows: return await m.reply("暂无面板记录。/post_panel 发布")
+    current = panel_sync.current()[2]
+    lines = []
+    for r in rows:
+        state = r["sync_status"] or "未同步"
+        if state == "ok" and r["content_hash"] != current:
+            state = "待同步"
+        err = f" · {html.escape(r['sync_error'][:80])}" if r["sync_error"] and r["sync_status"] != "ok" else ""
+        lines.append(f"<code>{r['chat_id']}</code> msg {r['message_id']} · {state} · {r['synced_at'] or '-'}{err}")
+    await m.reply("📌 频道面板：\n" + "\n".join(lines))
 
 @dp.message(Command("del_panel"))
 async def cmd_del_panel(m: Message):
@@ -985,26 +1337,35 @@ async def cmd_del_panel(m: Message):
     except Exception:
         try: chat_id = int(target)
         except Exception: return await m.reply("目标无效。用法: /del_panel @channel 或 /del_panel -100xxx")
-    panel_del(chat_id); await m.reply("✅ 已删除面板记录。")
+    await panel_del(chat_id); await m.reply("✅ 已删除面板记录。")
 
 # 快捷广告投放
 @dp.message(Command("save_adpic"))
 async def cmd_save_adpic(m: Message):
     if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
-    if not m.reply_to_message or not (m.reply_to_message.photo or m.reply_to_message.document):
-        return await m.reply("请“回复一张图片/海报”再发送 /save_adpic")
-    file_id = (m.reply_to_message.photo[-1].file_id if m.reply_to_message.photo else m.reply_to_message.document.file_id)
-    set_setting("ad_photo_file_id", file_id)
-    await m.reply("✅ 已保存广告图片 file_id。之后可用 /ad -100xxxxxxxx 或 /ad @群用户名 发送。")
+    parts = (m.text or "").split(maxsplit=1)
+    if len(parts) > 1:
+        ref = parts[1].strip() if await media_library.check_ref(parts[1].strip()) else None
+    elif m.reply_to_message and (m.reply_to_message.photo or m.reply_to_message.document):
+        ref = await media_ref_from(m.reply_to_message)
+    else:
+        return await m.reply("请“回复一张图片/海报”再发送 /save_adpic，或 /save_adpic media:ID / album:名称")
+    if not ref:
+        return await m.reply("❌ 媒体不存在。/media_list 查看素材，/album_list 查看相册")
+    await set_setting("ad_photo_file_id", ref)
+    await m.reply(f"✅ 已保存广告图片({ref})。之后可用 /ad -100xxxxxxxx 或 /ad @群用户名 发送。")
 
 @dp.message(Command("set_adtext"))
 async def cmd_set_adtext(m: Message):
     if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
     parts = m.text.split(" ", 1)
     if len(parts) < 2: return await m.reply("用法：/set_adtext 广告文案")
-    set_setting("ad_text", parts[1].strip())
+    await set_setting("ad_text", parts[1].strip())
     await m.reply("✅ 已设置广告文案。")
 
+# /ad 发送的是设置里的文案/图片广告，曝光与按钮点击(ad_contact/ad_close)按此 ID 统计
+SETTINGS_AD_ID = "default"
+
 @dp.message(Command("ad"))
 async def cmd_send_ad(m: Message):
     if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
@@ -1016,44 +1377,91 @@ async def cmd_send_ad(m: Message):
     kb = ad_menu()
     # ...existing code...
     try:
-        if file_id:
-            await bot.send_photo(chat_id=target, photo=file_id, caption=caption, reply_markup=kb, parse_mode=ParseMode.HTML)
-        else:
-            await bot.send_message(chat_id=target, text=caption, reply_markup=kb, parse_mode=ParseMode.HTML)
+        await send_with_retry(lambda: send_media(target, file_id, caption, kb), bucket=broadcaster.bucket)
+        click_analytics.impression(SETTINGS_AD_ID, target)
         await m.reply("✅ 已尝试发送广告。")
     except Exception as e:
         await m.reply(f"❌ 发送失败: {e}\n请确保机器人是该频道的管理员且有发帖权限。")
 
+# 群发(持久化任务，可断点续发)
+@dp.message(Command("bc_ad"))
+async def cmd_bc_ad(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    parts = m.text.split()
+    if len(parts) < 2 or not parts[1].isdigit():
+        return await m.reply("用法：/bc_ad 广告ID [users | @频道 -100xxx ...]\n不带目标时发往默认频道")
+    r = await ad_get(int(parts[1]))
+    if not r: return await m.reply("广告不存在。")
+    if len(parts) > 2 and parts[2] == "users":
+        kind = "users"
+        targets = [row["user_id"] for row in await pool.fetchall("SELECT user_id FROM user_meta")]
+    else:
+        kind = "channels"
+        targets = parts[2:] or [get_setting("default_channel", DEFAULT_CHANNEL)]
+    if not targets: return await m.reply("没有可发送的目标。")
+    payload = {"ad_id": r["id"], "text": render_ad_cap(r), "photo": r["photo_file_id"] or "",
+               "buttons": [{"text": "👉 点此", "url": r["url"]}] if r["url"] else []}
+    job_id = await broadcaster.create_job(kind, payload, targets)
+    broadcaster.start(job_id)
+    await m.reply(f"✅ 已创建群发任务 #{job_id}，目标 {len(targets)} 个。/bc_status {job_id} 查看进度")
+
+@dp.message(Command("bc_status"))
+async def cmd_bc_status(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    parts = m.text.split()
+    if len(parts) > 1 and parts[1].isdigit():
+        st = await broadcaster.job_status(int(parts[1]))
+        if not st: return await m.reply("任务不存在。")
+        detail = " ".join(f"{k}:{v}" for k, v in sorted(st["targets"].items()))
+        return await m.reply(f"任务 #{st['id']} [{st['status']}] {st['kind']}\n"
+                             f"总数 {st['total']} · 成功 {st['sent']} · 失败 {st['failed']}\n{detail}")
+    rows = await broadcaster.recent_jobs()
+    if not rows: return await m.reply("暂无群发任务。")
+    await m.reply("\n".join(f"#{r['id']} [{r['status']}] {r['kind']} {r['sent']}/{r['total']} 失败 {r['failed']}"
+                            for r in rows))
+
+@dp.message(Command("bc_cancel"))
+async def cmd_bc_cancel(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    parts = m.text.split()
+    if len(parts) < 2 or not parts[1].isdigit(): return await m.reply("用法：/bc_cancel 任务ID")
+    await broadcaster.cancel(int(parts[1]))
+    await m.reply("✅ 已取消。")
+
 # 广告管理入口
 @dp.message(Command("admgr"))
 async def cmd_admgr(m: Message):
     if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
-    total = ad_count(None)
-    await m.reply(f"广告管理(共 {total} 条)", reply_markup=kb_ad_list(1, total, None))
+    total = await ad_count(None)
+    await m.reply(f"广告管理(共 {total} 条)", reply_markup=await kb_ad_list(1, None))
 
-@dp.callback_query(F.data=="ad:home")
+@cb_router.exact("ad:home")
 async def ad_home(cq: CallbackQuery):
-    total=ad_count(None)
-    await swap_view(cq, f"广告管理(共 {total} 条)", kb_ad_list(1,total,None))
-
-@dp.callback_query(F.data.startswith("ad:list:"))
-async def ad_list(cq: CallbackQuery):
-    _,_,cat_raw,page_raw=cq.data.split(":")
-    cat_id=int(cat_raw) if cat_raw!="0" else None
-    page=max(1,int(page_raw)); total=ad_count(cat_id)
-    await swap_view(cq, "广告列表：", kb_ad_list(page,total,cat_id))
-
-@dp.callback_query(F.data=="ad:cats")
+    total=await ad_count(None)
+    await swap_view(cq, f"广告管理(共 {total} 条)", await kb_ad_list(1,None))
+
+@cb_router.prefix("ad:list:", int, int)
+async def ad_list(cq: CallbackQuery, args: CallbackArgs):
+    cat_id=args.parts[0] or None
+    page=max(1,args.parts[1]); total=await ad_count(cat_id)
+    # 旧格式(ad:list:分类:页码，无游标)的按钮回到第一页
+    cursor_raw=args.parts[2] if len(args.parts)>2 else ""
+    back=cursor_raw.startswith("p"); cursor=int(cursor_raw[1:] or 0) if cursor_raw[1:].isdigit() else 0
+    if not cursor: page=1
+    pages=max(1,(total+9)//10)
+    await swap_view(cq, f"广告列表(第 {min(page,pages)}/{pages} 页)：", await kb_ad_list(page,cat_id,cursor,back))
+
+@cb_router.exact("ad:cats")
 async def ad_choose_cat(cq: CallbackQuery):
-    await swap_view(cq, "选择分类过滤：", kb_cats_for_pick("filter"))
+    await swap_view(cq, "选择分类过滤：", await kb_cats_for_pick("filter"))
 
-@dp.callback_query(F.data.startswith("adcat:filter:"))
-async def ad_filter(cq: CallbackQuery):
-    cid=int(cq.data.split(":")[2]); total=ad_count(cid)
-    await swap_view(cq, f"分类 {cid} 列表：", kb_ad_list(1,total,cid))
+@cb_router.prefix("adcat:filter:", int)
+async def ad_filter(cq: CallbackQuery, args: CallbackArgs):
+    cid=args.parts[0]
+    await swap_view(cq, f"分类 {cid} 列表：", await kb_ad_list(1,cid))
 
 # 新建广告 FSM
-@dp.callback_query(F.data=="ad:new")
+@cb_router.exact("ad:new")
 async def ad_new_start(cq: CallbackQuery, state:FSMContext):
     await state.set_state(NewAd.title)
     await swap_view(cq, "发送广告标题：", kb_back_home())
@@ -1062,22 +1470,25 @@ async def ad_new_start(cq: CallbackQuery, state:FSMContext):
 async def ad_new_title(m: Message, state:FSMContext):
     await state.update_data(title=m.text.strip())
     await state.set_state(NewAd.cat)
-    await m.reply("选择分类：", reply_markup=kb_cats_for_pick("pick"))
+    await m.reply("选择分类：", reply_markup=await kb_cats_for_pick("pick"))
 
-@dp.callback_query(F.data.startswith("adcat:pick:"), NewAd.cat)
-async def ad_new_pick_cat(cq: CallbackQuery, state:FSMContext):
-    cid=int(cq.data.split(":")[2]); await state.update_data(category_id=cid)
+@cb_router.prefix("adcat:pick:", int, state=NewAd.cat)
+async def ad_new_pick_cat(cq: CallbackQuery, args: CallbackArgs, state:FSMContext):
+    cid=args.parts[0]; await state.update_data(category_id=cid)
     await state.set_state(NewAd.photo)
-    await swap_view(cq, "发送图片或 /skip 跳过：", kb_back_home())
+    await swap_view(cq, "发送图片(或 media:ID / album:名称)，/skip 跳过：", kb_back_home())
 
 @dp.message(NewAd.photo, F.text=="/skip")
 async def ad_new_skip_photo(m: Message, state:FSMContext):
     await state.update_data(photo_file_id=""); await state.set_state(NewAd.caption)
     await m.reply("发送文案(HTML 可用)或 /skip：")
 
-@dp.message(NewAd.photo, F.photo)
+@dp.message(NewAd.photo, F.photo | F.text.startswith("media:") | F.text.startswith("album:"))
 async def ad_new_photo(m: Message, state:FSMContext):
-    await state.update_data(photo_file_id=m.photo[-1].file_id); await state.set_state(NewAd.caption)
+    ref = await media_ref_from(m)
+    if not ref:
+        return await m.reply("❌ 媒体不存在，请重新发送图片，或 media:ID / album:名称：")
+    await state.update_data(photo_file_id=ref); await state.set_state(NewAd.caption)
     await m.reply("发送文案(HTML 可用)或 /skip：")
 
 @dp.message(NewAd.caption, F.text=="/skip")
@@ -1115,50 +1526,43 @@ async def ad_new_url(m: Message, state:FSMContext):
                                                 InlineKeyboardButton(text="❌ 取消", callback_data="ad:cancel_new")]])
     await m.reply(text, reply_markup=kb)
 
-@dp.callback_query(F.data=="ad:save_new", NewAd.confirm)
+@cb_router.exact("ad:save_new", state=NewAd.confirm)
 async def ad_new_save(cq: CallbackQuery, state:FSMContext):
     d=await state.get_data()
-    ad_id=ad_add(d.get("title",""), d.get("caption",""), d.get("url",""), d.get("photo_file_id",""), d.get("category_id"))
+    ad_id=await ad_add(d.get("title",""), d.get("caption",""), d.get("url",""), d.get("photo_file_id",""), d.get("category_id"))
     await state.clear()
-    r=ad_get(ad_id)
+    r=await ad_get(ad_id)
     await swap_view(cq, f"已创建 #{ad_id}", kb_ad_row(ad_id, r["active"]))
 
-@dp.callback_query(F.data=="ad:cancel_new", NewAd.confirm)
+@cb_router.exact("ad:cancel_new", state=NewAd.confirm)
 async def ad_new_cancel(cq: CallbackQuery, state:FSMContext):
     await state.clear()
-    await swap_view(cq, "已取消。", kb_ad_list(1,ad_count(None),None))
+    await swap_view(cq, "已取消。", await kb_ad_list(1,None))
 
 # 预览/启停/编辑/删除
-@dp.callback_query(F.data.startswith("ad:preview:"))
-async def ad_preview(cq: CallbackQuery):
-    ad_id=int(cq.data.split(":")[2]); r=ad_get(ad_id)
+@cb_router.prefix("ad:preview:", int)
+async def ad_preview(cq: CallbackQuery, args: CallbackArgs):
+    ad_id=args.parts[0]; r=await ad_get(ad_id)
     if not r: return await cq.answer("不存在", show_alert=True)
     try:
-        if r["photo_file_id"]:
-            await bot.send_photo(chat_id=cq.message.chat.id, photo=r["photo_file_id"],
-                                 caption=render_ad_cap(r), reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                                     InlineKeyboardButton(text="👉 点此", url=r["url"] if r["url"] else "https://t.me")
-                                 ], [InlineKeyboardButton(text="⬅ 返回管理", callback_data=f"ad:edit:{r['id']}")]]))
-        else:
-            await bot.send_message(chat_id=cq.message.chat.id, text=render_ad_cap(r),
-                                   reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                                       InlineKeyboardButton(text="👉 点此", url=r["url"] if r["url"] else "https://t.me")
-                                   ], [InlineKeyboardButton(text="⬅ 返回管理", callback_data=f"ad:edit:{r['id']}")]]))
+        await send_media(cq.message.chat.id, r["photo_file_id"], render_ad_cap(r), InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="👉 点此", url=r["url"] if r["url"] else "https://t.me")
+        ], [InlineKeyboardButton(text="⬅ 返回管理", callback_data=f"ad:edit:{r['id']}")]]))
     except TelegramBadRequest:
         await cq.message.reply(render_ad_cap(r))
     await cq.answer()
 
-@dp.callback_query(F.data.startswith("ad:toggle:"))
-async def ad_toggle(cq: CallbackQuery):
-    ad_id=int(cq.data.split(":")[2]); r=ad_get(ad_id)
+@cb_router.prefix("ad:toggle:", int)
+async def ad_toggle(cq: CallbackQuery, args: CallbackArgs):
+    ad_id=args.parts[0]; r=await ad_get(ad_id)
     if not r: return await cq.answer("不存在", show_alert=True)
-    ad_update(ad_id, active=0 if r["active"] else 1); r2=ad_get(ad_id)
+    await ad_update(ad_id, active=0 if r["active"] else 1); r2=await ad_get(ad_id)
     await swap_view(cq, render_ad_cap(r2), kb_ad_row(ad_id, r2["active"]))
     await cq.answer("已切换")
 
-@dp.callback_query(F.data.startswith("ad:edit:"))
-async def ad_edit_menu(cq: CallbackQuery, state:FSMContext):
-    ad_id=int(cq.data.split(":")[2]); r=ad_get(ad_id)
+@cb_router.prefix("ad:edit:", int)
+async def ad_edit_menu(cq: CallbackQuery, args: CallbackArgs, state:FSMContext):
+    ad_id=args.parts[0]; r=await ad_get(ad_id)
     if not r: return await cq.answer("不存在", show_alert=True)
     await state.set_state(EditAd.field); await state.update_data(ad_id=ad_id)
     kb=InlineKeyboardMarkup(inline_keyboard=[
@@ -1171,9 +1575,9 @@ async def ad_edit_menu(cq: CallbackQuery, state:FSMContext):
     ])
     await swap_view(cq, render_ad_cap(r), kb)
 
-@dp.callback_query(F.data.startswith("edit:"), EditAd.field)
-async def ad_edit_pick(cq: CallbackQuery, state:FSMContext):
-    field=cq.data.split(":")[1]
+@cb_router.prefix("edit:", state=EditAd.field)
+async def ad_edit_pick(cq: CallbackQuery, args: CallbackArgs, state:FSMContext):
+    field=args.rest
     await state.update_data(field=field)
     if field=="title":
         await state.set_state(EditAd.value); await swap_view(cq, "发送新标题：", kb_back_home())
@@ -1182,9 +1586,10 @@ async def ad_edit_pick(cq: CallbackQuery, state:FSMContext):
     elif field=="url":
         await state.set_state(EditAd.value); await swap_view(cq, "发送新按钮URL(留空则删除)：", kb_back_home())
     elif field=="photo":
-        await state.set_state(EditAd.value); await swap_view(cq, "发送新图片，或发送 /clear 清空图片：", kb_back_home())
+        await state.set_state(EditAd.value)
+        await swap_view(cq, "发送新图片(或 media:ID / album:名称)，或发送 /clear 清空图片：", kb_back_home())
     elif field=="cat":
-        await state.set_state(EditAd.cat); await swap_view(cq, "选择新分类：", kb_cats_for_pick("pick"))
+        await state.set_state(EditAd.cat); await swap_view(cq, "选择新分类：", await kb_cats_for_pick("pick"))
     else:
         await cq.answer("无效字段", show_alert=True)
 
@@ -1193,8 +1598,12 @@ async def ad_edit_value_text(m: Message, state:FSMContext):
     d=await state.get_data(); field=d.get("field"); ad_id=d.get("ad_id")
     val=m.html_text or m.text
     if field in {"title","caption","url"}:
-        ad_update(ad_id, **{field: val})
-        await m.reply("✅ 已更新。", reply_markup=kb_ad_row(ad_id, ad_get(ad_id)["active"]))
+        await ad_update(ad_id, **{field: val})
+        await m.reply("✅ 已更新。", reply_markup=kb_ad_row(ad_id, (await ad_get(ad_id))["active"]))
+        await state.clear()
+    elif field=="photo" and await media_library.check_ref(m.text.strip()):
+        await ad_update(ad_id, photo_file_id=m.text.strip())
+        await m.reply("✅ 已更新图片。", reply_markup=kb_ad_row(ad_id, (await ad_get(ad_id))["active"]))
         await state.clear()
     else:
         await m.reply("当前字段需要图片或 /clear 操作。")
@@ -1203,8 +1612,8 @@ async def ad_edit_value_text(m: Message, state:FSMContext):
 async def ad_edit_value_clear(m: Message, state:FSMContext):
     d=await state.get_data(); field=d.get("field"); ad_id=d.get("ad_id")
     if field=="photo":
-        ad_update(ad_id, photo_file_id="")
-        await m.reply("✅ 已清空图片。", reply_markup=kb_ad_row(ad_id, ad_get(ad_id)["active"]))
+        await ad_update(ad_id, photo_file_id="")
+        await m.reply("✅ 已清空图片。", reply_markup=kb_ad_row(ad_id, (await ad_get(ad_id))["active"]))
         await state.clear()
     else:
         await m.reply("只有图片字段支持 /clear。")
@@ -1213,52 +1622,61 @@ async def ad_edit_value_clear(m: Message, state:FSMContext):
 async def ad_edit_value_photo(m: Message, state:FSMContext):
     d=await state.get_data(); field=d.get("field"); ad_id=d.get("ad_id")
     if field=="photo":
-        ad_update(ad_id, photo_file_id=m.photo[-1].file_id)
-        await m.reply("✅ 已更新图片。", reply_markup=kb_ad_row(ad_id, ad_get(ad_id)["active"]))
+        await ad_update(ad_id, photo_file_id=await media_ref_from(m))
+        await m.reply("✅ 已更新图片。", reply_markup=kb_ad_row(ad_id, (await ad_get(ad_id))["active"]))
         await state.clear()
     else:
         await m.reply("请按提示选择字段后再发送。")
 
-@dp.callback_query(EditAd.cat, F.data.startswith("adcat:pick:"))
-async def ad_edit_value_cat(cq: CallbackQuery, state:FSMContext):
+@cb_router.prefix("adcat:pick:", int, state=EditAd.cat)
+async def ad_edit_value_cat(cq: CallbackQuery, args: CallbackArgs, state:FSMContext):
     ad_id=(await state.get_data()).get("ad_id")
-    cid=int(cq.data.split(":")[2]); ad_update(ad_id, category_id=cid)
+    cid=args.parts[0]; await ad_update(ad_id, category_id=cid)
     await state.clear()
-    await swap_view(cq, "✅ 分类已更新。", kb_ad_row(ad_id, ad_get(ad_id)["active"]))
+    await swap_view(cq, "✅ 分类已更新。", kb_ad_row(ad_id, (await ad_get(ad_id))["active"]))
 
-@dp.callback_query(F.data.startswith("ad:del:"))
-async def ad_del_one(cq: CallbackQuery):
-    ad_id=int(cq.data.split(":")[2]); r=ad_get(ad_id)
+@cb_router.prefix("ad:del:", int)
+async def ad_del_one(cq: CallbackQuery, args: CallbackArgs):
+    ad_id=args.parts[0]; r=await ad_get(ad_id)
     if not r: return await cq.answer("不存在", show_alert=True)
-    ad_del(ad_id)
-    await swap_view(cq, "✅ 已删除。", kb_ad_list(1, ad_count(None), None))
+    await ad_del(ad_id)
+    await swap_view(cq, "✅ 已删除。", await kb_ad_list(1, None))
 
 # 统计/导出/健康
 @dp.message(Command("stats"))
 async def cmd_stats(m: Message):
     if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
-    c=db()
+    parts = (m.text or "").split()
+    days = min(90, max(1, int(parts[1]))) if len(parts) > 1 and parts[1].isdigit() else 7
     try:
-        users = c.execute("SELECT COUNT(*) FROM user_meta").fetchone()[0]
-        total_q = c.execute("SELECT COUNT(*) FROM query_log").fetchone()[0]
-        rows = c.execute("SELECT DATE(created_at) d, COUNT(*) c FROM query_log WHERE created_at>=DATE('now','-6 day') GROUP BY d ORDER BY d").fetchall()
-        last7 = "\n".join(f"{r['d']}: {r['c']}" for r in rows)
-        await m.reply(f"📈 统计\n用户数: {users}\n查询总量: {total_q}\n近7天:\n{last7}")
+        st = await rollups.summary(days=days, top=10)
     except Exception as e:
-        await m.reply(f"统计失败: {e}")
-    finally:
-        c.close()
+        return await m.reply(f"统计失败: {e}")
+    lines = ["📈 统计", f"用户数: {st['users']}", f"查询总量: {st['queries']}", f"\n近{days}天(查询 · 活跃用户 · 新用户):"]
+    lines += [f"{d}: {v.get('queries', 0)} · {v.get('active_users', 0)} · {v.get('new_users', 0)}"
+              for d, v in st["daily"].items()]
+    if st["top_keywords"]:
+        lines.append(f"\n热门关键词(近{days}天):")
+        lines += [f"{i}. {html.escape(k)} — {n}" for i, (k, n) in enumerate(st["top_keywords"], 1)]
+    if st["hourly"]:
+        lines.append("\n近24小时(每小时查询):")
+        lines.append(" ".join(f"{h[-2:]}时:{n}" for h, n in st["hourly"]))
+    await m.reply("\n".join(lines))
+
+@dp.message(Command("stats_backfill"))
+async def cmd_stats_backfill(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    await m.reply("⏳ 正在从明细表重建统计汇总…")
+    try:
+        r = await rollups.backfill()
+    except Exception as e:
+        return await m.reply(f"重建失败: {e}")
+    await m.reply(f"✅ 已重建：{r['queries']} 次查询，{r['days']} 天，用时 {r['seconds']:.1f}s")
 
 @dp.message(Command("dump_settings"))
 async def cmd_dump_settings(m: Message):
     if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
-    c=db()
-    try:
-        rows=c.execute("SELECT key,value FROM settings").fetchall()
-        settings={r["key"]: r["value"] for r in rows}
-        await m.reply(f"<pre>{json.dumps(settings, ensure_ascii=False, indent=2)}</pre>", parse_mode="HTML")
-    finally:
-        c.close()
+    await m.reply(f"<pre>{json.dumps(settings.all(), ensure_ascii=False, indent=2)}</pre>", parse_mode="HTML")
 
 @dp.message(Command("load_settings"))
 async def cmd_load_settings(m: Message):
@@ -1269,79 +1687,176 @@ async def cmd_load_settings(m: Message):
         if not isinstance(data, dict): raise ValueError
     except Exception:
         return await m.reply("JSON 格式错误。")
-    for k,v in data.items(): set_setting(k,v)
+    await settings.set_many(data.items())
     await m.reply("✅ 已导入配置。")
 
+# 关键词菜单目录
+@dp.message(Command("kw_list"))
+async def cmd_kw_list(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    menus = keyword_menus.all()
+    if not menus: return await m.reply("暂无关键词菜单。")
+    lines = [f"{html.escape(x.name)}  [优先级 {x.priority}]" + (f"  别名：{html.escape('、'.join(x.aliases))}" if x.aliases else "")
+             for x in menus]
+    st = keyword_menus.stats()
+    lines.append(f"\n共 {st['menus']} 个菜单 / {st['patterns']} 个关键词，命中 {st['matches']} 次，未命中 {st['misses']} 次")
+    await m.reply("\n".join(lines))
+
+@dp.message(Command("kw_show"))
+async def cmd_kw_show(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    parts = m.text.split(maxsplit=1)
+    menu = keyword_menus.get(parts[1].strip()) if len(parts) > 1 else None
+    if menu is None: return await m.reply("用法：/kw_show 名称(名称见 /kw_list)")
+    await m.reply(f"<pre>{html.escape(json.dumps(menu.to_dict(), ensure_ascii=False, indent=2))}</pre>", parse_mode="HTML")
+
+@dp.message(Command("kw_set"))
+async def cmd_kw_set(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    parts = m.text.split(maxsplit=1)
+    raw = parts[1] if len(parts) > 1 else (m.reply_to_message.text if m.reply_to_message and m.reply_to_message.text else "")
+    if not raw:
+        return await m.reply('用法：/kw_set {"name":"电销话术","title":"…","desc":"…","buttons":[["文本","URL"]],'
+                             '"aliases":["话术"],"priority":0}\n也可回复包含 JSON 的消息使用')
+    try:
+        data = json.loads(raw)
+        if not isinstance(data, dict): raise ValueError("需要 JSON 对象")
+        menu = await keyword_menus.upsert(data)
+    except ValueError as e:
+        return await m.reply(f"JSON 格式错误：{html.escape(str(e))}")
+    await m.reply(f"✅ 已保存关键词菜单：{html.escape(menu.name)}(关键词 {len(menu.keywords)} 个)")
+
+@dp.message(Command("kw_del"))
+async def cmd_kw_del(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    parts = m.text.split(maxsplit=1)
+    if len(parts) < 2: return await m.reply("用法：/kw_del 名称")
+    ok = await keyword_menus.delete(parts[1].strip())
+    await m.reply("✅ 已删除。" if ok else "未找到该菜单。")
+
 @dp.message(Command("export_db"))
 async def cmd_export_db(m: Message):
     if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
-    await m.answer_document(FSInputFile(DB_FILE), caption=f"DB 备份：{DB_FILE}")
+    parts = m.text.split()
+    await m.reply("⏳ 正在生成导出文件…")
+    try:
+        if len(parts) > 1:
+            table, fmt = parts[1], (parts[2].lower() if len(parts) > 2 else "jsonl")
+            info = await snapshots.dump_table(table, fmt)
+            caption = f"表 {table}：{info['rows']} 行({fmt}.gz)"
+        else:
+            info = await snapshots.snapshot(export=True)
+            caption = (f"DB 快照：{info['bytes'] / 1e6:.1f}MB → {info['compressed_bytes'] / 1e6:.1f}MB，"
+                       f"用时 {info['seconds'] + info['compress_seconds']:.1f}s")
+    except ValueError as e:
+        return await m.reply(f"导出失败：{e}\n用法：/export_db [表名 jsonl|csv]")
+    files = info["files"]
+    try:
+        for i, f in enumerate(files, 1):
+            suffix = f" [{i}/{len(files)}]，合并：cat 文件.* > 原文件" if len(files) > 1 else ""
+            await m.answer_document(FSInputFile(f), caption=caption + suffix)
+    finally:
+        cleanup_exports(files)
 
 @dp.message(Command("ping"))
 async def cmd_ping(m: Message):
     uptime = datetime.datetime.now() - START_TIME
-    await m.reply(f"pong! 运行时长：{uptime}")
+    st = pool.stats()
+    ms = metrics.summary()
+    rc = render_cache.stats()
+    hs = bot.session.stats() if isinstance(bot.session, TunedSession) else None
+    th = throttle.stats()
+    await m.reply(
+        f"pong! 运行时长：{uptime}\n"
+        f"DB 查询 p50/p99: {st['query']['p50_ms']:.1f}/{st['query']['p99_ms']:.1f} ms · "
+        f"取连接 p99: {st['wait']['p99_ms']:.1f} ms · 连接 {st['open']}/{st['size']}\n"
+        f"关注缓存 命中/未命中/合并: {follow_cache.hits}/{follow_cache.misses}/{follow_cache.coalesced}\n"
+        f"写队列 积压/提交/丢弃: {writer.stats()['queued']}/{writer.commits}/{writer.dropped}\n"
+        f"视图缓存 跳过/编辑/合并: {rc['hits']}/{rc['edits']}/{rc['coalesced']}\n"
+        f"限速 拦截/提示/跟踪用户: {th['throttled']}/{th['notices']}/{th['tracked']}\n"
+        + (f"HTTP 请求/重试/失败 {hs['requests']}/{hs['retried']}/{hs['failed']} · "
+           f"新建/复用连接 {hs['conn_created']}/{hs['conn_reused']}\n" if hs else "")
+        + f"更新 {ms['updates']} ({ms['updates_per_s']:.2f}/s) · API 调用/错误 {ms['api_calls']}/{ms['api_errors']} · "
+        f"handler 异常 {ms['handler_errors']}\n"
+        f"事件循环延迟 p99/max: {ms['loop_lag_p99_ms']:.1f}/{ms['loop_lag_max_ms']:.1f} ms\n"
+        + ("最慢 handler(p95): " + ", ".join(f"{n} {p * 1000:.0f}ms×{c}" for n, c, p in ms["slowest"])
+           if ms["slowest"] else "")
+    )
 
 # ========== 回调：普通 ==========
-@dp.callback_query(F.data == "go_home")
+@cb_router.exact("go_home")
 async def cb_go_home(cq: CallbackQuery):
     await swap_view(cq, WELCOME_TEXT, main_menu())
 
-@dp.callback_query(F.data == "tools_home")
+@cb_router.exact("tools_home")
 async def cb_open_tools(cq: CallbackQuery):
     await swap_view(cq, "📚 发车工具合集", tools_home_kb())
 
-@dp.callback_query(F.data == "cooperation_info")
+@cb_router.exact("cooperation_info")
 async def cb_open_coop(cq: CallbackQuery):
     await swap_view(cq, "合作须知\n\n规则与常见问题入口如下:", cooperation_info_kb())
 
-@dp.callback_query(F.data == "contact_menu")
+@cb_router.exact("contact_menu")
 async def cb_open_contact(cq: CallbackQuery):
     await swap_view(cq, "客服直达(选择入口)", contact_menu_kb())
 
-@dp.callback_query(F.data == "idx_home")
+@cb_router.exact("idx_home")
 async def cb_idx_home(cq: CallbackQuery):
     await swap_view(cq, "测卡索引\n请选择类别:", idx_home_menu())
 
-@dp.callback_query(F.data == "big_bank_list")
+@cb_router.exact("big_bank_list")
 async def cb_big_bank(cq: CallbackQuery):
     await swap_view(cq, "国家大行列表：", big_bank_menu())
 
-@dp.callback_query(lambda cq: cq.data and cq.data.startswith("bank:"))
-async def cb_bank_detail(cq: CallbackQuery):
-    _, bank_name = cq.data.split(":", 1)
+@cb_router.prefix("bank:", sep=None)
+async def cb_bank_detail(cq: CallbackQuery, args: CallbackArgs):
+    bank_name = args.rest
     await swap_view(cq, f"{bank_name} 相关入口：", bank_detail_menu(bank_name))
 
-@dp.callback_query(lambda cq: cq.data and cq.data.startswith("idx_range:"))
-async def cb_idx_range(cq: CallbackQuery):
-    range_key = cq.data.split(":", 1)[1]
+@cb_router.prefix("idx_range:")
+async def cb_idx_range(cq: CallbackQuery, args: CallbackArgs):
+    range_key = args.rest
     letter = "A" if range_key == "AG" else "H"
     await swap_view(cq, f"索引 {range_key} - {letter}", idx_page(range_key, letter))
 
-@dp.callback_query(lambda cq: cq.data and cq.data.startswith("idx:"))
-async def cb_idx_letter(cq: CallbackQuery):
-    _, range_key, letter = cq.data.split(":")
+@cb_router.prefix("idx:")
+async def cb_idx_letter(cq: CallbackQuery, args: CallbackArgs):
+    if len(args.parts) != 2:
+        return await cq.answer()
+    range_key, letter = args.parts
     await swap_view(cq, f"索引 {range_key} - {letter}", idx_page(range_key, letter))
 
-@dp.callback_query(F.data.startswith("nolink:"))
-async def cb_nolink_tip(cq: CallbackQuery):
-    name = cq.data.split(":", 1)[1]
+@cb_router.prefix("nolink:", sep=None)
+async def cb_nolink_tip(cq: CallbackQuery, args: CallbackArgs):
+    name = args.rest
     await cq.answer(f"{name} 暂无链接。", show_alert=True)
 
-@dp.callback_query(F.data == "check_sub")
+@cb_router.exact("check_sub")
 async def cb_check_sub(cq: CallbackQuery):
-    if await ensure_followed(cq.from_user.id):
+    # 用户刚关注完来点"我已关注"：缓存里的"未关注"(最长 FOLLOW_NEG_TTL 秒)要重查，已关注直接命中
+    if await ensure_followed(cq.from_user.id, recheck=True):
         await cq.message.answer("已关注，功能已解锁。", reply_markup=main_menu(), disable_web_page_preview=True)
     else:
         await cq.message.answer("还未关注频道，请先点击“去关注频道”。", show_alert=True)
 
+# 频道成员变动(机器人为频道管理员时推送)：直接刷新关注缓存
+@dp.chat_member()
+async def on_channel_member(ev: types.ChatMemberUpdated):
+    status = ev.new_chat_member.status
+    user_id = ev.new_chat_member.user.id
+    follow_cache.update(ev.chat.id, user_id, status)
+    if ev.chat.username:
+        follow_cache.update("@" + ev.chat.username, user_id, status)
+
 # 广告公共回调
-@dp.callback_query(F.data == "ad_contact")
+@cb_router.exact("ad_contact")
 async def cb_ad_contact(cq: CallbackQuery):
+    click_analytics.click(cq.from_user.id, cq.from_user.username, SETTINGS_AD_ID, cq.data)
     await swap_view(cq, "客服直达(选择入口)", contact_menu_kb())
 
-@dp.callback_query(F.data == "ad_close")
+@cb_router.exact("ad_close")
 async def cb_ad_close(cq: CallbackQuery):
+    click_analytics.click(cq.from_user.id, cq.from_user.username, SETTINGS_AD_ID, cq.data)
     try:
         await cq.message.delete()
     except Exception:
@@ -1349,30 +1864,117 @@ async def cb_ad_close(cq: CallbackQuery):
     await cq.answer()
 
 # ========== 主函数 ==========
-async def on_startup() -> None:
-    init_db()
-    commands = [
-        BotCommand(command="start", description="打开首页/订阅闸门"),
-        BotCommand(command="menu", description="打开首页"),
-        BotCommand(command="help", description="查看帮助"),
-        BotCommand(command="admgr", description="广告管理"),
-    ]
-    await bot.set_my_commands(commands)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108") or 0)
+metrics_server = MetricsServer(metrics)
+metrics.registry.gauge("navbot_sqlite_pool_connections", "Open / idle pooled SQLite connections",
+                       lambda: {("open",): pool.stats()["open"], ("idle",): pool.stats()["idle"]}, ["state"])
+metrics.registry.gauge("navbot_write_behind_queued", "Rows waiting in the write-behind queue",
+                       lambda: writer.stats()["queued"])
+metrics.registry.gauge("navbot_log_records", "Log records queued / dropped (queue full or sampled out)",
+                       lambda: {("queued",): log_setup.stats()["queued"],
+                                ("dropped_full",): log_setup.stats()["dropped_full"],
+                                ("dropped_sampled",): log_setup.stats()["dropped_sampled"]}, ["state"])
+
+metrics.registry.gauge("navbot_render_cache", "swap_view edits skipped / sent / coalesced",
+                       lambda: {("skipped",): render_cache.hits, ("sent",): render_cache.edits,
+                                ("coalesced",): render_cache.coalesced}, ["result"])
+metrics.registry.gauge("navbot_throttled", "Updates dropped by the per-user throttle",
+                       lambda: {(k,): v for k, v in throttle.throttled.items()}, ["kind"])
+if isinstance(bot.session, TunedSession):
+    metrics.registry.gauge("navbot_http_session", "Bot API HTTP requests / retries / failures and pooled connections",
+                           lambda: {(k,): v for k, v in bot.session.stats().items() if k != "errors"}, ["kind"])
+metrics.registry.gauge("navbot_startup_ms", "Startup timings since process start",
+                       lambda: {("ready",): startup_timer.summary()["ready_ms"] or 0,
+                                ("first_update",): startup_timer.summary()["first_update_ms"] or 0}, ["stage"])
+
+BOT_COMMANDS = [
+    BotCommand(command="start", description="打开首页/订阅闸门"),
+    BotCommand(command="menu", description="打开首页"),
+    BotCommand(command="help", description="查看帮助"),
+    BotCommand(command="admgr", description="广告管理"),
+]
+
+async def sync_bot_commands() -> None:
+    # 命令列表与上次设置的一致(按内容哈希)时不再调用 setMyCommands
+    digest = hashlib.sha1(json.dumps([c.model_dump() for c in BOT_COMMANDS], ensure_ascii=False,
+                                     sort_keys=True).encode()).hexdigest()[:16]
+    if get_setting("bot_commands_hash") == digest:
+        return
+    await bot.set_my_commands(BOT_COMMANDS)
+    await set_setting("bot_commands_hash", digest)
 
-async def main() -> None:
-    await on_startup()
-    logger.info("Bot started")
-    await dp.start_polling(bot)
+# 启动时派生的一次性后台任务：保留引用(避免被回收)，退出时在 main() 里取消
+background_tasks: Set["asyncio.Task[None]"] = set()
 
-if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except (KeyboardInterrupt, SystemExit):
-        logger.info("Bot stopped")
+def spawn(coro, name: str) -> None:
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
 
+async def startup_background() -> None:
+    # 不影响处理更新的启动工作，开始接收更新后再做
+    # (stats_daily_users 的清理由 rollups.start() 的后台任务每天做)
+    try:
+        await sync_bot_commands()
+    except Exception as e:
+        logger.warning("Startup job set_my_commands failed: %s", e)
 
-# ===== helper: 国家大行二级菜单键盘(缺失则自动补) =====
+async def on_startup() -> None:
+    startup_timer.mark("import")
+    with startup_timer.phase("db"):
+        init_db()
+    with startup_timer.phase("keywords"):
+        await keyword_menus.load()
+    with startup_timer.phase("workers"):
+        writer.start()
+        await broadcaster.resume()
+        spawn(rollups.backfill_if_empty(), "rollups.backfill")
+        rollups.start()
+        click_analytics.start()
+        spawn(click_analytics.backfill_if_empty(), "clicks.backfill")
+        snapshots.start(float(os.getenv("SNAPSHOT_INTERVAL_H", "0") or 0))
+        if DAILY_MENU_PUSH:
+            spawn(scheduled_broadcast(), "daily-menu-push")
+        panel_sync.start(float(os.getenv("PANEL_SYNC_INTERVAL", "5") or 0))
+    with startup_timer.phase("metrics"):
+        metrics.start()
+        if METRICS_PORT:
+            await metrics_server.start(os.getenv("METRICS_HOST", "127.0.0.1").strip(), METRICS_PORT)
+    # 搜索索引在首次查询时构建(on_query_kw)，不在启动关键路径上
+    spawn(startup_background(), "startup-background")
+    startup_timer.ready()
+    startup_timer.attach_first_update(dp)
+    startup_timer.log()
 
+async def main() -> None:
+    await on_startup()
+    logger.info("Bot started (%s)", BOT_MODE)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot, base_url=WEBHOOK_URL, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET,
+                              host=WEBHOOK_HOST, port=WEBHOOK_PORT, workers=WEBHOOK_WORKERS)
+        else:
+            # 之前以 webhook 模式运行过时 webhook 仍在，getUpdates 会一直 409 Conflict；
+            # 删除不丢弃积压的更新，轮询会接着收到它们
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        for task in list(background_tasks):
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await metrics_server.stop()
+        await metrics.stop()
+        await panel_sync.stop()
+        await click_analytics.stop()
+        await rollups.stop()
+        await snapshots.stop()
+        await writer.stop()
+        await state_store.close()
+        pool.close()
+        log_setup.stop()
+
+# ===== helper: 国家大行二级菜单键盘 =====
+@keyboards.memo
 def build_bank_detail_kb(bank_name: str) -> InlineKeyboardMarkup:
     detail = BANK_DETAIL.get(bank_name, [])
     rows = []
@@ -1393,9 +1995,80 @@ def build_bank_detail_kb(bank_name: str) -> InlineKeyboardMarkup:
 async def cmd_clear_adpic(m: Message):
     if not is_owner(m.from_user.id):
         return await m.reply("无权限：仅 OWNER 可执行。")
-    set_setting("ad_photo_file_id","")
+    await set_setting("ad_photo_file_id","")
     await m.reply("✅ 已清空快捷广告图片 file_id。之后 /ad 将只发文本。")
 
+# ====== 媒体库 ======
+def media_path(name: str) -> Optional[str]:
+    # 只允许 MEDIA_DIR 下的文件
+    base = os.path.realpath(MEDIA_DIR)
+    path = os.path.realpath(os.path.join(base, name))
+    return path if path.startswith(base + os.sep) and os.path.isfile(path) else None
+
+@dp.message(Command("media_add"))
+async def cmd_media_add(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    parts = m.text.split(maxsplit=1)
+    if len(parts) < 2: return await m.reply(f"用法：/media_add 文件名(相对 {MEDIA_DIR})")
+    path = media_path(parts[1].strip())
+    if not path: return await m.reply("❌ 文件不存在或不在媒体目录内。")
+    try:
+        asset, uploaded = await media_library.add_file(path, chat_id=MEDIA_STORAGE_CHAT or m.chat.id)
+    except Exception as e:
+        return await m.reply(f"❌ 上传失败：{html.escape(str(e))}")
+    await m.reply(f"✅ media:{asset.id} {html.escape(asset.name or '')}({asset.kind}，"
+                  f"{'已上传' if uploaded else '内容已存在，未重复上传'})")
+
+@dp.message(Command("media_sync"))
+async def cmd_media_sync(m: Message):
+    # 把 MEDIA_DIR 下的全部文件登记进媒体库；已登记过的内容不会再上传
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    if not os.path.isdir(MEDIA_DIR): return await m.reply(f"媒体目录不存在：{MEDIA_DIR}")
+    uploaded = reused = failed = 0
+    for name in sorted(os.listdir(MEDIA_DIR)):
+        path = media_path(name)
+        if not path:
+            continue
+        try:
+            _, up = await media_library.add_file(path, chat_id=MEDIA_STORAGE_CHAT or m.chat.id)
+        except Exception as e:
+            failed += 1
+            logger.warning("media_sync %s failed: %s", name, e)
+            continue
+        if up:
+            uploaded += 1
+        else:
+            reused += 1
+    await m.reply(f"✅ 媒体同步完成：上传 {uploaded}，复用 {reused}，失败 {failed}。/media_list 查看")
+
+@dp.message(Command("media_list"))
+async def cmd_media_list(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    assets = await media_library.recent(30)
+    if not assets: return await m.reply("媒体库为空。/media_add 上传本地文件，或回复图片 /save_adpic 登记")
+    await m.reply("🖼 最近素材(引用 media:ID)：\n" + "\n".join(
+        f"media:{a.id}  {a.kind}  {html.escape(a.name or '')}" for a in assets))
+
+@dp.message(Command("album_set"))
+async def cmd_album_set(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    parts = m.text.split()
+    ids = [p.removeprefix("media:") for p in parts[2:]]
+    if len(parts) < 4 or not all(i.isdigit() for i in ids):
+        return await m.reply("用法：/album_set 名称 素材ID 素材ID ...(2–10 张图片)")
+    try:
+        assets = await media_library.set_album(parts[1], [int(i) for i in ids])
+    except ValueError as e:
+        return await m.reply(f"❌ {html.escape(str(e))}")
+    await m.reply(f"✅ 相册 album:{html.escape(parts[1])} 已保存({len(assets)} 张)")
+
+@dp.message(Command("album_list"))
+async def cmd_album_list(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    rows = await media_library.albums()
+    if not rows: return await m.reply("暂无相册。/album_set 名称 ID ID ... 创建")
+    await m.reply("\n".join(f"album:{html.escape(r['name'])}  {r['n']} 张" for r in rows))
+
 
 @dp.message(Command("chktgt"))
 async def cmd_chktgt(m: Message):
@@ -1418,7 +2091,7 @@ async def cmd_adbtn(m: Message):
     parts = m.text.split(maxsplit=2)
     if len(parts) < 3 or parts[1] not in {"1","2","3"}:
         return await m.reply("用法：/adbtn 1 新文案   (1=客服 2=关注 3=关闭)")
-    set_setting(f"adbtn{parts[1]}_text", parts[2].strip())
+    await set_setting(f"adbtn{parts[1]}_text", parts[2].strip())
     await m.reply("已更新按钮文案。之后发送的新广告将使用新文案。")
 
 @dp.message(Command("adbtn_url"))
@@ -1431,9 +2104,9 @@ async def cmd_adbtn_url(m: Message):
     if len(parts) < 3 or parts[1] not in {"1","2"}:
         return await m.reply("用法：/adbtn_url 1 https://...   或   /adbtn_url 2 https://...")
     idx, url = parts[1], parts[2].strip()
-    set_setting(f"adbtn{idx}_url", url)
+    await set_setting(f"adbtn{idx}_url", url)
     if idx == "1":
-        set_setting("adbtn1_type", "url")
+        await set_setting("adbtn1_type", "url")
     await m.reply("已更新 URL。")
 
 @dp.message(Command("adbtn_menu"))
@@ -1441,89 +2114,24 @@ async def cmd_adbtn_menu(m: Message):
     # 把 1 号按钮切回菜单模式(点击打开客服菜单)
     if not is_owner(m.from_user.id):
         return await m.reply("无权限：仅 OWNER 可执行。")
-    set_setting("adbtn1_type", "menu")
+    await set_setting("adbtn1_type", "menu")
     await m.reply("1号按钮已切回菜单模式。")
 
 
 # ====== 自定义关键词快捷菜单 ======
-CUSTOM_QUERY_MENUS = {
-    "电销话术": {
-        "title": "📞 电销话术模板合集",
-        "desc": "建议收藏常用话术，灵活应对客户问题。",
-        "buttons": [
-            ("📄 文字模板", "https://t.me/c/2025069980/25"),
-            ("🎧 话术录音", "https://t.me/c/2025069980/137"),
-            ("📋 交单格式", "https://t.me/c/2025069980/134"),
-            ("❌ 扣单标准", "https://t.me/c/2025069980/26"),
-        ],
-    },
-    "贷款话术": {
-        "title": "💰 贷款话术与引流资料",
-        "desc": "包括大纲、话术模板、引流技巧等。",
-        "buttons": [
-            ("📄 大纲1", "https://t.me/c/2025069980/45"),
-            ("📄 大纲2", "https://t.me/c/2025069980/60"),
-            ("🧲 引流方式", "https://t.me/c/2025069980/49"),
-            ("📚 包装合同", "https://t.me/c/2025069980/61"),
-        ],
-    },
-    "避税话术": {
-        "title": "🧾 避税话术合集",
-        "desc": "请合法合规使用，仅供学习参考。",
-        "buttons": [
-            ("📄 兼职避税", "https://t.me/c/2025069980/71"),
-            ("📄 工程避税", "https://t.me/c/2025069980/132"),
-            ("📄 避税1", "https://t.me/c/2025069980/145"),
-            ("📄 避税2", "https://t.me/c/2025069980/87"),
-        ],
-    },
-    "朋友圈文案": {
-        "title": "🗣️ 朋友圈文案合集",
-        "desc": "素材更新中，建议保存。",
-        "buttons": [
-            ("📲 文案1-8", "https://t.me/c/2025069980/91"),
-            ("📲 文案9-16", "https://t.me/c/2025069980/98"),
-            ("📲 文案17-23", "https://t.me/c/2025069980/100"),
-        ],
-    },
-    "测卡教程": {
-        "title": "📚 测卡教程 & 公户标准",
-        "desc": "全网最全教程合集，请按需查看。",
-        "buttons": [
-            ("🧰 百宝箱总入口", "https://t.me/BLQnX6H5oBgyZjhl/738"),
-            ("🔠 A-G模板", "https://t.me/BLQnX6H5oBgyZjhl/138"),
-            ("🔠 H-Z模板", "https://t.me/BLQnX6H5oBgyZjhl/139"),
-            ("🏢 公户标准", "https://t.me/BLQnX6H5oBgyZjhl/831"),
-        ],
-    },
-    "结算规则": {
-        "title": "💼 卡商结算规则汇总",
-        "desc": "适用于发车、供卡、柜台操作。",
-        "buttons": [
-            ("📋 结算规则", "https://t.me/BLQnX6H5oBgyZjhl/124"),
-            ("🚚 车队规则", "https://t.me/BLQnX6H5oBgyZjhl/871"),
-            ("📦 供料规则", "https://t.me/BLQnX6H5oBgyZjhl/186"),
-        ],
-    },
-}
+async def send_keyword_menu(m: Message, menu: KeywordMenu) -> None:
+    # 键盘在载入目录时已渲染好，这里直接复用
+    await m.answer(menu.text, reply_markup=menu.keyboard, parse_mode="HTML")
 
-@dp.message()
+# 兜底：其余 handler 都未匹配时才执行，在文件末尾注册(注册顺序决定匹配优先级)
 async def handle_custom_queries(m: Message):
-    kw = m.text or ""
-    kw_lower = kw.lower().strip()
-
-    for key, menu in CUSTOM_QUERY_MENUS.items():
-        if key in kw_lower:
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text=text, url=url)] for text, url in menu["buttons"]
-                ] + [[InlineKeyboardButton(text="🏠 返回首页", callback_data="go_home")]]
-            )
-        await m.answer(f"<b>{menu['title']}</b>\n{menu['desc']}", reply_markup=keyboard, parse_mode="HTML")
-        return
-
-    # fallback 提示
-    await m.answer("🤖 未识别关键词，请尝试发送：\n电销话术 / 贷款话术 / 朋友圈文案 等")
+    await keyword_menus.maybe_refresh()
+    menu = keyword_menus.match(m.text or "")
+    if menu is not None:
+        return await send_keyword_menu(m, menu)
+    # fallback 提示只发私聊，群里不刷屏
+    if m.chat.type == "private":
+        await m.answer("🤖 未识别关键词，请尝试发送：\n电销话术 / 贷款话术 / 朋友圈文案 等")
 
 
 
@@ -1539,85 +2147,25 @@ def main_menu_kb() -> InlineKeyboardMarkup:
         ]
     )
 
-# ========== /start ==========
-@dp.message(Command("start"))
-async def cmd_start(m: Message):
-    user = m.from_user
-    logging.info(f"[START] {user.id} {user.full_name} ({user.username})")
-    await m.answer(
-        "🤖 欢迎使用关键词菜单机器人！请点击下方按钮选择服务：",
-        reply_markup=main_menu_kb()
-    )
-
-# ========== /help ==========
-@dp.message(Command("help"))
-async def cmd_help(m: Message):
-    await m.answer("发送关键词，如：电销话术、朋友圈文案、贷款话术，即可获取相关资料。")
-
-# ========== /menu ==========
-@dp.message(Command("menu"))
-async def cmd_menu(m: Message):
-    await m.answer("📋 主菜单：", reply_markup=main_menu_kb())
-
-# ========== /推广 ==========
-@dp.message(Command("推广"))
-async def cmd_promo(m: Message):
-    await m.answer("📢 推广素材包：https://t.me/c/2025069980/999")
-
 # ========== 关键词快捷按钮回调 ==========
-@dp.callback_query(F.data.startswith("kw_"))
-async def callback_keyword_button(cq: CallbackQuery):
-    keyword = cq.data.replace("kw_", "")
-    fake_message = types.Message(
-        message_id=cq.message.message_id,
-        date=cq.message.date,
-        chat=cq.message.chat,
-        text=keyword
-    )
-    await handle_custom_queries(fake_message)
+@cb_router.prefix("kw_", sep=None)
+async def callback_keyword_button(cq: CallbackQuery, args: CallbackArgs):
+    await keyword_menus.maybe_refresh()
+    menu = keyword_menus.get(args.rest) or keyword_menus.match(args.rest)
+    if menu is None:
+        return await cq.answer("该菜单已下线", show_alert=True)
+    await send_keyword_menu(cq.message, menu)
     await cq.answer()
 
-# ========== 关注频道限制 ==========
-async def ensure_followed(user_id: int) -> bool:
-    try:
-        member = await bot.get_chat_member(DEFAULT_CHANNEL, user_id)
-        return member.status in ("member", "administrator", "creator")
-    except TelegramNetworkError:
-        return False
-    except Exception as e:
-        logging.warning(f"Follow check error: {e}")
-        return False
-
-def follow_gate_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔗 关注主频道", url=f"https://t.me/c/{DEFAULT_CHANNEL.replace('-100', '')}")],
-        [InlineKeyboardButton(text="✅ 我已关注，继续", callback_data="check_sub")]
-    ])
-
-@dp.callback_query(F.data == "check_sub")
-async def check_sub_callback(cq: CallbackQuery):
-    is_subscribed = await ensure_followed(cq.from_user.id)
-    if is_subscribed:
-        await cq.message.answer("✅ 已检测到你已关注，现在可以使用菜单了：", reply_markup=main_menu_kb())
-    else:
-        await cq.message.answer("⚠️ 尚未关注频道，请先关注：", reply_markup=follow_gate_kb())
-
-# ========== 启动时设定命令 ==========
-@dp.startup()
-async def on_startup(bot: Bot):
-    await bot.set_my_commands([
-        BotCommand(command="start", description="启动菜单"),
-        BotCommand(command="help", description="使用说明"),
-        BotCommand(command="menu", description="关键词菜单"),
-        BotCommand(command="推广", description="推广素材链接"),
-    ])
-
-
-
 # ========== 自动推送功能(定时发送菜单或信息到频道) ==========
+# DAILY_MENU_PUSH=1 时开启；间隔记在共享状态里，重启/多实例不会重复推送
+DAILY_MENU_PUSH = os.getenv("DAILY_MENU_PUSH", "0") == "1"
 
 async def scheduled_broadcast():
     while True:
+        if not await state_store.cooldown("daily_menu_push", 86400):
+            await asyncio.sleep(600)
+            continue
         try:
             msg = (
                 "📢 <b>每日关键词菜单更新</b>\n"
@@ -1630,48 +2178,21 @@ async def scheduled_broadcast():
                 "- 结算规则\n"
                 "\n点击菜单按钮或直接发送关键词获取内容 ⤵️"
             )
-            await bot.send_message(
+            await send_with_retry(lambda: bot.send_message(
                 chat_id=DEFAULT_CHANNEL,
                 text=msg,
                 reply_markup=main_menu_kb(),
                 parse_mode=ParseMode.HTML,
                 disable_web_page_preview=True,
-            )
-            logging.info("[推送成功] 每日菜单已发送至频道")
+            ), bucket=broadcaster.bucket)
+            logger.info("[推送成功] 每日菜单已发送至频道")
         except Exception as e:
-            logging.warning(f"[推送失败] {e}")
-
-        await asyncio.sleep(86400)  # 每 24 小时推送一次(秒)
-
-@dp.startup()
-async def start_broadcast_loop(bot: Bot):
-    aio_asyncio.create_task(scheduled_broadcast())
+            logger.warning("[推送失败] %s", e)
 
 
 
 # ========== 📢 广告系统模块 ==========
 
-DB_FILE = os.getenv("DB_FILE", "./ad_tracking.db")
-
-# 初始化点击追踪数据库
-def init_ad_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS ad_clicks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            username TEXT,
-            ad_id TEXT,
-            button_label TEXT,
-            clicked_at TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-init_ad_db()
-
 # 广告发送函数
 async def send_ad(chat_id, text, buttons, ad_id="ad_001", photo=None):
     inline_buttons = [
@@ -1680,76 +2201,69 @@ async def send_ad(chat_id, text, buttons, ad_id="ad_001", photo=None):
     ]
     markup = InlineKeyboardMarkup(inline_keyboard=inline_buttons)
 
-    if photo:
-        await bot.send_photo(chat_id, photo=photo, caption=text, reply_markup=markup, parse_mode="HTML")
-    else:
-        await bot.send_message(chat_id, text, reply_markup=markup, parse_mode="HTML")
+    await send_with_retry(lambda: send_media(chat_id, photo, text, markup), bucket=broadcaster.bucket)
+    click_analytics.impression(ad_id, chat_id)
 
-    logging.info(f"[广告已发送] {ad_id} 到 {chat_id}")
+    logger.info("[广告已发送] %s 到 %s", ad_id, chat_id, extra={"event": "ad_send", "ad_id": ad_id, "chat_id": chat_id})
 
 # 回调点击追踪
-@dp.callback_query(F.data.startswith("ad_"))
+@cb_router.prefix("ad_", sep=None)
 async def track_ad_click(cq: CallbackQuery):
     user = cq.from_user
     ad_id = cq.data.split("_", 2)[-1]
     label = cq.data  # 可扩展成按钮标识
 
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO ad_clicks (user_id, username, ad_id, button_label, clicked_at)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (
-        user.id,
-        user.username,
-        ad_id,
-        label,
-        datetime.utcnow().isoformat()
-    ))
-    conn.commit()
-    conn.close()
+    click_analytics.click(user.id, user.username, ad_id, label)
 
     await cq.answer("✅ 点击已记录")
-    logging.info(f"[广告点击] user={user.id}, ad={ad_id}, label={label}")
+    logger.info("[广告点击] user=%s, ad=%s, label=%s", user.id, ad_id, label,
+                extra={"event": "click", "user_id": user.id, "ad_id": ad_id, "label": label})
 
 # 广告报表
 @dp.message(Command("报表"))
 async def ad_report(m: Message):
     args = m.text.split()
     if len(args) < 2:
-        await m.answer("❗ 用法：/报表 广告ID")
+        await m.answer("❗ 用法：/报表 广告ID [小时数]")
         return
     ad_id = args[1]
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT button_label, COUNT(*) FROM ad_clicks WHERE ad_id=? GROUP BY button_label", (ad_id,))
-    rows = c.fetchall()
-    conn.close()
-    if not rows:
+    hours = min(168, max(1, int(args[2]))) if len(args) > 2 and args[2].isdigit() else 24
+    r = await click_analytics.report(ad_id, hours=hours)
+    if not r["clicks"] and not r["impressions"]:
         await m.answer(f"📊 广告 [{ad_id}] 暂无点击数据")
         return
-    msg = f"📊 广告 [{ad_id}] 报告：\n"
-    total = 0
-    for label, count in rows:
+    ctr = f"{r['ctr'] * 100:.2f}%" if r["ctr"] is not None else "—"
+    msg = (f"📊 广告 [{ad_id}] 报告：\n"
+           f"曝光(发送)：{r['impressions']} 次\n"
+           f"总点击数：{r['clicks']} 次 · CTR {ctr}\n"
+           f"独立点击用户：≈{r['unique_clickers']}(近{r['days']}天 ≈{r['unique_clickers_range']})\n")
+    for label, count in r["buttons"]:
         msg += f"- {label}: {count} 次\n"
-        total += count
-    msg += f"总点击数：{total} 次"
+    active = [(h, c, i) for h, c, i in r["hourly"] if c or i]
+    if active:
+        msg += f"\n近{hours}小时(UTC，点击/曝光)：\n" + "\n".join(f"{h[5:]}时  {c}/{i}" for h, c, i in active)
     await m.answer(msg)
 
+@dp.message(Command("报表重建"))
+async def ad_report_backfill(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    r = await click_analytics.backfill()
+    await m.answer(f"✅ 已从明细重建：{r['clicks']} 次点击，{r['ads']} 个广告，用时 {r['seconds']:.1f}s")
+
 
 
 # ========== 👥 客服自动转接 ==========
 SUPPORT_STAFF_IDS = [123456789, 987654321]  # 替换为你自己的客服 Telegram user_id
-last_assigned = 0
 
 async def assign_support():
-    global last_assigned
-    user_id = SUPPORT_STAFF_IDS[last_assigned % len(SUPPORT_STAFF_IDS)]
-    last_assigned += 1
-    return user_id
+    # 计数器在共享后端原子自增，多实例也能严格轮询
+    n = await state_store.incr("support_rr")
+    return SUPPORT_STAFF_IDS[(n - 1) % len(SUPPORT_STAFF_IDS)]
 
-@dp.callback_query(F.data.startswith("ad_contact_"))
+@cb_router.prefix("ad_contact_", sep=None)
 async def ad_contact_router(cq: CallbackQuery):
+    # 最长前缀路由下 ad_contact_<id> 不再经过 track_ad_click，点击在这里记录(/报表 的点击数与 CTR)
+    click_analytics.click(cq.from_user.id, cq.from_user.username, cq.data.split("_", 2)[-1], cq.data)
     assigned_id = await assign_support()
     await bot.send_message(
         assigned_id,
@@ -1759,17 +2273,19 @@ async def ad_contact_router(cq: CallbackQuery):
     await cq.answer()
 
 # ========== 📁 广告模板保存与重用 ==========
-AD_TEMPLATE_FILE = "ad_templates.json"
-
-def load_templates():
-    import json
-    if Path(AD_TEMPLATE_FILE).exists():
-        return json.loads(Path(AD_TEMPLATE_FILE).read_text(encoding="utf-8"))
-    return {}
-
-def save_templates(templates):
-    import json
-    Path(AD_TEMPLATE_FILE).write_text(json.dumps(templates, indent=2, ensure_ascii=False), encoding="utf-8")
+TEMPLATES_PER_PAGE = 20
+
+def parse_template_buttons(lines: List[str]) -> List[Dict[str, str]]:
+    # 每行一个按钮：文本|URL
+    buttons = []
+    for line in lines:
+        if not line.strip():
+            continue
+        text, sep, url = line.partition("|")
+        if not sep:
+            raise ValueError(f"按钮格式应为 文本|URL：{line}")
+        buttons.append({"text": text.strip(), "url": url.strip()})
+    return buttons
 
 @dp.message(Command("保存广告"))
 async def save_ad_template(m: Message):
@@ -1779,57 +2295,123 @@ async def save_ad_template(m: Message):
         return
 
     ad_id, ad_text = args[1], args[2]
-    templates = load_templates()
-    templates[ad_id] = {"text": ad_text, "buttons": []}
-    save_templates(templates)
-    await m.answer(f"✅ 广告模板 [{ad_id}] 已保存")
+    t = await ad_templates.save(ad_id, ad_text)
+    await m.answer(f"✅ 广告模板 [{html.escape(ad_id)}] 已保存(v{t.version})")
+
+@dp.message(Command("模板按钮"))
+async def set_ad_template_buttons(m: Message):
+    lines = m.text.split("\n")
+    head = lines[0].split(maxsplit=1)
+    if len(head) < 2:
+        await m.answer("用法：/模板按钮 广告ID\n文本|URL\n文本|URL\n(不带按钮行则清空，推送时使用默认按钮)")
+        return
+    try:
+        t = await ad_templates.save(head[1].strip(), buttons=parse_template_buttons(lines[1:]))
+    except ValueError as e:
+        await m.answer(f"❌ {html.escape(str(e))}")
+        return
+    await m.answer(f"✅ 模板 [{html.escape(t.name)}] 按钮已更新：{len(t.buttons)} 个(v{t.version})")
+
+@dp.message(Command("模板历史"))
+async def ad_template_history(m: Message):
+    args = m.text.split(maxsplit=1)
+    if len(args) < 2:
+        await m.answer("用法：/模板历史 广告ID")
+        return
+    rows = await ad_templates.history(args[1].strip())
+    if not rows:
+        await m.answer("❌ 未找到该广告模板")
+        return
+    msg = f"🕘 [{html.escape(args[1].strip())}] 最近版本：\n"
+    msg += "\n".join(f"v{r['version']}  {r['saved_at']}  {r['chars']} 字 / {r['buttons']} 个按钮" for r in rows)
+    await m.answer(msg + "\n\n推送历史版本：/推送广告 广告ID 版本号")
+
+@dp.message(Command("删除模板"))
+async def delete_ad_template(m: Message):
+    if not is_owner(m.from_user.id): return await m.reply("无权限：仅 OWNER 可执行。")
+    args = m.text.split(maxsplit=1)
+    if len(args) < 2:
+        await m.answer("用法：/删除模板 广告ID")
+        return
+    ok = await ad_templates.delete(args[1].strip())
+    await m.answer("✅ 已删除(含历史版本)" if ok else "❌ 未找到该广告模板")
+
+async def ad_template_page(cursor: str = "") -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    模板列表一页。翻页按钮的 callback_data 为 tpl:list:{n|p}{游标id}，
+    n=取 id>游标 的下一页，p=取 id<游标 的上一页。
+    """
+    back = cursor.startswith("p")
+    cur = int(cursor[1:]) if cursor[1:].isdigit() else 0
+    if back and cur:
+        rows, has_prev = await ad_templates.page(TEMPLATES_PER_PAGE, before=cur)
+        has_next = True
+    else:
+        rows, has_next = await ad_templates.page(TEMPLATES_PER_PAGE, after=cur)
+        has_prev = cur > 0
+    if not rows:
+        return "📭 暂无已保存模板", None
+    total = await ad_templates.count()
+    msg = f"📁 当前模板列表(共 {total} 个)：\n" + "\n".join(f"- {html.escape(r['name'])}  v{r['version']}" for r in rows)
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅ 上一页", callback_data=f"tpl:list:p{rows[0]['id']}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="下一页 ➡", callback_data=f"tpl:list:n{rows[-1]['id']}"))
+    return msg, (InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None)
 
 @dp.message(Command("模板列表"))
 async def list_ad_templates(m: Message):
-    templates = load_templates()
-    if not templates:
-        await m.answer("📭 暂无已保存模板")
-        return
-    msg = "📁 当前模板列表：\n"
-    for ad_id in templates:
-        msg += f"- {ad_id}\n"
-    await m.answer(msg)
+    msg, kb = await ad_template_page()
+    await m.answer(msg, reply_markup=kb)
 
-# ========== 🎯 推送频率限制 ==========
-last_sent_times = {}
+@cb_router.prefix("tpl:list:", sep=None)
+async def list_ad_templates_page(cq: CallbackQuery, args: CallbackArgs):
+    msg, kb = await ad_template_page(args.rest)
+    await swap_view(cq, msg, kb)
 
+# ========== 🎯 推送频率限制 ==========
 async def can_send_ad(ad_id, cooldown_seconds=3600):
-    now = datetime.utcnow().timestamp()
-    last_time = last_sent_times.get(ad_id, 0)
-    if now - last_time >= cooldown_seconds:
-        last_sent_times[ad_id] = now
-        return True
-    return False
+    # 检查并占用冷却窗口是一次原子操作，多实例同时推送同一广告只有一个成功
+    return await state_store.cooldown(f"ad_push:{ad_id}", cooldown_seconds)
 
 @dp.message(Command("推送广告"))
 async def manual_send_ad(m: Message):
     args = m.text.split(maxsplit=1)
     if len(args) < 2:
-        await m.answer("用法：/推送广告 广告ID")
+        await m.answer("用法：/推送广告 广告ID [版本号]")
         return
 
-    ad_id = args[1]
-    if not await can_send_ad(ad_id):
-        await m.answer("⏱ 此广告近期已推送，稍后再试")
+    ad_id, _, version = args[1].strip().partition(" ")
+    if version and not version.strip().isdigit():
+        await m.answer("用法：/推送广告 广告ID [版本号]")
         return
-
-    templates = load_templates()
-    if ad_id not in templates:
+    # 先查模板再占冷却窗口，避免 ID 写错时白白占用
+    template = await ad_templates.get(ad_id, int(version) if version.strip() else None)
+    if template is None:
         await m.answer("❌ 未找到该广告模板")
         return
 
+    if not await can_send_ad(ad_id):
+        await m.answer("⏱ 此广告近期已推送，稍后再试")
+        return
+
     await send_ad(
         chat_id=DEFAULT_CHANNEL,
-        text=templates[ad_id]["text"],
-        buttons=[
+        text=template.text,
+        buttons=list(template.buttons) or [
             {"text": "🛒 查看详情", "url": "https://yoururl.com?utm=" + ad_id},
             {"text": "👤 联系客服", "callback_data": f"ad_contact_{ad_id}"}
         ],
         ad_id=ad_id
     )
     await m.answer("✅ 广告已推送")
+
+
+dp.message.register(handle_custom_queries)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Bot stopped")
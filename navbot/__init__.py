@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+# navbot · Channel Navigator Bot 的通用子系统(与 bot.py 中的 handler 解耦，便于单独复用/压测)
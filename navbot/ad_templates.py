@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# 广告模板库(取代整文件读写的 ad_templates.json)
+#
+# - ad_templates：每个模板一行(name 唯一索引)，按名查找走索引，与模板总数无关
+# - ad_template_versions：每次保存追加一个版本(name, version)，可查看历史、推送指定版本
+# - 保存在同一事务内完成(BEGIN IMMEDIATE)，并发保存互相排队，不会写坏数据
+# - 热模板放进进程内 LRU，命中时不访问 DB；本进程的写入同步更新缓存
+# - 列表按 id 做 keyset 分页，翻页代价与页大小有关，与总数无关
+# - 首次建表时若旧的 ad_templates.json 存在，一次性导入
+
+import json
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS ad_templates(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        text TEXT NOT NULL,
+        buttons TEXT NOT NULL DEFAULT '[]',
+        version INTEGER NOT NULL DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS ad_template_versions(
+        name TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        buttons TEXT NOT NULL DEFAULT '[]',
+        saved_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY(name, version)
+    ) WITHOUT ROWID""",
+)
+
+Buttons = Tuple[Dict[str, str], ...]
+
+
+class AdTemplate(NamedTuple):
+    id: int
+    name: str
+    text: str
+    buttons: Buttons
+    version: int
+    updated_at: Optional[str] = None
+
+
+def _row(r: sqlite3.Row) -> AdTemplate:
+    return AdTemplate(r["id"], r["name"], r["text"], tuple(json.loads(r["buttons"] or "[]")), r["version"],
+                      r["updated_at"])
+
+
+def normalize_buttons(buttons: Sequence[Any]) -> List[Dict[str, str]]:
+    """按钮统一为 {"text", "url"} 或 {"text", "callback_data"}；格式不对抛 ValueError。"""
+    out = []
+    for b in buttons:
+        if isinstance(b, (list, tuple)) and len(b) == 2:
+            b = {"text": b[0], "url": b[1]}
+        if not isinstance(b, dict) or not b.get("text"):
+            raise ValueError(f"按钮缺少文本：{b!r}")
+        if b.get("url"):
+            if not str(b["url"]).startswith(("https://", "http://", "tg://")):
+                raise ValueError(f"按钮 URL 无效：{b['url']}")
+            out.append({"text": str(b["text"]), "url": str(b["url"])})
+        elif b.get("callback_data"):
+            if len(str(b["callback_data"]).encode()) > 64:
+                raise ValueError(f"callback_data 超过 64 字节：{b['callback_data']}")
+            out.append({"text": str(b["text"]), "callback_data": str(b["callback_data"])})
+        else:
+            raise ValueError(f"按钮需要 url 或 callback_data：{b!r}")
+    return out
+
+
+class AdTemplateStore:
+    def __init__(self, pool: Any, cache_size: int = 1024):
+        self.pool = pool
+        self.cache_size = max(0, cache_size)
+        self._cache: "OrderedDict[str, AdTemplate]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # ---- 表结构 ----
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection) -> None:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+
+    @staticmethod
+    def import_json(conn: sqlite3.Connection, path: str, commit: bool = True) -> int:
+        """表为空且旧 JSON 文件存在时导入一次(文件保留不动)，返回导入条数。
+        在迁移里调用时传 commit=False，由迁移的事务统一提交。"""
+        p = Path(path)
+        if not p.exists() or conn.execute("SELECT 1 FROM ad_templates LIMIT 1").fetchone():
+            return 0
+        data = json.loads(p.read_text(encoding="utf-8") or "{}")
+        rows = []
+        for name, t in data.items():
+            buttons = json.dumps(normalize_buttons(t.get("buttons") or []), ensure_ascii=False)
+            rows.append((str(name), t.get("text") or "", buttons))
+        conn.executemany("INSERT INTO ad_templates(name, text, buttons) VALUES(?,?,?)", rows)
+        conn.executemany("INSERT INTO ad_template_versions(name, version, text, buttons) VALUES(?,1,?,?)", rows)
+        if commit:
+            conn.commit()
+        return len(rows)
+
+    # ---- 缓存 ----
+    def _remember(self, t: AdTemplate) -> AdTemplate:
+        if self.cache_size:
+            self._cache[t.name] = t
+            self._cache.move_to_end(t.name)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return t
+
+    # ---- 读取 ----
+    async def get(self, name: str, version: Optional[int] = None) -> Optional[AdTemplate]:
+        """当前版本优先走缓存；指定 version 时读历史表。"""
+        if version is None:
+            t = self._cache.get(name)
+            if t is not None:
+                self.hits += 1
+                self._cache.move_to_end(name)
+                return t
+            self.misses += 1
+            r = await self.pool.fetchone("SELECT * FROM ad_templates WHERE name=?", (name,))
+            return self._remember(_row(r)) if r else None
+        r = await self.pool.fetchone(
+            """SELECT t.id, v.name, v.text, v.buttons, v.version, v.saved_at AS updated_at
+               FROM ad_template_versions v JOIN ad_templates t ON t.name=v.name
+               WHERE v.name=? AND v.version=?""", (name, version))
+        return _row(r) if r else None
+
+    async def history(self, name: str, limit: int = 10) -> List[sqlite3.Row]:
+        return await self.pool.fetchall(
+            """SELECT version, length(text) AS chars, json_array_length(buttons) AS buttons, saved_at
+               FROM ad_template_versions WHERE name=? ORDER BY version DESC LIMIT ?""", (name, limit))
+
+    async def count(self) -> int:
+        row = await self.pool.fetchone("SELECT COUNT(*) AS c FROM ad_templates")
+        return row["c"] if row else 0
+
+    async def page(self, per: int = 20, after: int = 0, before: int = 0) -> Tuple[List[sqlite3.Row], bool]:
+        """
+        keyset 分页(按 id 正序)：after>0 取 id>after 的下一页，before>0 取 id<before 的上一页。
+        返回 (本页行, 该方向是否还有更多)。
+        """
+        if before:
+            rows = await self.pool.fetchall(
+                "SELECT id, name, version, updated_at FROM ad_templates WHERE id<? ORDER BY id DESC LIMIT ?",
+                (before, per + 1))
+            return rows[:per][::-1], len(rows) > per
+        rows = await self.pool.fetchall(
+            "SELECT id, name, version, updated_at FROM ad_templates WHERE id>? ORDER BY id LIMIT ?", (after, per + 1))
+        return rows[:per], len(rows) > per
+
+    # ---- 写入 ----
+    async def save(self, name: str, text: Optional[str] = None,
+                   buttons: Optional[Sequence[Any]] = None) -> AdTemplate:
+        """新建或追加新版本；text/buttons 传 None 表示沿用当前版本的值。"""
+        name = name.strip()
+        if not name:
+            raise ValueError("模板 ID 不能为空")
+        btn_json = None if buttons is None else json.dumps(normalize_buttons(buttons), ensure_ascii=False)
+
+        def _do(c: sqlite3.Connection) -> sqlite3.Row:
+            c.execute("BEGIN IMMEDIATE")  # 出错时连接归还池时自动回滚
+            cur = c.execute("SELECT * FROM ad_templates WHERE name=?", (name,)).fetchone()
+            if cur is None:
+                if text is None:
+                    raise ValueError(f"模板 {name} 不存在")
+                c.execute("INSERT INTO ad_templates(name, text, buttons) VALUES(?,?,?)",
+                          (name, text, btn_json or "[]"))
+            else:
+                c.execute("""UPDATE ad_templates SET text=?, buttons=?, version=version+1,
+                             updated_at=CURRENT_TIMESTAMP WHERE name=?""",
+                          (cur["text"] if text is None else text,
+                           cur["buttons"] if btn_json is None else btn_json, name))
+            row = c.execute("SELECT * FROM ad_templates WHERE name=?", (name,)).fetchone()
+            c.execute("INSERT INTO ad_template_versions(name, version, text, buttons) VALUES(?,?,?,?)",
+                      (name, row["version"], row["text"], row["buttons"]))
+            c.commit()
+            return row
+        return self._remember(_row(await self.pool.run(_do, "ad_templates.save")))
+
+    async def delete(self, name: str) -> bool:
+        """删除模板及其全部历史版本。"""
+        def _do(c: sqlite3.Connection) -> int:
+            with c:
+                n = c.execute("DELETE FROM ad_templates WHERE name=?", (name,)).rowcount
+                c.execute("DELETE FROM ad_template_versions WHERE name=?", (name,))
+            return n
+        self._cache.pop(name, None)
+        return bool(await self.pool.run(_do, "ad_templates.delete"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses}
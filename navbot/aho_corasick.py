@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Aho-Corasick 多模式匹配：一次扫描找出文本中出现的全部关键词，耗时与文本长度(+命中数)成正比，与关键词数量无关
+#
+# - add/remove 只改字典树并标记脏，下次查询前重算失效链接(BFS 一遍，O(树大小))
+# - 每个模式可附带任意值；匹配不区分大小写(casefold)
+
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class AhoCorasick:
+    __slots__ = ("_goto", "_fail", "_out", "_dict", "_values", "_dirty")
+
+    def __init__(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[str]] = [None]   # 在此结点结束的模式
+        self._dict: List[int] = [0]               # 沿失效链最近的有输出结点(0 表示没有)
+        self._values: Dict[str, Any] = {}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, pattern: str) -> bool:
+        return pattern.casefold() in self._values
+
+    def add(self, pattern: str, value: Any = None) -> None:
+        key = pattern.casefold()
+        if not key:
+            raise ValueError("empty pattern")
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._dict.append(0)
+            node = nxt
+        self._out[node] = key
+        self._values[key] = value
+        self._dirty = True
+
+    def remove(self, pattern: str) -> bool:
+        """删除模式(结点保留，仅清除输出；大量删除后可 compact())。"""
+        key = pattern.casefold()
+        if self._values.pop(key, _MISSING) is _MISSING:
+            return False
+        node = 0
+        for ch in key:
+            node = self._goto[node][ch]
+        self._out[node] = None
+        self._dirty = True
+        return True
+
+    def compact(self) -> None:
+        """按现有模式重建，回收已删除模式留下的结点。"""
+        items = list(self._values.items())
+        self.__init__()  # type: ignore[misc]
+        for k, v in items:
+            self.add(k, v)
+
+    def _build(self) -> None:
+        goto, fail, out, dlink = self._goto, self._fail, self._out, self._dict
+        q: deque = deque()
+        for nxt in goto[0].values():
+            fail[nxt] = 0
+            dlink[nxt] = 0
+            q.append(nxt)
+        while q:
+            node = q.popleft()
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                fn = fail[nxt]
+                dlink[nxt] = fn if out[fn] is not None else dlink[fn]
+                q.append(nxt)
+        self._dirty = False
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str, Any]]:
+        """逐个产出 (起始下标, 模式, 值)，按结束位置递增；下标基于 casefold 后的文本。"""
+        if self._dirty:
+            self._build()
+        goto, fail, out, dlink, values = self._goto, self._fail, self._out, self._dict, self._values
+        node = 0
+        for i, ch in enumerate(text.casefold()):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if out[node] is not None else dlink[node]
+            while hit:
+                pat = out[hit]
+                yield i - len(pat) + 1, pat, values[pat]  # type: ignore[arg-type]
+                hit = dlink[hit]
+
+    def find_all(self, text: str) -> List[Tuple[int, str, Any]]:
+        return list(self.iter_matches(text))
+
+    def stats(self) -> Dict[str, int]:
+        return {"patterns": len(self._values), "nodes": len(self._goto)}
+
+
+_MISSING = object()
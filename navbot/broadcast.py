@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+# 群发引擎：持久化任务 + 令牌桶调度 + 并发发送 + RetryAfter 处理 + 断点续发
+#
+# 表结构：
+#   broadcast_jobs     任务(载荷 JSON、状态、计数)
+#   broadcast_targets  每个目标的投递状态(pending/sent/failed/blocked)
+#
+# 限速：全局令牌桶(默认 25 条/秒，低于 Telegram 的 30 条/秒)，同一 chat 至少间隔 1 秒；
+# 收到 TelegramRetryAfter 时整体暂停 retry_after 秒并把该目标重新排队。
+# 进程重启后 resume() 继续发送 status=running/queued 的任务中尚未完成的目标。
+
+import json
+import time
+import random
+import asyncio
+import logging
+import sqlite3
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramEntityTooLarge,
+    TelegramForbiddenError,
+    TelegramMigrateToChat,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from navbot.ratelimit import KeyedInterval, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS broadcast_jobs(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        total INTEGER DEFAULT 0,
+        sent INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        started_at DATETIME,
+        finished_at DATETIME
+    )""",
+    """CREATE TABLE IF NOT EXISTS broadcast_targets(
+        job_id INTEGER NOT NULL,
+        chat_id TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        message_id INTEGER,
+        error TEXT,
+        updated_at DATETIME,
+        PRIMARY KEY(job_id, chat_id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_bt_job_status ON broadcast_targets(job_id, status)",
+)
+
+# 临时错误：退避后重试
+TRANSIENT_ERRORS = (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)
+
+SendFn = Callable[[Any, Dict[str, Any]], Awaitable[Any]]
+
+
+async def send_with_retry(call: Callable[[], Awaitable[Any]], attempts: int = 3,
+                          bucket: Optional[TokenBucket] = None) -> Any:
+    """单次发送的通用重试：遵守 RetryAfter，临时错误指数退避(带抖动)。"""
+    for i in range(attempts):
+        if bucket is not None:
+            await bucket.acquire()
+        try:
+            return await call()
+        except TelegramRetryAfter as e:
+            if bucket is not None:
+                bucket.pause(e.retry_after)
+            if i == attempts - 1:
+                raise
+            await asyncio.sleep(e.retry_after)
+        except TRANSIENT_ERRORS:
+            if i == attempts - 1:
+                raise
+            await asyncio.sleep(min(30.0, 0.5 * 2 ** i) * (0.5 + random.random()))
+
+
+def _chat_arg(chat_id: str) -> Any:
+    return int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id
+
+
+class Broadcaster:
+    def __init__(self, pool: Any, send: SendFn, rate: float = 25.0, per_chat_interval: float = 1.0,
+                 concurrency: int = 8, max_attempts: int = 3, status_batch: int = 50):
+        self.pool = pool
+        self._send = send
+        self.bucket = TokenBucket(rate, capacity=rate)
+        self.per_chat = KeyedInterval(per_chat_interval)
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.status_batch = status_batch
+        self._tasks: Dict[int, "asyncio.Task[None]"] = {}
+        self.retry_after_hits = 0
+
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection) -> None:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+
+    # ---- 任务 ----
+    async def create_job(self, kind: str, payload: Dict[str, Any], targets: Iterable[Any]) -> int:
+        uniq = list(dict.fromkeys(str(t) for t in targets))
+
+        def _do(c: sqlite3.Connection) -> int:
+            cur = c.execute("INSERT INTO broadcast_jobs(kind, payload, total) VALUES(?,?,?)",
+                            (kind, json.dumps(payload, ensure_ascii=False), len(uniq)))
+            job_id = cur.lastrowid
+            c.executemany("INSERT OR IGNORE INTO broadcast_targets(job_id, chat_id) VALUES(?,?)",
+                          [(job_id, t) for t in uniq])
+            c.commit()
+            return job_id
+        return await self.pool.run(_do, "broadcast.create_job")
+
+    def start(self, job_id: int) -> "asyncio.Task[None]":
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            task = asyncio.get_running_loop().create_task(self._run_job(job_id), name=f"broadcast-{job_id}")
+            self._tasks[job_id] = task
+        return task
+
+    async def cancel(self, job_id: int) -> None:
+        await self.pool.execute("UPDATE broadcast_jobs SET status='cancelled', finished_at=CURRENT_TIMESTAMP "
+                                "WHERE id=? AND status IN ('queued','running')", (job_id,))
+        task = self._tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def resume(self) -> List[int]:
+        rows = await self.pool.fetchall("SELECT id FROM broadcast_jobs WHERE status IN ('queued','running') ORDER BY id")
+        ids = [r["id"] for r in rows]
+        for job_id in ids:
+            self.start(job_id)
+        if ids:
+            logger.info("Resuming broadcast jobs: %s", ids)
+        return ids
+
+    async def job_status(self, job_id: int) -> Optional[Dict[str, Any]]:
+        job = await self.pool.fetchone("SELECT * FROM broadcast_jobs WHERE id=?", (job_id,))
+        if job is None:
+            return None
+        rows = await self.pool.fetchall("SELECT status, COUNT(*) AS c FROM broadcast_targets WHERE job_id=? GROUP BY status",
+                                        (job_id,))
+        out = dict(job)
+        out["targets"] = {r["status"]: r["c"] for r in rows}
+        return out
+
+    async def recent_jobs(self, limit: int = 10) -> List[sqlite3.Row]:
+        return await self.pool.fetchall("SELECT id, kind, status, total, sent, failed FROM broadcast_jobs "
+                                        "ORDER BY id DESC LIMIT ?", (limit,))
+
+    # ---- 执行 ----
+    async def _run_job(self, job_id: int) -> None:
+        try:
+            await self._execute(job_id)
+        except Exception:
+            # 载荷损坏、DB 出错等：任务落到 failed，resume() 不会在每次启动时重跑同一个崩溃
+            logger.exception("Broadcast job %s failed", job_id)
+            try:
+                await self.pool.execute("UPDATE broadcast_jobs SET status='failed', finished_at=CURRENT_TIMESTAMP "
+                                        "WHERE id=? AND status IN ('queued','running')", (job_id,))
+            except Exception:
+                logger.exception("Broadcast job %s: marking failed", job_id)
+        finally:
+            if self._tasks.get(job_id) is asyncio.current_task():
+                self._tasks.pop(job_id, None)
+
+    async def _execute(self, job_id: int) -> None:
+        job = await self.pool.fetchone("SELECT payload, status FROM broadcast_jobs WHERE id=?", (job_id,))
+        if job is None or job["status"] not in ("queued", "running"):
+            return
+        payload = json.loads(job["payload"])
+        await self.pool.execute("UPDATE broadcast_jobs SET status='running', started_at=coalesce(started_at, CURRENT_TIMESTAMP) "
+                                "WHERE id=?", (job_id,))
+        rows = await self.pool.fetchall("SELECT chat_id, attempts FROM broadcast_targets WHERE job_id=? AND status='pending'",
+                                        (job_id,))
+        queue: "asyncio.Queue[Tuple[str, int]]" = asyncio.Queue()
+        for r in rows:
+            queue.put_nowait((r["chat_id"], r["attempts"]))
+        results: List[Tuple[str, int, Optional[int], Optional[str], int, str]] = []
+        t0 = time.monotonic()
+
+        async def flush() -> None:
+            if not results:
+                return
+            batch = results[:]
+            results.clear()
+            await self._record(job_id, batch)
+
+        async def worker() -> None:
+            while True:
+                try:
+                    chat_id, attempts = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self.per_chat.wait(chat_id)
+                await self.bucket.acquire()
+                attempts += 1
+                try:
+                    sent = await self._send(_chat_arg(chat_id), payload)
+                    results.append(("sent", attempts, getattr(sent, "message_id", None), None, job_id, chat_id))
+                except TelegramRetryAfter as e:
+                    self.retry_after_hits += 1
+                    self.bucket.pause(e.retry_after)
+                    queue.put_nowait((chat_id, attempts - 1))  # 限流不计入失败次数
+                except TelegramMigrateToChat as e:
+                    results.append(("failed", attempts, None, f"migrated to {e.migrate_to_chat_id}", job_id, chat_id))
+                except TelegramForbiddenError as e:
+                    results.append(("blocked", attempts, None, str(e)[:200], job_id, chat_id))
+                except (TelegramBadRequest, TelegramEntityTooLarge) as e:  # 后者是 NetworkError 子类，重试无意义
+                    results.append(("failed", attempts, None, str(e)[:200], job_id, chat_id))
+                except TRANSIENT_ERRORS as e:
+                    if attempts < self.max_attempts:
+                        await asyncio.sleep(min(30.0, 0.5 * 2 ** attempts) * (0.5 + random.random()))
+                        queue.put_nowait((chat_id, attempts))
+                    else:
+                        results.append(("failed", attempts, None, str(e)[:200], job_id, chat_id))
+                except Exception as e:
+                    # TelegramNotFound/EntityTooLarge/Unauthorized、载荷校验失败、媒体解析失败等：
+                    # 记为该目标失败，不让一个目标的异常拖垮整个任务(否则任务卡在 running，重启后又崩一次)
+                    logger.warning("Broadcast job %s target %s failed: %s", job_id, chat_id, e)
+                    results.append(("failed", attempts, None, f"{type(e).__name__}: {e}"[:200], job_id, chat_id))
+                if len(results) >= self.status_batch:
+                    await flush()
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(self.concurrency, max(1, queue.qsize())))]
+        status = "done"
+        try:
+            await asyncio.gather(*workers)
+        except Exception:
+            status = "failed"
+            logger.exception("Broadcast job %s aborted", job_id)
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await flush()
+        await self.pool.execute("UPDATE broadcast_jobs SET status=?, finished_at=CURRENT_TIMESTAMP "
+                                "WHERE id=? AND status='running'", (status, job_id))
+        logger.info("Broadcast job %s %s: %d targets in %.1fs", job_id, status, len(rows), time.monotonic() - t0)
+
+    async def _record(self, job_id: int, batch: List[Tuple[str, int, Optional[int], Optional[str], int, str]]) -> None:
+        sent = sum(1 for r in batch if r[0] == "sent")
+        failed = len(batch) - sent
+
+        def _do(c: sqlite3.Connection) -> None:
+            c.executemany("""UPDATE broadcast_targets SET status=?, attempts=?, message_id=?, error=?,
+                             updated_at=CURRENT_TIMESTAMP WHERE job_id=? AND chat_id=?""", batch)
+            c.execute("UPDATE broadcast_jobs SET sent=sent+?, failed=failed+? WHERE id=?", (sent, failed, job_id))
+            c.commit()
+        await self.pool.run(_do, "broadcast.record")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": sorted(j for j, t in self._tasks.items() if not t.done()),
+                "retry_after": self.retry_after_hits}
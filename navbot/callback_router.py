@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# 回调路由表：callback_data 一次解析、按表直达 handler
+#
+# aiogram 对每个回调按注册顺序逐个求值过滤器(F.data.startswith(...)、lambda …)，
+# 回调种类越多越慢，前缀重叠时(ad_ 与 ad_contact_)谁先注册谁生效。这里改为：
+#
+#   1) 完全匹配：dict 查找
+#   2) 前缀匹配：按已登记的前缀长度从长到短切片查 dict，最长前缀优先
+#   3) 同一键上可按 FSM 状态区分多个 handler：状态匹配的优先，其次是不限状态的
+#
+# 查找代价只与"不同前缀长度的个数"有关，与登记的 handler 数量无关。
+# 键与状态完全相同的重复登记直接报错，冲突在启动时暴露而不是静默被遮蔽。
+#
+#     cb = CallbackRouter()
+#     cb.attach(dp)                                    # 在 dp.callback_query 上注册唯一的分发 handler
+#
+#     @cb.exact("go_home")
+#     async def on_home(cq): ...
+#
+#     @cb.prefix("ad:preview:", int)                   # parts 按类型转换，转换失败视为不匹配
+#     async def on_preview(cq, args: CallbackArgs): ad_id = args.parts[0]
+#
+#     @cb.prefix("adcat:pick:", int, state=NewAd.cat)  # handler 可声明 state 等任意 aiogram 注入参数
+#     async def on_pick(cq, args, state): ...
+
+import inspect
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from aiogram import Dispatcher
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class CallbackArgs(NamedTuple):
+    """解析后的 callback_data：data=原文，prefix=命中的键，rest=去掉前缀的部分，parts=按分隔符切分并转换后的字段。"""
+    data: str
+    prefix: str
+    rest: str
+    parts: Tuple[Any, ...]
+
+
+class Route(NamedTuple):
+    key: str
+    fn: Handler
+    state: Optional[str]
+    sep: Optional[str]
+    types: Tuple[Callable[[str], Any], ...]
+    params: Optional[frozenset]  # None 表示 handler 接受 **kwargs
+
+    def parse(self, data: str) -> Optional[CallbackArgs]:
+        rest = data[len(self.key):]
+        if self.sep is None:
+            raw: List[str] = [rest] if rest else []
+        else:
+            raw = rest.split(self.sep) if rest else []
+        if len(raw) < len(self.types):
+            return None
+        try:
+            parts = tuple(t(v) for t, v in zip(self.types, raw)) + tuple(raw[len(self.types):])
+        except ValueError:
+            return None
+        return CallbackArgs(data, self.key, rest, parts)
+
+
+def _state_name(state: Union[State, str, None]) -> Optional[str]:
+    if state is None or isinstance(state, str):
+        return state
+    return state.state
+
+
+def _params(fn: Handler) -> Optional[frozenset]:
+    sig = inspect.signature(fn)
+    if any(p.kind is p.VAR_KEYWORD for p in sig.parameters.values()):
+        return None
+    return frozenset(list(sig.parameters)[1:])
+
+
+class CallbackRouter:
+    def __init__(self) -> None:
+        self._exact: Dict[str, List[Route]] = {}
+        self._prefix: Dict[str, List[Route]] = {}
+        self._lengths: Tuple[int, ...] = ()  # 前缀长度，降序
+        self.hits = 0
+        self.misses = 0
+
+    # ---- 登记 ----
+    def _add(self, table: Dict[str, List[Route]], key: str, fn: Handler, state: Union[State, str, None],
+             sep: Optional[str], types: Sequence[Callable[[str], Any]]) -> Handler:
+        st = _state_name(state)
+        routes = table.setdefault(key, [])
+        if any(r.state == st for r in routes):
+            raise ValueError(f"callback route {key!r} (state={st}) already registered")
+        routes.append(Route(key, fn, st, sep, tuple(types), _params(fn)))
+        routes.sort(key=lambda r: r.state is None)  # 带状态的在前
+        if table is self._prefix:
+            self._lengths = tuple(sorted({len(k) for k in self._prefix}, reverse=True))
+        return fn
+
+    def exact(self, data: str, state: Union[State, str, None] = None) -> Callable[[Handler], Handler]:
+        return lambda fn: self._add(self._exact, data, fn, state, None, ())
+
+    def prefix(self, prefix: str, *types: Callable[[str], Any], sep: Optional[str] = ":",
+               state: Union[State, str, None] = None) -> Callable[[Handler], Handler]:
+        if not prefix:
+            raise ValueError("empty callback prefix")
+        return lambda fn: self._add(self._prefix, prefix, fn, state, sep, types)
+
+    # ---- 解析 ----
+    @staticmethod
+    def _pick(routes: List[Route], state: Optional[str]) -> Optional[Route]:
+        for r in routes:
+            if r.state is None or r.state == state:
+                return r
+        return None
+
+    def resolve(self, data: str, state: Optional[str] = None) -> Optional[Tuple[Route, CallbackArgs]]:
+        """完全匹配优先，其次最长前缀；同一键上状态匹配的 handler 优先于不限状态的。"""
+        routes = self._exact.get(data)
+        if routes:
+            r = self._pick(routes, state)
+            if r is not None:
+                return r, CallbackArgs(data, data, "", ())
+        for n in self._lengths:
+            if n > len(data):
+                continue
+            routes = self._prefix.get(data[:n])
+            if routes:
+                r = self._pick(routes, state)
+                if r is not None:
+                    args = r.parse(data)
+                    if args is not None:
+                        return r, args
+        return None
+
+    # ---- aiogram 接入 ----
+    async def match(self, cq: CallbackQuery, raw_state: Optional[str] = None) -> Union[bool, Dict[str, Any]]:
+        """过滤器：命中时把路由与解析结果注入 handler 参数。"""
+        if not cq.data:
+            return False
+        found = self.resolve(cq.data, raw_state)
+        if found is None:
+            self.misses += 1
+            return False
+        return {"cb_route": found[0], "cb_args": found[1]}
+
+    async def handle(self, cq: CallbackQuery, cb_route: Route, cb_args: CallbackArgs, **data: Any) -> Any:
+        self.hits += 1
+        data["args"] = cb_args
+        if cb_route.params is None:
+            return await cb_route.fn(cq, **data)
+        return await cb_route.fn(cq, **{k: v for k, v in data.items() if k in cb_route.params})
+
+    def attach(self, dp: Dispatcher) -> None:
+        dp.callback_query.register(self.handle, self.match)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"exact": len(self._exact), "prefix": len(self._prefix), "prefix_lengths": len(self._lengths),
+                "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+# 广告点击分析：曝光/点击按小时与总量汇总、CTR、独立点击用户(HyperLogLog)
+#
+# - 明细：ad_clicks(点击)、ad_impressions(发送即一次曝光)，经 write-behind 批量写入
+# - 汇总：插入触发器同步累加 ad_click_hourly / ad_click_totals / ad_impr_hourly / ad_impr_totals
+# - 去重：每个广告按天 + 全量('*')各一个 HLL 草图(2KB)，内存里只保留上次落库后的增量，
+#   定期与库中草图取最大合并(幂等，多实例安全)
+# - 报表只读汇总表与草图，与点击明细行数无关
+#
+# 时间统一用 UTC，小时桶格式 'YYYY-MM-DD HH'。
+
+import time
+import asyncio
+import logging
+import sqlite3
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from navbot.hll import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+HLL_P = 11
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS ad_clicks(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        username TEXT,
+        ad_id TEXT,
+        button_label TEXT,
+        clicked_at TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_ad_clicks_ad_time ON ad_clicks(ad_id, clicked_at)",
+    """CREATE TABLE IF NOT EXISTS ad_impressions(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ad_id TEXT NOT NULL,
+        chat_id TEXT,
+        sent_at TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_ad_impressions_ad_time ON ad_impressions(ad_id, sent_at)",
+    """CREATE TABLE IF NOT EXISTS ad_click_hourly(
+        ad_id TEXT NOT NULL, hour TEXT NOT NULL, button TEXT NOT NULL, n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(ad_id, hour, button)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS ad_click_totals(
+        ad_id TEXT NOT NULL, button TEXT NOT NULL, n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(ad_id, button)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS ad_impr_hourly(
+        ad_id TEXT NOT NULL, hour TEXT NOT NULL, n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(ad_id, hour)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS ad_impr_totals(
+        ad_id TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS ad_click_hll(
+        ad_id TEXT NOT NULL, day TEXT NOT NULL, regs BLOB NOT NULL,
+        PRIMARY KEY(ad_id, day)
+    ) WITHOUT ROWID""",
+    """CREATE TRIGGER IF NOT EXISTS trg_ad_clicks_rollup AFTER INSERT ON ad_clicks BEGIN
+        INSERT INTO ad_click_hourly(ad_id, hour, button, n)
+        VALUES(coalesce(NEW.ad_id, ''), replace(substr(coalesce(NEW.clicked_at, CURRENT_TIMESTAMP), 1, 13), 'T', ' '),
+               coalesce(NEW.button_label, ''), 1)
+        ON CONFLICT(ad_id, hour, button) DO UPDATE SET n=n+1;
+        INSERT INTO ad_click_totals(ad_id, button, n) VALUES(coalesce(NEW.ad_id, ''), coalesce(NEW.button_label, ''), 1)
+        ON CONFLICT(ad_id, button) DO UPDATE SET n=n+1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_ad_impressions_rollup AFTER INSERT ON ad_impressions BEGIN
+        INSERT INTO ad_impr_hourly(ad_id, hour, n)
+        VALUES(NEW.ad_id, replace(substr(NEW.sent_at, 1, 13), 'T', ' '), 1)
+        ON CONFLICT(ad_id, hour) DO UPDATE SET n=n+1;
+        INSERT INTO ad_impr_totals(ad_id, n) VALUES(NEW.ad_id, 1)
+        ON CONFLICT(ad_id) DO UPDATE SET n=n+1;
+    END""",
+)
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def _merge_regs(a: bytes, b: bytes) -> bytes:
+    return bytes(map(max, a, b))
+
+
+class ClickAnalytics:
+    def __init__(self, pool: Any, writer: Any, flush_interval: float = 5.0):
+        self.pool = pool
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[str, str], HyperLogLog] = {}  # (ad_id, day|'*') → 未落库的增量草图
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.clicks = 0
+        self.impressions = 0
+        self.sketch_flushes = 0
+        writer.register("ad_clicks", pool, """INSERT INTO ad_clicks(user_id, username, ad_id, button_label, clicked_at)
+                                              VALUES(?,?,?,?,?)""")
+        writer.register("ad_impressions", pool, "INSERT INTO ad_impressions(ad_id, chat_id, sent_at) VALUES(?,?,?)")
+
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection) -> None:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+
+    # ---- 记录 ----
+    def _sketch(self, ad_id: str, day: str) -> HyperLogLog:
+        h = self._pending.get((ad_id, day))
+        if h is None:
+            h = self._pending[(ad_id, day)] = HyperLogLog(HLL_P)
+        return h
+
+    def click(self, user_id: int, username: Optional[str], ad_id: str, label: str) -> None:
+        now = _utcnow()
+        ad_id = str(ad_id)
+        self.writer.submit("ad_clicks", (user_id, username, ad_id, label, now.isoformat()))
+        self._sketch(ad_id, now.date().isoformat()).add(user_id)
+        self._sketch(ad_id, "*").add(user_id)
+        self.clicks += 1
+
+    def impression(self, ad_id: Any, chat_id: Any) -> None:
+        self.writer.submit("ad_impressions", (str(ad_id), str(chat_id), _utcnow().isoformat()))
+        self.impressions += 1
+
+    # ---- 草图落库 ----
+    @staticmethod
+    def _store_sketches(c: sqlite3.Connection, items: List[Tuple[str, str, bytes]]) -> None:
+        c.execute("BEGIN IMMEDIATE")
+        for ad_id, day, regs in items:
+            row = c.execute("SELECT regs FROM ad_click_hll WHERE ad_id=? AND day=?", (ad_id, day)).fetchone()
+            if row is not None:
+                regs = _merge_regs(row[0], regs)
+            c.execute("INSERT OR REPLACE INTO ad_click_hll(ad_id, day, regs) VALUES(?,?,?)", (ad_id, day, regs))
+        c.commit()
+
+    async def flush_sketches(self) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        items = [(ad_id, day, h.to_bytes()) for (ad_id, day), h in pending.items()]
+        try:
+            await self.pool.run(lambda c: self._store_sketches(c, items), "clicks.hll")
+        except Exception as e:
+            # 失败时放回，下次再合并(合并幂等，不会重复计数)
+            for key, h in pending.items():
+                self._sketch(*key).merge(h)
+            logger.warning("click sketch flush failed: %s", e)
+            return 0
+        self.sketch_flushes += 1
+        return len(items)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_sketches()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="click-sketches")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush_sketches()
+
+    # ---- 回填 ----
+    _CLICK_AGG = """SELECT coalesce(ad_id, ''), replace(substr(coalesce(clicked_at, CURRENT_TIMESTAMP), 1, 13), 'T', ' '),
+                           coalesce(button_label, ''), COUNT(*) FROM ad_clicks WHERE id{op}? GROUP BY 1, 2, 3"""
+    _IMPR_AGG = """SELECT ad_id, replace(substr(sent_at, 1, 13), 'T', ' '), COUNT(*)
+                   FROM ad_impressions WHERE id{op}? GROUP BY 1, 2"""
+    _CLICK_USERS = """SELECT DISTINCT coalesce(ad_id, ''), substr(coalesce(clicked_at, CURRENT_TIMESTAMP), 1, 10), user_id
+                      FROM ad_clicks WHERE id{op}?"""
+
+    def _backfill(self, c: sqlite3.Connection) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        cut_c = c.execute("SELECT coalesce(max(id), 0) FROM ad_clicks").fetchone()[0]
+        cut_i = c.execute("SELECT coalesce(max(id), 0) FROM ad_impressions").fetchone()[0]
+        sketches: Dict[Tuple[str, str], HyperLogLog] = {}
+
+        def add_users(rows: Any) -> None:
+            for ad_id, day, user_id in rows:
+                for key in ((ad_id, day), (ad_id, "*")):
+                    h = sketches.get(key)
+                    if h is None:
+                        h = sketches[key] = HyperLogLog(HLL_P)
+                    h.add(user_id)
+
+        # 阶段 1：只读快照上聚合 id<=cutoff 的明细(不占写锁)
+        c.execute("DROP TABLE IF EXISTS temp.bf_ch")
+        c.execute("DROP TABLE IF EXISTS temp.bf_ih")
+        c.execute("CREATE TEMP TABLE bf_ch(ad_id, hour, button, n)")
+        c.execute("CREATE TEMP TABLE bf_ih(ad_id, hour, n)")
+        c.execute("INSERT INTO temp.bf_ch " + self._CLICK_AGG.format(op="<="), (cut_c,))
+        c.execute("INSERT INTO temp.bf_ih " + self._IMPR_AGG.format(op="<="), (cut_i,))
+        c.commit()
+        add_users(c.execute(self._CLICK_USERS.format(op="<="), (cut_c,)))
+        # 阶段 2：短事务内补上回填期间的新行并替换汇总表
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("INSERT INTO temp.bf_ch " + self._CLICK_AGG.format(op=">"), (cut_c,))
+        c.execute("INSERT INTO temp.bf_ih " + self._IMPR_AGG.format(op=">"), (cut_i,))
+        add_users(c.execute(self._CLICK_USERS.format(op=">"), (cut_c,)).fetchall())
+        for t in ("ad_click_hourly", "ad_click_totals", "ad_impr_hourly", "ad_impr_totals", "ad_click_hll"):
+            c.execute(f"DELETE FROM {t}")
+        c.execute("INSERT INTO ad_click_hourly(ad_id, hour, button, n) SELECT ad_id, hour, button, SUM(n) FROM temp.bf_ch GROUP BY 1, 2, 3")
+        c.execute("INSERT INTO ad_click_totals(ad_id, button, n) SELECT ad_id, button, SUM(n) FROM temp.bf_ch GROUP BY 1, 2")
+        c.execute("INSERT INTO ad_impr_hourly(ad_id, hour, n) SELECT ad_id, hour, SUM(n) FROM temp.bf_ih GROUP BY 1, 2")
+        c.execute("INSERT INTO ad_impr_totals(ad_id, n) SELECT ad_id, SUM(n) FROM temp.bf_ih GROUP BY 1")
+        c.executemany("INSERT INTO ad_click_hll(ad_id, day, regs) VALUES(?,?,?)",
+                      [(a, d, h.to_bytes()) for (a, d), h in sketches.items()])
+        c.commit()
+        c.execute("DROP TABLE temp.bf_ch")
+        c.execute("DROP TABLE temp.bf_ih")
+        clicks = c.execute("SELECT coalesce(SUM(n), 0) FROM ad_click_totals").fetchone()[0]
+        return {"clicks": clicks, "ads": len({a for a, _ in sketches}), "seconds": time.perf_counter() - t0}
+
+    async def backfill(self) -> Dict[str, Any]:
+        """从 ad_clicks / ad_impressions 明细全量重建汇总与草图，返回 {clicks, ads, seconds}。"""
+        return await self.pool.run(self._backfill, "clicks.backfill")
+
+    async def backfill_if_empty(self) -> bool:
+        def _check(c: sqlite3.Connection) -> bool:
+            empty = c.execute("SELECT 1 FROM ad_click_totals LIMIT 1").fetchone() is None
+            return empty and c.execute("SELECT 1 FROM ad_clicks LIMIT 1").fetchone() is not None
+        if not await self.pool.run(_check, "clicks.check"):
+            return False
+        await self.backfill()
+        return True
+
+    # ---- 报表 ----
+    def _report(self, c: sqlite3.Connection, ad_id: str, hours: int, days: int) -> Dict[str, Any]:
+        now = _utcnow()
+        buttons = [(r[0], r[1]) for r in c.execute(
+            "SELECT button, n FROM ad_click_totals WHERE ad_id=? ORDER BY n DESC", (ad_id,))]
+        impr = c.execute("SELECT n FROM ad_impr_totals WHERE ad_id=?", (ad_id,)).fetchone()
+        since_hour = (now - datetime.timedelta(hours=hours - 1)).strftime("%Y-%m-%d %H")
+        clicks_by_hour = dict(c.execute("""SELECT hour, SUM(n) FROM ad_click_hourly WHERE ad_id=? AND hour>=?
+                                           GROUP BY hour""", (ad_id, since_hour)).fetchall())
+        impr_by_hour = dict(c.execute("SELECT hour, n FROM ad_impr_hourly WHERE ad_id=? AND hour>=?",
+                                      (ad_id, since_hour)).fetchall())
+        since_day = (now.date() - datetime.timedelta(days=days - 1)).isoformat()
+        sketches = {r[0]: r[1] for r in c.execute(
+            "SELECT day, regs FROM ad_click_hll WHERE ad_id=? AND (day='*' OR day>=?)", (ad_id, since_day))}
+        return {"buttons": buttons, "impressions": impr[0] if impr else 0, "clicks_by_hour": clicks_by_hour,
+                "impr_by_hour": impr_by_hour, "sketches": sketches, "since_day": since_day}
+
+    def _uniques(self, ad_id: str, stored: Dict[str, bytes], days: List[str]) -> Dict[str, int]:
+        """合并库中草图与内存中尚未落库的增量。"""
+        def merged(keys: List[str]) -> int:
+            h = HyperLogLog(HLL_P)
+            for k in keys:
+                if k in stored:
+                    h.merge(HyperLogLog.from_bytes(stored[k]))
+                p = self._pending.get((ad_id, k))
+                if p is not None:
+                    h.merge(p)
+            return h.count()
+        return {"all": merged(["*"]), "range": merged(days)}
+
+    async def report(self, ad_id: Any, hours: int = 24, days: int = 7) -> Dict[str, Any]:
+        ad_id = str(ad_id)
+        r = await self.pool.run(lambda c: self._report(c, ad_id, hours, days), "clicks.report")
+        today = _utcnow().date()
+        day_keys = [(today - datetime.timedelta(days=i)).isoformat() for i in range(days)]
+        clicks = sum(n for _, n in r["buttons"])
+        impressions = r["impressions"]
+        uniques = self._uniques(ad_id, r["sketches"], day_keys)
+        now = _utcnow()
+        hour_keys = [(now - datetime.timedelta(hours=i)).strftime("%Y-%m-%d %H") for i in range(hours - 1, -1, -1)]
+        return {
+            "ad_id": ad_id,
+            "clicks": clicks,
+            "impressions": impressions,
+            "ctr": clicks / impressions if impressions else None,
+            "unique_clickers": uniques["all"],
+            "unique_clickers_range": uniques["range"],
+            "days": days,
+            "buttons": r["buttons"],
+            "hourly": [(h, r["clicks_by_hour"].get(h, 0), r["impr_by_hour"].get(h, 0)) for h in hour_keys],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"clicks": self.clicks, "impressions": self.impressions,
+                "pending_sketches": len(self._pending), "sketch_flushes": self.sketch_flushes}
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# SQLite 连接池 + 专用线程执行器
+#
+# - 固定数量的长连接(WAL 模式)，避免每次调用都 sqlite3.connect()
+# - 查询在专用 ThreadPoolExecutor 中执行，handler 直接 await，不阻塞事件循环
+# - 记录取连接等待时间与查询耗时，stats() 输出 p50/p95/p99
+
+import time
+import queue
+import sqlite3
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+def _percentile(samples: Sequence[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    data = sorted(samples)
+    k = min(len(data) - 1, max(0, int(round(pct / 100.0 * (len(data) - 1)))))
+    return data[k]
+
+
+class LatencyWindow:
+    """最近 N 次耗时(秒)的滑动窗口，线程安全。"""
+
+    def __init__(self, size: int = 2048):
+        self._buf: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._buf.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            data = list(self._buf)
+            count, total = self.count, self.total
+        return {
+            "count": count,
+            "avg_ms": (total / count * 1000.0) if count else 0.0,
+            "p50_ms": _percentile(data, 50) * 1000.0,
+            "p95_ms": _percentile(data, 95) * 1000.0,
+            "p99_ms": _percentile(data, 99) * 1000.0,
+        }
+
+
+class SQLitePool:
+    """
+    有界 SQLite 连接池。
+
+    同步代码用 `with pool.connection() as c:`；
+    异步代码用 `await pool.fetchone(...)` 等方法，查询在专用线程中执行。
+    """
+
+    def __init__(self, path: str, size: int = 4, timeout: float = 10.0):
+        self.path = path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=self.size)
+        self._created = 0
+        self._create_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._closed = False
+        self.wait_stats = LatencyWindow()
+        self.query_stats = LatencyWindow()
+        self.errors = 0
+        # 观察钩子：fn(sql_or_name, seconds)，供指标系统挂接
+        self.on_query: Optional[Callable[[str, float], None]] = None
+
+    # ---- 连接管理 ----
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("SQLitePool is closed")
+        t0 = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._create_lock:
+                if self._created < self.size:
+                    self._created += 1
+                    try:
+                        conn = self._connect()
+                    except Exception:
+                        self._created -= 1
+                        raise
+            if conn is None:
+                conn = self._idle.get(timeout=self.timeout)
+        self.wait_stats.add(time.perf_counter() - t0)
+        return conn
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        if self._closed:
+            conn.close()
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    # ---- 执行 ----
+    def _timed(self, label: str, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self.connection() as conn:
+            t0 = time.perf_counter()
+            try:
+                return fn(conn)
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                dt = time.perf_counter() - t0
+                self.query_stats.add(dt)
+                if self.on_query is not None:
+                    try:
+                        self.on_query(label, dt)
+                    except Exception:
+                        pass
+
+    def run_sync(self, fn: Callable[[sqlite3.Connection], Any], label: str = "run") -> Any:
+        """在当前线程用池内连接执行 fn(conn)。仅用于极短的查询或非事件循环线程。"""
+        return self._timed(label, fn)
+
+    async def run(self, fn: Callable[[sqlite3.Connection], Any], label: str = "run") -> Any:
+        """在专用线程执行 fn(conn)，返回其结果。fn 内需要写入时自行 commit。"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="sqlite")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._timed, label, fn)
+
+    async def fetchone(self, sql: str, params: Iterable[Any] = ()) -> Optional[sqlite3.Row]:
+        return await self.run(lambda c: c.execute(sql, tuple(params)).fetchone(), sql)
+
+    async def fetchall(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        return await self.run(lambda c: c.execute(sql, tuple(params)).fetchall(), sql)
+
+    async def execute(self, sql: str, params: Iterable[Any] = ()) -> int:
+        """执行写语句并提交，返回 lastrowid。"""
+        def _do(c: sqlite3.Connection) -> int:
+            cur = c.execute(sql, tuple(params))
+            c.commit()
+            return cur.lastrowid
+        return await self.run(_do, sql)
+
+    async def executemany(self, sql: str, seq: Iterable[Iterable[Any]]) -> int:
+        """批量写入(单事务)，返回影响行数。"""
+        rows = [tuple(p) for p in seq]
+
+        def _do(c: sqlite3.Connection) -> int:
+            cur = c.executemany(sql, rows)
+            c.commit()
+            return cur.rowcount
+        return await self.run(_do, sql)
+
+    # ---- 统计/关闭 ----
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "open": self._created,
+            "idle": self._idle.qsize(),
+            "errors": self.errors,
+            "wait": self.wait_stats.summary(),
+            "query": self.query_stats.summary(),
+        }
+
+    def close(self) -> None:
+        self._closed = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
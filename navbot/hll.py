@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# HyperLogLog 基数估计：固定 2^p 字节寄存器，p=11 时 2KB、标准误差约 2.3%
+#
+# 合并(逐寄存器取最大)满足交换律与幂等，多个进程各自累加后写库时可直接合并。
+
+import math
+import hashlib
+from typing import Any, Iterable, Optional
+
+_INV_POW2 = tuple(2.0 ** -i for i in range(65))
+
+
+def _hash64(value: Any) -> int:
+    return int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    __slots__ = ("p", "m", "regs")
+
+    def __init__(self, p: int = 11, regs: Optional[bytes] = None):
+        if not 4 <= p <= 16:
+            raise ValueError("p must be in [4, 16]")
+        self.p = p
+        self.m = 1 << p
+        if regs is not None and len(regs) != self.m:
+            raise ValueError(f"expected {self.m} registers, got {len(regs)}")
+        self.regs = bytearray(regs) if regs is not None else bytearray(self.m)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(p=len(data).bit_length() - 1, regs=data)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.regs)
+
+    def add(self, value: Any) -> None:
+        h = _hash64(value)
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.regs[idx]:
+            self.regs[idx] = rank
+
+    def update(self, values: Iterable[Any]) -> None:
+        for v in values:
+            self.add(v)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("cannot merge sketches with different precision")
+        self.regs = bytearray(map(max, self.regs, other.regs))
+        return self
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        est = alpha * m * m / sum(_INV_POW2[r] for r in self.regs)
+        if est <= 2.5 * m:
+            zeros = self.regs.count(0)
+            if zeros:
+                est = m * math.log(m / zeros)  # 小基数用线性计数
+        return int(round(est))
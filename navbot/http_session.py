@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# 调优的 Bot API HTTP 会话：连接池/保活参数、按方法的超时、网络错误自动重试、请求耗时钩子
+#
+# - 连接池：limit(总连接数)、limit_per_host(单主机，0 不限)、keepalive(空闲连接保活秒数)、DNS 缓存；
+#   所有请求都发往同一个 Bot API 主机，保活时间长一些可以少建连接(TLS 握手是 Telegram 请求里最贵的一步)
+# - 超时：调用方显式传入的超时(如轮询的 getUpdates)原样使用；否则按方法查表(上传类方法更长、回调应答更短)，
+#   查不到用会话默认值；建立连接另有较短的 connect 超时，连不上的主机尽早失败、进入重试
+# - 重试：只重试 TelegramNetworkError(超时、断连、连接失败)，指数退避 + 随机抖动；
+#   幂等方法(get*/edit*/answer*/delete* 等)任何网络错误都重试，发送类方法只在"连接没建立起来"时重试，
+#   避免请求已送达、只是响应丢了时重复发消息；getUpdates 不重试(轮询循环自带退避)
+#   429/400 等 API 错误不在这里处理(群发见 navbot/broadcast.py 的 send_with_retry)
+# - 钩子：on_request(method, attempt) / on_response(method, seconds, attempt, error)，每次尝试各调用一次；
+#   连接器统计新建连接数(其余请求复用保活连接)，stats() 汇总
+#
+#     session = TunedSession(api=server, limit=100, keepalive=60, retries=2, timeouts={"sendPhoto": 60})
+#     bot = Bot(token, session=session)
+
+import random
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from aiohttp import ClientConnectorError, ClientTimeout, TCPConnector
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramNetworkError
+
+logger = logging.getLogger(__name__)
+
+# 秒；未列出的方法用会话默认超时
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "answerCallbackQuery": 10.0,  # 回调应答超过 15 秒 Telegram 就不再接受，等久了没有意义
+    "sendPhoto": 60.0,
+    "sendDocument": 120.0,
+    "sendVideo": 120.0,
+    "sendMediaGroup": 120.0,
+}
+
+# 重复执行结果相同，响应丢失时可以放心重发
+IDEMPOTENT_PREFIXES = ("get", "edit", "answer", "delete", "set", "ban", "unban", "restrict", "promote",
+                       "pin", "unpin", "leave", "close", "logOut")
+NO_RETRY = frozenset({"getUpdates"})
+
+RequestHook = Callable[[str, int], None]
+ResponseHook = Callable[[str, float, int, Optional[BaseException]], None]
+
+
+def parse_timeouts(raw: str) -> Dict[str, float]:
+    """'sendPhoto=60,answerCallbackQuery=5' → {方法: 秒}；格式不对的项忽略。"""
+    out: Dict[str, float] = {}
+    for part in raw.split(","):
+        name, _, value = part.partition("=")
+        try:
+            out[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return {k: v for k, v in out.items() if k and v > 0}
+
+
+def is_idempotent(method: str) -> bool:
+    return method.startswith(IDEMPOTENT_PREFIXES)
+
+
+class CountingConnector(TCPConnector):
+    """记录新建连接数；其余请求复用了保活连接。(aiohttp 的 TraceConfig 也能做到，但每个请求要多花约 0.15 ms)"""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.created = 0
+
+    async def _create_connection(self, req: Any, traces: Any, timeout: Any) -> Any:
+        self.created += 1
+        return await super()._create_connection(req, traces, timeout)
+
+
+class TunedSession(AiohttpSession):
+    def __init__(self, limit: int = 100, limit_per_host: int = 0, keepalive: float = 60.0,
+                 dns_ttl: int = 3600, connect_timeout: float = 10.0,
+                 timeouts: Optional[Dict[str, float]] = None, retries: int = 2,
+                 backoff: float = 0.5, backoff_max: float = 8.0, **kwargs: Any):
+        super().__init__(limit=limit, **kwargs)
+        if self.proxy is None:  # 代理连接器有自己的参数，不动
+            self._connector_type = CountingConnector
+            self._connector_init.update(limit_per_host=limit_per_host, keepalive_timeout=keepalive,
+                                        ttl_dns_cache=dns_ttl)
+        self.connect_timeout = connect_timeout
+        self.timeouts: Dict[str, float] = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.on_request: List[RequestHook] = []
+        self.on_response: List[ResponseHook] = []
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0  # 重试用尽(或不可重试)的网络错误
+        self.errors_by_method: Dict[str, int] = {}
+        self.net_errors = 0
+        self._no_retry: Set[str] = set(NO_RETRY)
+
+    # ---- 连接 ----
+    def connections(self) -> Dict[str, int]:
+        conn = self._session.connector if self._session is not None else None
+        created = getattr(conn, "created", 0)
+        return {"conn_created": created, "conn_reused": max(0, self.requests - self.net_errors - created)}
+
+    # ---- 请求 ----
+    def timeout_for(self, method: str, timeout: Optional[float] = None) -> ClientTimeout:
+        total = timeout if timeout is not None else self.timeouts.get(method, self.timeout)
+        return ClientTimeout(total=total, sock_connect=min(self.connect_timeout, total))
+
+    def should_retry(self, method: str, error: TelegramNetworkError, attempt: int) -> bool:
+        if attempt >= self.retries or method in self._no_retry:
+            return False
+        return is_idempotent(method) or isinstance(error.__cause__, ClientConnectorError)
+
+    def delay(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待：指数退避，乘 [0.5, 1.5) 的随机系数，避免大批请求同时重试。"""
+        return min(self.backoff_max, self.backoff * 2 ** attempt) * (0.5 + random.random())
+
+    async def make_request(self, bot: Any, method: Any, timeout: Optional[int] = None) -> Any:
+        name = method.__api_method__
+        ct = self.timeout_for(name, timeout)
+        attempt = 0
+        while True:
+            for hook in self.on_request:
+                hook(name, attempt)
+            self.requests += 1
+            t0 = asyncio.get_running_loop().time()
+            error: Optional[BaseException] = None
+            try:
+                return await super().make_request(bot, method, ct)  # type: ignore[arg-type]
+            except TelegramNetworkError as e:
+                error = e
+                self.net_errors += 1
+                if not self.should_retry(name, e, attempt):
+                    self.failed += 1
+                    self.errors_by_method[name] = self.errors_by_method.get(name, 0) + 1
+                    raise
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                dt = asyncio.get_running_loop().time() - t0
+                for rhook in self.on_response:
+                    rhook(name, dt, attempt, error)
+            wait = self.delay(attempt)
+            logger.warning("%s failed (%s), retry %d/%d in %.2fs", name, error, attempt + 1, self.retries, wait)
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"requests": self.requests, "retried": self.retried, "failed": self.failed}
+        out.update(self.connections())
+        out["errors"] = dict(self.errors_by_method)
+        return out
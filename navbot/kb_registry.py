@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# 内联键盘注册表：每个键盘按参数构建一次，设置/数据版本变化后再惰性重建
+#
+# 用法：
+#     keyboards = KeyboardRegistry(lambda: settings.version)
+#
+#     @keyboards.memo
+#     def main_menu() -> InlineKeyboardMarkup: ...
+#
+# 版本 = version_fn() + 本注册表的数据版本；修改 LINKS/INDEX_AZ/BANK_DETAIL 等
+# 静态数据后调用 keyboards.bump() 即可让全部键盘在下次访问时重建。
+# 返回的 markup 为共享对象，调用方不得原地修改。
+
+import functools
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class KeyboardRegistry:
+    def __init__(self, version_fn: Callable[[], Hashable], maxsize: int = 512):
+        self._version_fn = version_fn
+        self._data_version = 0
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[Tuple[Any, ...], Tuple[Hashable, Any]]" = OrderedDict()
+        self._builders: Dict[str, Callable[..., Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self) -> Tuple[Hashable, int]:
+        return self._version_fn(), self._data_version
+
+    def bump(self) -> None:
+        """静态数据(链接/索引/大行明细)变化后调用。"""
+        self._data_version += 1
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def memo(self, fn: Callable[..., T]) -> Callable[..., T]:
+        name = fn.__name__
+        self._builders[name] = fn
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any) -> T:
+            key = (name,) + args
+            ver = self.version()
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] == ver:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            self.misses += 1
+            markup = fn(*args)
+            self._cache[key] = (ver, markup)
+            self._cache.move_to_end(key)
+            # 参数可能来自伪造的 callback_data，需限制条目数
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+            return markup
+
+        return wrapper
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._cache), "builders": len(self._builders),
+                "hits": self.hits, "misses": self.misses}
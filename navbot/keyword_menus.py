@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# 关键词快捷菜单目录(原 bot.py 中硬编码的 CUSTOM_QUERY_MENUS)
+#
+# - 表 keyword_menus：名称(主关键词)、别名、标题、说明、按钮 JSON、优先级、启用；owner 可在线增改删
+# - 内存中维护一台 Aho-Corasick 自动机(全部名称+别名 → 菜单)，消息匹配只扫描一遍文本
+# - 每次写入给该行分配递增的 rev(删除为软删除，同样带 rev)；刷新时只读取 rev 大于本地的行，
+#   对自动机做增量 add/remove，不整表重载
+# - 每个菜单的内联键盘在载入时渲染一次并缓存
+# - 多个关键词同时命中：优先级高者 > 命中关键词更长者 > 在消息中出现更早者 > 菜单 id 小者
+# - 可选 TTL：到期后只查一次 MAX(rev)，有变化才增量刷新(多进程共用一个 DB 时使用)
+
+import json
+import time
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from navbot.aho_corasick import AhoCorasick
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS keyword_menus(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        aliases TEXT NOT NULL DEFAULT '[]',
+        title TEXT NOT NULL,
+        desc TEXT NOT NULL DEFAULT '',
+        buttons TEXT NOT NULL DEFAULT '[]',
+        priority INTEGER NOT NULL DEFAULT 0,
+        enabled INTEGER NOT NULL DEFAULT 1,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        rev INTEGER NOT NULL DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_keyword_menus_rev ON keyword_menus(rev)",
+)
+
+HOME_BUTTON = InlineKeyboardButton(text="🏠 返回首页", callback_data="go_home")
+
+
+@dataclass
+class KeywordMenu:
+    id: int
+    name: str
+    title: str
+    desc: str = ""
+    buttons: List[Tuple[str, str]] = field(default_factory=list)
+    aliases: List[str] = field(default_factory=list)
+    priority: int = 0
+    keyboard: Optional[InlineKeyboardMarkup] = None
+
+    @property
+    def keywords(self) -> List[str]:
+        return [self.name] + [a for a in self.aliases if a]
+
+    @property
+    def text(self) -> str:
+        return f"<b>{self.title}</b>\n{self.desc}" if self.desc else f"<b>{self.title}</b>"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "aliases": self.aliases, "title": self.title, "desc": self.desc,
+                "buttons": [list(b) for b in self.buttons], "priority": self.priority}
+
+
+def _render(menu: KeywordMenu) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text=t, url=u)] for t, u in menu.buttons]
+    return InlineKeyboardMarkup(inline_keyboard=rows + [[HOME_BUTTON]])
+
+
+def _validate(data: Mapping[str, Any]) -> Dict[str, Any]:
+    """校验 owner 提交的菜单 JSON，返回规范化后的字段；不合法时抛 ValueError。"""
+    name = str(data.get("name") or "").strip()
+    title = str(data.get("title") or "").strip()
+    if not name or not title:
+        raise ValueError("name 与 title 必填")
+    aliases = data.get("aliases") or []
+    if isinstance(aliases, str):
+        aliases = [a for a in aliases.replace("，", ",").split(",")]
+    aliases = [str(a).strip() for a in aliases if str(a).strip()]
+    buttons = []
+    for b in data.get("buttons") or []:
+        if isinstance(b, Mapping):
+            b = (b.get("text"), b.get("url"))
+        if not isinstance(b, Sequence) or len(b) != 2 or not all(isinstance(x, str) and x for x in b):
+            raise ValueError(f"按钮格式应为 [文本, URL]：{b!r}")
+        if not b[1].startswith(("https://", "http://", "tg://")):
+            raise ValueError(f"按钮 URL 无效：{b[1]}")
+        buttons.append([b[0], b[1]])
+    return {"name": name, "aliases": aliases, "title": title, "desc": str(data.get("desc") or ""),
+            "buttons": buttons, "priority": int(data.get("priority") or 0)}
+
+
+class KeywordMenus:
+    def __init__(self, pool: Any, ttl: Optional[float] = None):
+        self.pool = pool
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self._menus: Dict[int, KeywordMenu] = {}
+        self._by_name: Dict[str, KeywordMenu] = {}
+        self._ac = AhoCorasick()
+        self._rev = 0
+        self._checked_at = 0.0
+        self.matches = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    # ---- 表结构 ----
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection) -> None:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+
+    @staticmethod
+    def seed(conn: sqlite3.Connection, defaults: Mapping[str, Mapping[str, Any]], commit: bool = True) -> int:
+        """表为空时写入默认菜单(首次部署从旧的硬编码字典迁移)，返回写入条数。
+        在迁移里调用时传 commit=False，由迁移的事务统一提交。"""
+        if conn.execute("SELECT 1 FROM keyword_menus LIMIT 1").fetchone():
+            return 0
+        rows = []
+        for i, (name, menu) in enumerate(defaults.items(), 1):
+            m = _validate({"name": name, **menu})
+            rows.append((m["name"], json.dumps(m["aliases"], ensure_ascii=False), m["title"], m["desc"],
+                         json.dumps(m["buttons"], ensure_ascii=False), m["priority"], i))
+        conn.executemany("""INSERT INTO keyword_menus(name, aliases, title, desc, buttons, priority, rev)
+                            VALUES(?,?,?,?,?,?,?)""", rows)
+        if commit:
+            conn.commit()
+        return len(rows)
+
+    # ---- 载入/增量刷新 ----
+    def _apply(self, rows: Iterable[sqlite3.Row]) -> int:
+        n = 0
+        for r in rows:
+            n += 1
+            self._rev = max(self._rev, r["rev"])
+            old = self._menus.pop(r["id"], None)
+            if old is not None:
+                self._by_name.pop(old.name.casefold(), None)
+                for kw in old.keywords:
+                    if self._ac_owner(kw) is old:
+                        self._ac.remove(kw)
+            if r["deleted"] or not r["enabled"]:
+                continue
+            menu = KeywordMenu(id=r["id"], name=r["name"], title=r["title"], desc=r["desc"],
+                               buttons=[(t, u) for t, u in json.loads(r["buttons"] or "[]")],
+                               aliases=list(json.loads(r["aliases"] or "[]")), priority=r["priority"])
+            menu.keyboard = _render(menu)
+            self._menus[menu.id] = menu
+            self._by_name[menu.name.casefold()] = menu
+            for kw in menu.keywords:
+                cur = self._ac_owner(kw)
+                # 同一关键词被多个菜单占用时，保留优先级高(再比 id 小)的那个
+                if cur is None or (menu.priority, -menu.id) > (cur.priority, -cur.id):
+                    self._ac.add(kw, menu)
+        return n
+
+    def _ac_owner(self, kw: str) -> Optional[KeywordMenu]:
+        return self._ac._values.get(kw.casefold())  # noqa: SLF001 - 同包内部结构
+
+    async def load(self) -> int:
+        """增量刷新：只读取 rev 大于本地的行，返回变更行数。"""
+        since = self._rev
+        rows = await self.pool.fetchall("SELECT * FROM keyword_menus WHERE rev>? ORDER BY rev", (since,))
+        n = self._apply(rows)
+        self._checked_at = time.monotonic()
+        if n:
+            self.refreshes += 1
+            # 被遮蔽的同名关键词可能因占用者删除而重新可用，补挂一次
+            for menu in sorted(self._menus.values(), key=lambda m: (-m.priority, m.id)):
+                for kw in menu.keywords:
+                    if self._ac_owner(kw) is None:
+                        self._ac.add(kw, menu)
+        return n
+
+    async def maybe_refresh(self) -> None:
+        if self.ttl is None or time.monotonic() - self._checked_at < self.ttl:
+            return
+        row = await self.pool.fetchone("SELECT COALESCE(MAX(rev),0) AS rev FROM keyword_menus")
+        self._checked_at = time.monotonic()
+        if row["rev"] != self._rev:
+            await self.load()
+
+    # ---- 匹配 ----
+    def match(self, text: str) -> Optional[KeywordMenu]:
+        best: Optional[Tuple[Tuple[int, int, int, int], KeywordMenu]] = None
+        for start, kw, menu in self._ac.iter_matches(text or ""):
+            rank = (menu.priority, len(kw), -start, -menu.id)
+            if best is None or rank > best[0]:
+                best = (rank, menu)
+        if best is None:
+            self.misses += 1
+            return None
+        self.matches += 1
+        return best[1]
+
+    def get(self, name: str) -> Optional[KeywordMenu]:
+        return self._by_name.get(name.casefold())
+
+    def all(self) -> List[KeywordMenu]:
+        return sorted(self._menus.values(), key=lambda m: (-m.priority, m.id))
+
+    # ---- 写入(owner) ----
+    async def upsert(self, data: Mapping[str, Any]) -> KeywordMenu:
+        m = _validate(data)
+
+        def _do(c: sqlite3.Connection) -> None:
+            c.execute("BEGIN IMMEDIATE")
+            rev = c.execute("SELECT COALESCE(MAX(rev),0)+1 FROM keyword_menus").fetchone()[0]
+            c.execute("""INSERT INTO keyword_menus(name, aliases, title, desc, buttons, priority, enabled, deleted, rev)
+                         VALUES(?,?,?,?,?,?,1,0,?)
+                         ON CONFLICT(name) DO UPDATE SET aliases=excluded.aliases, title=excluded.title,
+                             desc=excluded.desc, buttons=excluded.buttons, priority=excluded.priority,
+                             enabled=1, deleted=0, rev=excluded.rev, updated_at=CURRENT_TIMESTAMP""",
+                      (m["name"], json.dumps(m["aliases"], ensure_ascii=False), m["title"], m["desc"],
+                       json.dumps(m["buttons"], ensure_ascii=False), m["priority"], rev))
+            c.commit()
+        await self.pool.run(_do, "keyword_menus.upsert")
+        await self.load()
+        menu = self.get(m["name"])
+        assert menu is not None
+        return menu
+
+    async def delete(self, name: str) -> bool:
+        def _do(c: sqlite3.Connection) -> int:
+            c.execute("BEGIN IMMEDIATE")
+            rev = c.execute("SELECT COALESCE(MAX(rev),0)+1 FROM keyword_menus").fetchone()[0]
+            n = c.execute("UPDATE keyword_menus SET deleted=1, rev=?, updated_at=CURRENT_TIMESTAMP "
+                          "WHERE name=? AND deleted=0", (rev, name)).rowcount
+            c.commit()
+            return n
+        n = await self.pool.run(_do, "keyword_menus.delete")
+        await self.load()
+        return bool(n)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"menus": len(self._menus), "rev": self._rev, "matches": self.matches, "misses": self.misses,
+                **self._ac.stats()}
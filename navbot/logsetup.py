@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+# 日志：事件循环里只做入队，格式化与写盘在后台线程完成
+#
+# - 根 logger 只挂一个 QueueHandler(有界队列，满了丢弃并计数，绝不阻塞事件循环)；
+#   QueueListener 线程负责控制台与文件输出，积压的记录成批写出、每批只 flush 一次
+# - 文件按大小(LOG_MAX_MB)或按时间(LOG_ROTATE_WHEN，如 midnight)轮转，轮转出的旧文件 gzip 压缩
+# - 高频日志按事件抽样：LOG_SAMPLE="click=0.01,start=0.1,aiogram.event=0.05"，
+#   键为 extra={"event": ...} 中的事件名，或 logger 名；按计数每 1/rate 条保留 1 条(首条必留)
+# - LOG_FORMAT=json 时每行一个 JSON 对象，extra 字段原样输出，便于采集
+#
+#     log_setup = setup_logging(path="bot.log", fmt="json", sample="click=0.01")
+#     logger.info("ad click user=%s ad=%s", uid, ad_id, extra={"event": "click", "user_id": uid})
+#     ...
+#     log_setup.stop()   # 退出前排空队列
+
+import os
+import gzip
+import json
+import queue
+import shutil
+import logging
+import datetime
+import logging.handlers
+from typing import Any, Dict, List, Optional
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+# LogRecord 自带的属性；其余都是 extra 传入的字段
+_STD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _STD_ATTRS and not k.startswith("_"):
+                out[k] = v
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+def parse_sample(spec: str) -> Dict[str, float]:
+    """'click=0.01,start=0.1' → {'click': 0.01, 'start': 0.1}；忽略格式不对的项。"""
+    rates: Dict[str, float] = {}
+    for item in (spec or "").split(","):
+        key, sep, val = item.partition("=")
+        try:
+            rate = float(val)
+        except ValueError:
+            continue
+        if sep and key.strip():
+            rates[key.strip()] = min(1.0, max(0.0, rate))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """按事件名(或 logger 名)计数抽样；WARNING 及以上从不丢弃。"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.every = {k: (0 if r <= 0 else max(1, round(1 / r))) for k, r in rates.items()}
+        self.seen: Dict[str, int] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.every:
+            return True
+        key = getattr(record, "event", None) or record.name
+        n = self.every.get(key)
+        if n is None or n == 1:
+            return True
+        c = self.seen[key] = self.seen.get(key, 0) + 1
+        if n and c % n == 1:
+            record.sampled = f"1/{n}"
+            return True
+        self.dropped += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃并计数，而不是阻塞调用方。"""
+
+    def __init__(self, q: "queue.Queue[Any]"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只合并参数、把异常转成文本(traceback 不跨线程保留)；完整格式化留给后台线程。
+        # 根 logger 上只有这一个 handler，直接改原 record，省掉标准实现里的 copy
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_EXC_FORMATTER = logging.Formatter()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """一次取出队列中积压的全部记录(最多 batch 条)逐条输出，整批只 flush 一次。"""
+
+    batch = 512
+
+    def _monitor(self) -> None:
+        q = self.queue
+        has_task_done = hasattr(q, "task_done")
+        while True:
+            records = [self.dequeue(True)]
+            while len(records) < self.batch:
+                try:
+                    records.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            stop = False
+            for r in records:
+                if r is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(r)
+                if has_task_done:
+                    q.task_done()
+            for h in self.handlers:
+                h.flush_now()  # type: ignore[attr-defined]
+            if stop:
+                return
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)  # 队列满时等后台线程腾出位置，不能丢
+
+
+class _DeferredFlush:
+    """emit() 里的逐条 flush 改为由 BatchingQueueListener 按批调用 flush_now()。"""
+
+    deferred = True
+
+    def flush(self) -> None:
+        if not self.deferred:
+            self.flush_now()
+
+    def flush_now(self) -> None:
+        super().flush()  # type: ignore[misc]
+
+
+class _StreamOut(_DeferredFlush, logging.StreamHandler):
+    pass
+
+
+class _SizeRotatingOut(_DeferredFlush, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class _TimeRotatingOut(_DeferredFlush, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as fin, gzip.open(dest, "wb", compresslevel=6) as fout:
+        shutil.copyfileobj(fin, fout, 1024 * 1024)
+    os.remove(source)
+
+
+def file_handler(path: str, max_bytes: int = 50 * 1024 * 1024, backups: int = 10,
+                 when: str = "", compress: bool = True) -> logging.Handler:
+    """when 非空时按时间轮转(TimedRotatingFileHandler 的 when 取值)，否则按大小轮转。"""
+    if when:
+        h: logging.handlers.BaseRotatingHandler = _TimeRotatingOut(
+            path, when=when, backupCount=backups, encoding="utf-8", utc=True)
+    else:
+        h = _SizeRotatingOut(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    if compress:
+        h.namer = _gzip_namer
+        h.rotator = _gzip_rotator
+    return h
+
+
+class LogSetup:
+    """setup_logging 的返回值：持有后台线程与各计数器，stop() 时排空队列。"""
+
+    def __init__(self, listener: BatchingQueueListener, handler: NonBlockingQueueHandler,
+                 sampler: Optional[SamplingFilter]):
+        self.listener = listener
+        self.handler = handler
+        self.sampler = sampler
+        self._stopped = False
+
+    def stop(self) -> None:
+        """排空队列并停掉后台线程；之后的日志(退出阶段)改为直接同步输出，不会丢失。"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.listener.stop()
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        for h in self.listener.handlers:
+            h.deferred = False  # type: ignore[attr-defined]
+            root.addHandler(h)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self.handler.queue.qsize(), "dropped_full": self.handler.dropped,
+                "dropped_sampled": self.sampler.dropped if self.sampler else 0}
+
+
+def setup_logging(level: str = "INFO", path: Optional[str] = "bot.log", fmt: str = "text",
+                  max_bytes: int = 50 * 1024 * 1024, backups: int = 10, when: str = "", compress: bool = True,
+                  sample: str = "", queue_size: int = 10000, console: bool = True) -> LogSetup:
+    formatter: logging.Formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    outputs: List[logging.Handler] = []
+    if console:
+        outputs.append(_StreamOut())
+    if path:
+        outputs.append(file_handler(path, max_bytes, backups, when, compress))
+    for h in outputs:
+        h.setFormatter(formatter)
+
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=max(0, queue_size))
+    qh = NonBlockingQueueHandler(q)
+    rates = parse_sample(sample)
+    sampler = SamplingFilter(rates) if rates else None
+    if sampler:
+        qh.addFilter(sampler)
+    # 输出格式不含文件名/行号/线程/进程，关掉这些采集(官方文档"Optimization"一节的做法)，
+    # 每条记录省去一次栈回溯
+    logging._srcfile = None  # type: ignore[attr-defined]
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(qh)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    listener = BatchingQueueListener(q, *outputs, respect_handler_level=True)
+    listener.start()
+    return LogSetup(listener, qh, sampler)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# 媒体库：广告图片/相册统一登记，发送时只用 Telegram 的 file_id，同一内容只上传一次
+#
+# - media_assets：每个素材一行，content_key 唯一
+#     本地文件          → "sha256:<十六进制>"，按内容去重(改名、换目录都不会再次上传)
+#     Telegram 上的图片 → "tg:<file_unique_id>"，同一张图多次转发只登记一次
+# - 本地文件首次使用时上传到存储会话(storage_chat)一次，记下返回的 file_id；
+#   同一内容的并发上传合并为一次
+# - media_albums / media_album_items：多图相册(2–10 张图片)，用 send_media_group 发送
+# - 引用格式(存进 ads.photo_file_id、群发载荷等)："media:<id>"、"album:<名称>"；
+#   其他非空值按旧数据里的裸 file_id 处理
+# - 素材与相册缓存在进程内(条目少)，群发时解析引用不访问 DB
+#
+#     library = MediaLibrary(pool, upload, storage_chat=-100123)
+#     asset, uploaded = await library.add_file("media/banner.jpg")
+#     media = await library.resolve(f"media:{asset.id}")   # Media("photo", (file_id,))
+
+import os
+import asyncio
+import hashlib
+import sqlite3
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS media_assets(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content_key TEXT NOT NULL UNIQUE,
+        kind TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        file_unique_id TEXT,
+        name TEXT,
+        size INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_media_assets_fuid ON media_assets(file_unique_id)",
+    """CREATE TABLE IF NOT EXISTS media_albums(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS media_album_items(
+        album_id INTEGER NOT NULL,
+        pos INTEGER NOT NULL,
+        asset_id INTEGER NOT NULL,
+        PRIMARY KEY(album_id, pos)
+    ) WITHOUT ROWID""",
+)
+
+PHOTO_EXTS = frozenset({".jpg", ".jpeg", ".png", ".webp"})
+ALBUM_MIN, ALBUM_MAX = 2, 10  # send_media_group 的限制
+
+# upload(chat_id, 本地路径, kind) → (file_id, file_unique_id)
+UploadFn = Callable[[Any, str, str], Awaitable[Tuple[str, str]]]
+
+
+class MediaAsset(NamedTuple):
+    id: int
+    content_key: str
+    kind: str
+    file_id: str
+    name: Optional[str] = None
+    size: Optional[int] = None
+
+
+class Media(NamedTuple):
+    """resolve() 的结果：kind 为 photo / document / album。"""
+    kind: str
+    file_ids: Tuple[str, ...]
+
+
+def _row(r: sqlite3.Row) -> MediaAsset:
+    return MediaAsset(r["id"], r["content_key"], r["kind"], r["file_id"], r["name"], r["size"])
+
+
+def file_digest(path: str, chunk: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def kind_for(path: str) -> str:
+    return "photo" if os.path.splitext(path)[1].lower() in PHOTO_EXTS else "document"
+
+
+class MediaLibrary:
+    def __init__(self, pool: Any, upload: UploadFn, storage_chat: Any = None):
+        self.pool = pool
+        self.upload = upload
+        self.storage_chat = storage_chat
+        self._assets: Dict[int, MediaAsset] = {}
+        self._albums: Dict[str, Tuple[int, ...]] = {}
+        self._inflight: Dict[str, "asyncio.Future[MediaAsset]"] = {}
+        self.uploads = 0
+        self.reused = 0
+        self.upload_bytes = 0
+
+    # ---- 表结构 ----
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection) -> None:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+
+    # ---- 登记 ----
+    async def _by_key(self, key: str) -> Optional[MediaAsset]:
+        r = await self.pool.fetchone("SELECT * FROM media_assets WHERE content_key=?", (key,))
+        return self._remember(_row(r)) if r else None
+
+    async def _insert(self, key: str, kind: str, file_id: str, file_unique_id: Optional[str],
+                      name: Optional[str], size: Optional[int]) -> MediaAsset:
+        await self.pool.execute(
+            """INSERT OR IGNORE INTO media_assets(content_key, kind, file_id, file_unique_id, name, size)
+               VALUES(?,?,?,?,?,?)""", (key, kind, file_id, file_unique_id, name, size))
+        asset = await self._by_key(key)
+        assert asset is not None
+        return asset
+
+    def _remember(self, asset: MediaAsset) -> MediaAsset:
+        self._assets[asset.id] = asset
+        return asset
+
+    async def add_file(self, path: str, name: Optional[str] = None, chat_id: Any = None) -> Tuple[MediaAsset, bool]:
+        """
+        登记本地文件，返回 (素材, 本次是否上传)。内容已登记过时直接复用，不上传；
+        否则上传到 chat_id(默认 storage_chat)。
+        """
+        digest = await asyncio.to_thread(file_digest, path)
+        key = "sha256:" + digest
+        asset = await self._by_key(key)
+        if asset is not None:
+            self.reused += 1
+            return asset, False
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.reused += 1
+            return await asyncio.shield(fut), False
+        target = chat_id if chat_id is not None else self.storage_chat
+        if target is None:
+            raise ValueError("未设置媒体存储会话(MEDIA_STORAGE_CHAT)")
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            kind = kind_for(path)
+            size = os.path.getsize(path)
+            file_id, file_unique_id = await self.upload(target, path, kind)
+            self.uploads += 1
+            self.upload_bytes += size
+            asset = await self._insert(key, kind, file_id, file_unique_id, name or os.path.basename(path), size)
+            fut.set_result(asset)
+            return asset, True
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # 没有其他等待者时不报 "exception was never retrieved"
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def add_telegram(self, file_id: str, file_unique_id: str, kind: str = "photo",
+                           name: Optional[str] = None, size: Optional[int] = None) -> MediaAsset:
+        """登记 Telegram 上已有的文件(用户发来的图片)；同一 file_unique_id 只登记一次。"""
+        r = await self.pool.fetchone("SELECT * FROM media_assets WHERE file_unique_id=? LIMIT 1", (file_unique_id,))
+        if r:
+            self.reused += 1
+            return self._remember(_row(r))
+        return await self._insert("tg:" + file_unique_id, kind, file_id, file_unique_id, name, size)
+
+    # ---- 读取 ----
+    async def get(self, asset_id: int) -> Optional[MediaAsset]:
+        asset = self._assets.get(asset_id)
+        if asset is None:
+            r = await self.pool.fetchone("SELECT * FROM media_assets WHERE id=?", (asset_id,))
+            asset = self._remember(_row(r)) if r else None
+        return asset
+
+    async def recent(self, limit: int = 20) -> List[MediaAsset]:
+        rows = await self.pool.fetchall("SELECT * FROM media_assets ORDER BY id DESC LIMIT ?", (limit,))
+        return [self._remember(_row(r)) for r in rows]
+
+    async def albums(self) -> List[sqlite3.Row]:
+        return await self.pool.fetchall(
+            """SELECT a.name, COUNT(i.asset_id) AS n FROM media_albums a
+               LEFT JOIN media_album_items i ON i.album_id=a.id GROUP BY a.id ORDER BY a.name""")
+
+    # ---- 相册 ----
+    async def set_album(self, name: str, asset_ids: Sequence[int]) -> Tuple[MediaAsset, ...]:
+        """创建或整体替换相册；素材须为图片，数量 2–10。"""
+        name = name.strip()
+        if not name:
+            raise ValueError("相册名称不能为空")
+        if not ALBUM_MIN <= len(asset_ids) <= ALBUM_MAX:
+            raise ValueError(f"相册需要 {ALBUM_MIN}–{ALBUM_MAX} 张图片")
+        assets = []
+        for aid in asset_ids:
+            asset = await self.get(aid)
+            if asset is None:
+                raise ValueError(f"素材 #{aid} 不存在")
+            if asset.kind != "photo":
+                raise ValueError(f"素材 #{aid} 不是图片")
+            assets.append(asset)
+
+        def _do(c: sqlite3.Connection) -> None:
+            with c:
+                c.execute("INSERT OR IGNORE INTO media_albums(name) VALUES(?)", (name,))
+                album_id = c.execute("SELECT id FROM media_albums WHERE name=?", (name,)).fetchone()["id"]
+                c.execute("DELETE FROM media_album_items WHERE album_id=?", (album_id,))
+                c.executemany("INSERT INTO media_album_items(album_id, pos, asset_id) VALUES(?,?,?)",
+                              [(album_id, i, a.id) for i, a in enumerate(assets)])
+        await self.pool.run(_do, "media.set_album")
+        self._albums[name] = tuple(a.id for a in assets)
+        return tuple(assets)
+
+    async def album(self, name: str) -> Optional[Tuple[MediaAsset, ...]]:
+        ids = self._albums.get(name)
+        if ids is None:
+            rows = await self.pool.fetchall(
+                """SELECT i.asset_id FROM media_album_items i JOIN media_albums a ON a.id=i.album_id
+                   WHERE a.name=? ORDER BY i.pos""", (name,))
+            if not rows:
+                return None
+            ids = self._albums[name] = tuple(r["asset_id"] for r in rows)
+        assets = [await self.get(i) for i in ids]
+        return tuple(a for a in assets if a is not None)
+
+    async def resolve(self, ref: Optional[str]) -> Optional[Media]:
+        """把媒体引用解析为可直接发送的 file_id；无效引用返回 None。"""
+        ref = (ref or "").strip()
+        if not ref:
+            return None
+        kind, sep, arg = ref.partition(":")
+        if sep and kind == "media" and arg.isdigit():
+            asset = await self.get(int(arg))
+            return Media(asset.kind, (asset.file_id,)) if asset else None
+        if sep and kind == "album":
+            assets = await self.album(arg)
+            return Media("album", tuple(a.file_id for a in assets)) if assets else None
+        return Media("photo", (ref,))
+
+    async def check_ref(self, ref: str) -> bool:
+        """用户输入的 media:/album: 引用是否有效(不接受裸 file_id)。"""
+        return ref.startswith(("media:", "album:")) and await self.resolve(ref) is not None
+
+    def stats(self) -> Dict[str, int]:
+        return {"cached": len(self._assets), "albums": len(self._albums), "uploads": self.uploads,
+                "reused": self.reused, "upload_bytes": self.upload_bytes}
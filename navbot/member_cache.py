@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# 关注闸门(ensure_followed)的成员身份缓存
+#
+# - 已关注/未关注分别使用不同 TTL(正向长、负向短，关注后很快生效)
+# - 同一 (频道, 用户) 并发检查合并为一次 get_chat_member(single-flight)
+# - 网络异常时优先返回过期的旧结果(stale-if-error)，而不是一律判为未关注
+# - recheck=True(用户点"我已关注")只绕过缓存里的"未关注"，同一用户每 recheck_interval 秒最多强制回源一次；
+#   已关注的缓存照常命中，回源失败仍沿用旧结果
+# - 可由 chat_member 更新直接写入，机器人为频道管理员时无需回源
+# - LRU 限制条目数，hit/miss 等计数供 /ping 展示
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+MEMBER_STATUSES = frozenset({"member", "administrator", "creator"})
+
+Key = Tuple[str, int]
+
+
+def is_member_status(status: Any) -> bool:
+    # aiogram 的 ChatMemberStatus 为 str 枚举，取 .value 再比较
+    return getattr(status, "value", status) in MEMBER_STATUSES
+
+
+def chat_key(chat: Any) -> str:
+    """频道标识统一成字符串：-100xxx 或 @username(小写)。"""
+    s = str(chat).strip()
+    return s.lower() if s.startswith("@") else s
+
+
+class MembershipCache:
+    def __init__(self, fetch: Callable[[Any, int], Awaitable[bool]],
+                 positive_ttl: float = 600.0, negative_ttl: float = 30.0, maxsize: int = 100_000,
+                 recheck_interval: float = 5.0):
+        self._fetch = fetch
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.recheck_interval = recheck_interval
+        # key → (是否成员, 过期时间)
+        self._entries: "OrderedDict[Key, Tuple[bool, float]]" = OrderedDict()
+        self._inflight: Dict[Key, "asyncio.Future[bool]"] = {}
+        self._rechecked: "OrderedDict[Key, float]" = OrderedDict()  # key → 上次强制回源时间
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.errors = 0
+        self.stale_served = 0
+        self.pushed = 0
+        self.rechecks = 0
+
+    def _store(self, key: Key, is_member: bool) -> None:
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self._entries[key] = (is_member, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def update(self, chat: Any, user_id: int, status: str) -> None:
+        """由 chat_member 更新推送最新状态。"""
+        self.pushed += 1
+        self._store((chat_key(chat), user_id), is_member_status(status))
+
+    def invalidate(self, chat: Any, user_id: int) -> None:
+        self._entries.pop((chat_key(chat), user_id), None)
+
+    def _may_recheck(self, key: Key, now: float) -> bool:
+        last = self._rechecked.get(key)
+        if last is not None and now - last < self.recheck_interval:
+            return False
+        self._rechecked[key] = now
+        self._rechecked.move_to_end(key)
+        while len(self._rechecked) > self.maxsize:
+            self._rechecked.popitem(last=False)
+        return True
+
+    async def is_member(self, chat: Any, user_id: int, recheck: bool = False) -> bool:
+        key = (chat_key(chat), user_id)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[1] > now and (entry[0] or not recheck or not self._may_recheck(key, now)):
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+        if entry is not None and entry[1] > now:
+            self.rechecks += 1
+        else:
+            self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            self.fetches += 1
+            value = await self._fetch(chat, user_id)
+            self._store(key, value)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception:
+            self.errors += 1
+            # 网络抖动：沿用旧结果，且不缓存错误
+            if entry is not None:
+                self.stale_served += 1
+                value = entry[0]
+            else:
+                value = False
+        finally:
+            self._inflight.pop(key, None)
+        fut.set_result(value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "stale_served": self.stale_served,
+            "pushed": self.pushed,
+            "rechecks": self.rechecks,
+        }
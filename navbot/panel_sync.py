@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# 频道面板同步：面板内容只渲染一次，按内容哈希找出过期的面板，并发编辑
+#
+# - panels 表每行记录上次成功同步的 content_hash；与当前渲染结果的哈希相同的面板不调用 API
+# - 过期面板由 concurrency 个协程并发编辑，共用令牌桶(与群发共用同一个桶时总发送速率不超限)
+# - 每个面板记录同步状态：ok / missing(面板消息已被删) / forbidden(机器人被移出或无权限) / error /
+#   stale(面板消息被原地编辑过，见 invalidate())
+#   - error(网络/限流等临时错误)不更新哈希，后台循环下一轮重试
+#   - missing/forbidden 是终态：记下本次尝试的哈希，内容不变时不再重试(避免每轮对死面板调 API、刷告警)；
+#     内容变了会再试一次，/update_panel、/sync_panels force 总会重试
+#   - stale：invalidate() 清掉哈希，后台循环下一轮把面板恢复成当前内容
+# - start(interval) 后台定期渲染并比对哈希(渲染命中键盘缓存，几乎无开销)，内容变了才发起同步，
+#   设置改动后数秒内推送到所有频道
+#
+#     panel_sync = PanelSync(pool, render=lambda: (WELCOME_TEXT, main_menu()), edit=edit_panel, bucket=bucket)
+#     report = await panel_sync.sync()          # {"total", "edited", "unchanged", "failed", "seconds"}
+
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup
+
+from navbot.broadcast import send_with_retry
+from navbot.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# 重试也不会成功的失败：记下尝试过的哈希，内容不变时跳过
+TERMINAL = frozenset({"missing", "forbidden"})
+
+# 迁移前建的 panels 表没有这些列
+COLUMNS = (
+    ("content_hash", "TEXT"),
+    ("sync_status", "TEXT"),
+    ("sync_error", "TEXT"),
+    ("synced_at", "DATETIME"),
+)
+
+RenderFn = Callable[[], Tuple[str, Optional[InlineKeyboardMarkup]]]
+# edit(chat_id, message_id, text, kb)
+EditFn = Callable[[int, int, str, Optional[InlineKeyboardMarkup]], Awaitable[Any]]
+
+
+def content_hash(text: str, kb: Optional[InlineKeyboardMarkup]) -> str:
+    markup = kb.model_dump(exclude_none=True) if kb is not None else None
+    raw = json.dumps([text, markup], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def _classify(e: Exception) -> str:
+    if isinstance(e, TelegramForbiddenError):
+        return "forbidden"
+    msg = str(e).lower()
+    if isinstance(e, TelegramBadRequest):
+        if "message is not modified" in msg:
+            return "ok"  # 内容本来就是最新的(如旧记录没有哈希)
+        if "message to edit not found" in msg or "chat not found" in msg:
+            return "missing"
+        if "not enough rights" in msg or "not an administrator" in msg:
+            return "forbidden"
+    return "error"
+
+
+class PanelSync:
+    def __init__(self, pool: Any, render: RenderFn, edit: EditFn, bucket: Optional[TokenBucket] = None,
+                 concurrency: int = 8):
+        self.pool = pool
+        self.render = render
+        self.edit = edit
+        self.bucket = bucket or TokenBucket(20.0, capacity=5)
+        self.concurrency = max(1, concurrency)
+        self._lock = asyncio.Lock()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._last_hash: Optional[str] = None
+        self.runs = 0
+        self.edits = 0
+        self.skipped = 0
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    # ---- 表结构 ----
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection) -> None:
+        have = {r[1] for r in conn.execute("PRAGMA table_info(panels)")}
+        for name, decl in COLUMNS:
+            if name not in have:
+                conn.execute(f"ALTER TABLE panels ADD COLUMN {name} {decl}")
+
+    def current(self) -> Tuple[str, Optional[InlineKeyboardMarkup], str]:
+        text, kb = self.render()
+        return text, kb, content_hash(text, kb)
+
+    # ---- 同步 ----
+    async def sync(self, chat_ids: Optional[Sequence[int]] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        同步全部(或 chat_ids 指定的)面板；force=True 时忽略哈希全部重编辑。
+        同一时间只跑一轮，后来的调用排队，轮到时按最新内容重新比对。
+        """
+        async with self._lock:
+            t0 = time.perf_counter()
+            text, kb, h = self.current()
+            sql = "SELECT chat_id, message_id, content_hash FROM panels"
+            params: Tuple[Any, ...] = ()
+            if chat_ids is not None:
+                sql += f" WHERE chat_id IN ({','.join('?' * len(chat_ids))})"
+                params = tuple(chat_ids)
+            rows = await self.pool.fetchall(sql, params) if chat_ids is None or chat_ids else []
+            stale = [r for r in rows if force or r["content_hash"] != h]
+            results: List[Tuple[Optional[str], str, Optional[str], int, int]] = []
+            queue: "asyncio.Queue[sqlite3.Row]" = asyncio.Queue()
+            for r in stale:
+                queue.put_nowait(r)
+
+            async def worker() -> None:
+                while not queue.empty():
+                    r = queue.get_nowait()
+                    try:
+                        await send_with_retry(lambda: self.edit(r["chat_id"], r["message_id"], text, kb),
+                                              bucket=self.bucket)
+                        status, err = "ok", None
+                    except Exception as e:
+                        status, err = _classify(e), str(e)[:300]
+                        if status != "ok":
+                            logger.warning("Panel %s sync failed (%s): %s", r["chat_id"], status, e)
+                    done = status == "ok" or status in TERMINAL
+                    results.append((h if done else r["content_hash"], status, err, r["chat_id"], r["message_id"]))
+
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(stale)))))
+            if results:
+                # 按 message_id 限定：同步期间重新 /post_panel 的面板不会被旧结果覆盖
+                await self.pool.executemany(
+                    """UPDATE panels SET content_hash=?, sync_status=?, sync_error=?, synced_at=CURRENT_TIMESTAMP
+                       WHERE chat_id=? AND message_id=?""", results)
+            failed = sum(1 for r in results if r[1] != "ok")
+            retry = sum(1 for r in results if r[1] != "ok" and r[1] not in TERMINAL)
+            report = {"total": len(rows), "edited": len(results) - failed, "unchanged": len(rows) - len(stale),
+                      "failed": failed, "seconds": time.perf_counter() - t0, "hash": h}
+            if not retry:  # 有临时失败时不记，sync_if_changed 下一轮会重试它们
+                self._last_hash = h
+            self.runs += 1
+            self.edits += len(results)
+            self.skipped += report["unchanged"]
+            self.last_report = report
+            if results:
+                logger.info("Panels synced: %d edited, %d unchanged, %d failed in %.2fs",
+                            report["edited"], report["unchanged"], failed, report["seconds"])
+            return report
+
+    async def invalidate(self, chat_id: int, message_id: int) -> None:
+        """面板消息在别处被改动(如频道用户点面板按钮，swap_view 原地编辑)：清掉哈希，后台循环下一轮恢复它。"""
+        def _do(c: sqlite3.Connection) -> int:
+            n = c.execute("""UPDATE panels SET content_hash=NULL, sync_status='stale'
+                             WHERE chat_id=? AND message_id=? AND content_hash IS NOT NULL""",
+                          (chat_id, message_id)).rowcount
+            c.commit()
+            return n
+        if await self.pool.run(_do, "panels.invalidate"):
+            self._last_hash = None  # 不是面板消息(普通群消息)时不触发同步
+
+    async def sync_if_changed(self) -> Optional[Dict[str, Any]]:
+        """当前内容与上一轮同步时相同则什么都不做(不查库、不调 API)。"""
+        if self.current()[2] == self._last_hash:
+            return None
+        return await self.sync()
+
+    # ---- 后台 ----
+    def start(self, interval: float = 5.0) -> None:
+        if interval <= 0 or self._task is not None:
+            return
+
+        async def loop() -> None:
+            while True:
+                try:
+                    await self.sync_if_changed()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Panel sync loop error: %s", e)
+                await asyncio.sleep(interval)
+        self._task = asyncio.create_task(loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def status(self) -> List[sqlite3.Row]:
+        return await self.pool.fetchall(
+            "SELECT chat_id, message_id, content_hash, sync_status, sync_error, synced_at FROM panels ORDER BY chat_id")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"runs": self.runs, "edits": self.edits, "skipped": self.skipped}
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# 限速原语：异步令牌桶 + 按 key 的最小间隔限速
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Hashable
+
+
+class TokenBucket:
+    """异步令牌桶：rate 个/秒，桶容量 capacity。"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        """整体暂停(例如收到 RetryAfter)，期间不发放令牌。"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class KeyedInterval:
+    """同一 key 两次放行之间至少间隔 interval 秒(如 Telegram 单聊 1 条/秒)；LRU 限制 key 数。"""
+
+    def __init__(self, interval: float, maxsize: int = 50_000):
+        self.interval = interval
+        self.maxsize = maxsize
+        self._next: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def delay(self, key: Hashable) -> float:
+        """预约下一次放行，返回需要等待的秒数。"""
+        now = time.monotonic()
+        at = max(now, self._next.get(key, 0.0))
+        self._next[key] = at + self.interval
+        self._next.move_to_end(key)
+        while len(self._next) > self.maxsize:
+            self._next.popitem(last=False)
+        return at - now
+
+    async def wait(self, key: Hashable) -> None:
+        d = self.delay(key)
+        if d > 0:
+            await asyncio.sleep(d)
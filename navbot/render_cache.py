@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# 视图渲染缓存：记住每条消息当前显示内容的摘要，相同内容的重复编辑直接跳过
+#
+# - 键：(chat_id, message_id)，内联模式消息用 inline_message_id；LRU 有界
+# - 值：最近一次成功编辑(或发送)的 文本 + 键盘 摘要；用户连点同一按钮时不再调用 editMessageText
+# - 同一条消息的编辑合并：已有编辑在途时，新的渲染只记为"待发"(更新的覆盖更旧的)，
+#   在途编辑完成后只发最新的那一次；与在途内容相同的渲染直接跳过
+# - 键盘摘要按对象缓存(KeyboardRegistry 返回共享对象)，命中时不再序列化键盘
+# - 缓存只在本进程内有效：绕过 submit() 改动消息的地方(如面板同步)须调用 forget()
+#
+#     render_cache = RenderCache(maxsize=50000)
+#     await render_cache.submit(key, render_cache.digest(text, kb), do_edit)   # do_edit() 成功返回 True
+
+import hashlib
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+EditFn = Callable[[], Awaitable[bool]]
+
+SKIPPED = "skipped"  # 与当前显示(或在途)内容相同
+SENT = "sent"
+QUEUED = "queued"    # 已有编辑在途，等它完成后由其发送(或被更新的渲染取代)
+
+
+class RenderCache:
+    def __init__(self, maxsize: int = 50000, kb_cache: int = 1024):
+        self.maxsize = maxsize
+        self.kb_cache = kb_cache
+        self._shown: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._inflight: Dict[Hashable, bytes] = {}
+        self._pending: Dict[Hashable, Tuple[bytes, EditFn]] = {}
+        self._kb: "OrderedDict[int, Tuple[weakref.ref, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # 被更新的渲染取代、未发送的编辑
+        self.edits = 0
+
+    # ---- 摘要 ----
+    def _kb_digest(self, kb: Any) -> bytes:
+        if kb is None:
+            return b""
+        hit = self._kb.get(id(kb))
+        if hit is not None and hit[0]() is kb:
+            self._kb.move_to_end(id(kb))
+            return hit[1]
+        d = hashlib.blake2b(kb.model_dump_json(exclude_none=True).encode(), digest_size=16).digest()
+        self._kb[id(kb)] = (weakref.ref(kb), d)
+        while len(self._kb) > self.kb_cache:
+            self._kb.popitem(last=False)
+        return d
+
+    def digest(self, text: str, kb: Any = None) -> bytes:
+        return hashlib.blake2b(text.encode() + b"\0" + self._kb_digest(kb), digest_size=16).digest()
+
+    # ---- 状态 ----
+    def remember(self, key: Hashable, digest: bytes) -> None:
+        """记录某条消息当前显示的内容(编辑成功或刚发送时)。"""
+        self._shown[key] = digest
+        self._shown.move_to_end(key)
+        while len(self._shown) > self.maxsize:
+            self._shown.popitem(last=False)
+
+    def forget(self, key: Hashable) -> None:
+        self._shown.pop(key, None)
+
+    def current(self, key: Hashable) -> Optional[bytes]:
+        return self._shown.get(key)
+
+    # ---- 编辑 ----
+    async def submit(self, key: Hashable, digest: bytes, edit: EditFn) -> str:
+        """
+        按需执行 edit()：内容与当前显示/在途的相同则跳过；有编辑在途则排队(只保留最新)。
+        edit() 返回 True 表示消息已显示该内容(包括 "message is not modified")，否则清掉该消息的记录。
+        """
+        if key in self._inflight:
+            prev = self._pending.pop(key, None)
+            if prev is not None:
+                self.coalesced += 1
+            if digest == self._inflight[key]:
+                self.hits += 1
+                return SKIPPED
+            self._pending[key] = (digest, edit)
+            return QUEUED
+        if self._shown.get(key) == digest:
+            self.hits += 1
+            self._shown.move_to_end(key)
+            return SKIPPED
+        self.misses += 1
+        while True:
+            self._inflight[key] = digest
+            try:
+                self.edits += 1
+                ok = await edit()
+            except BaseException:
+                self.forget(key)
+                if self._pending.pop(key, None) is not None:
+                    self.coalesced += 1
+                raise
+            finally:
+                del self._inflight[key]
+            if ok:
+                self.remember(key, digest)
+            else:
+                self.forget(key)
+            nxt = self._pending.pop(key, None)
+            if nxt is None:
+                return SENT
+            digest, edit = nxt
+            if self._shown.get(key) == digest:
+                self.hits += 1
+                return SENT
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._shown), "hits": self.hits, "misses": self.misses,
+                "coalesced": self.coalesced, "edits": self.edits}
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# /stats 预聚合：按天/按小时的查询量、新用户、活跃用户与热门关键词
+#
+# - 触发器在 query_log / user_meta 插入时同步累加汇总表(与 write-behind 批量写入同一事务)
+# - /stats 只读汇总表，耗时与 query_log 总行数无关
+# - backfill() 从明细表重建汇总(升级前的历史数据)，大部分聚合在只读快照上完成，
+#   只在最后替换汇总表时短暂持有写锁
+#
+# - start() 后台每天 prune() 一次，stats_daily_users 只保留最近 keep_user_days 天
+#
+# 时间桶取明细行 created_at/first_seen 的前 10/13 个字符(YYYY-MM-DD / YYYY-MM-DD HH)，与写入时的时区一致。
+
+import time
+import asyncio
+import logging
+import sqlite3
+import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS stats_daily(
+        day TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, metric)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS stats_hourly(
+        hour TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(hour, metric)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS stats_daily_keywords(
+        day TEXT NOT NULL,
+        keyword TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, keyword)
+    ) WITHOUT ROWID""",
+    # 当天已出现过的用户，仅用于活跃用户去重；过期的天由 prune() 清理
+    """CREATE TABLE IF NOT EXISTS stats_daily_users(
+        day TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY(day, user_id)
+    ) WITHOUT ROWID""",
+    """CREATE TRIGGER IF NOT EXISTS trg_query_log_rollup AFTER INSERT ON query_log BEGIN
+        INSERT INTO stats_daily(day, metric, n)
+        VALUES(substr(coalesce(NEW.created_at, CURRENT_TIMESTAMP), 1, 10), 'queries', 1)
+        ON CONFLICT(day, metric) DO UPDATE SET n=n+1;
+        INSERT INTO stats_hourly(hour, metric, n)
+        VALUES(substr(coalesce(NEW.created_at, CURRENT_TIMESTAMP), 1, 13), 'queries', 1)
+        ON CONFLICT(hour, metric) DO UPDATE SET n=n+1;
+        INSERT INTO stats_daily_keywords(day, keyword, n)
+        VALUES(substr(coalesce(NEW.created_at, CURRENT_TIMESTAMP), 1, 10), lower(trim(coalesce(NEW.keyword, ''))), 1)
+        ON CONFLICT(day, keyword) DO UPDATE SET n=n+1;
+        INSERT OR IGNORE INTO stats_daily_users(day, user_id)
+        VALUES(substr(coalesce(NEW.created_at, CURRENT_TIMESTAMP), 1, 10), NEW.user_id);
+    END""",
+    # 只有当天第一次出现的用户才会真正插入，从而触发活跃用户 +1
+    """CREATE TRIGGER IF NOT EXISTS trg_daily_users_rollup AFTER INSERT ON stats_daily_users BEGIN
+        INSERT INTO stats_daily(day, metric, n) VALUES(NEW.day, 'active_users', 1)
+        ON CONFLICT(day, metric) DO UPDATE SET n=n+1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_user_meta_rollup AFTER INSERT ON user_meta BEGIN
+        INSERT INTO stats_daily(day, metric, n)
+        VALUES(substr(coalesce(NEW.first_seen, CURRENT_TIMESTAMP), 1, 10), 'new_users', 1)
+        ON CONFLICT(day, metric) DO UPDATE SET n=n+1;
+        INSERT INTO stats_hourly(hour, metric, n)
+        VALUES(substr(coalesce(NEW.first_seen, CURRENT_TIMESTAMP), 1, 13), 'new_users', 1)
+        ON CONFLICT(hour, metric) DO UPDATE SET n=n+1;
+    END""",
+)
+
+_HOUR = "substr(coalesce(created_at, CURRENT_TIMESTAMP), 1, 13)"
+_UDAY = "substr(coalesce(first_seen, CURRENT_TIMESTAMP), 1, 10)"
+_UHOUR = "substr(coalesce(first_seen, CURRENT_TIMESTAMP), 1, 13)"
+
+
+class StatsRollups:
+    def __init__(self, pool: Any, keep_user_days: int = 2, prune_interval: float = 86400.0):
+        self.pool = pool
+        self.keep_user_days = keep_user_days
+        self.prune_interval = prune_interval
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection) -> None:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+
+    # ---- 维护 ----
+    def _backfill(self, c: sqlite3.Connection) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        cutoff = c.execute("SELECT coalesce(max(id), 0) FROM query_log").fetchone()[0]
+        c.commit()
+        # 阶段 1：在只读快照上聚合 id<=cutoff 的历史，结果写入临时表(不占主库写锁)
+        c.execute("DROP TABLE IF EXISTS temp.bf_q")
+        c.execute(f"""CREATE TEMP TABLE bf_q AS
+                      SELECT {_HOUR} AS hour, lower(trim(coalesce(keyword, ''))) AS keyword, user_id, COUNT(*) AS n
+                      FROM query_log WHERE id<=? GROUP BY 1, 2, 3""", (cutoff,))
+        c.commit()
+        # 阶段 2：短事务内替换汇总表；cutoff 之后(回填期间)新写入的行已由触发器计入，这里一并重算
+        c.execute("BEGIN IMMEDIATE")
+        c.execute(f"""INSERT INTO temp.bf_q
+                      SELECT {_HOUR}, lower(trim(coalesce(keyword, ''))), user_id, COUNT(*)
+                      FROM query_log WHERE id>? GROUP BY 1, 2, 3""", (cutoff,))
+        for t in ("stats_daily", "stats_hourly", "stats_daily_keywords", "stats_daily_users"):
+            c.execute(f"DELETE FROM {t}")
+        c.execute("""INSERT INTO stats_hourly(hour, metric, n)
+                     SELECT hour, 'queries', SUM(n) FROM temp.bf_q GROUP BY hour""")
+        c.execute("""INSERT INTO stats_daily(day, metric, n)
+                     SELECT substr(hour, 1, 10), 'queries', SUM(n) FROM temp.bf_q GROUP BY 1""")
+        c.execute("""INSERT INTO stats_daily(day, metric, n)
+                     SELECT substr(hour, 1, 10), 'active_users', COUNT(DISTINCT user_id) FROM temp.bf_q GROUP BY 1""")
+        c.execute("""INSERT INTO stats_daily_keywords(day, keyword, n)
+                     SELECT substr(hour, 1, 10), keyword, SUM(n) FROM temp.bf_q GROUP BY 1, 2""")
+        since = (datetime.date.today() - datetime.timedelta(days=self.keep_user_days - 1)).isoformat()
+        # 直接写入去重表会触发活跃用户 +1，先写后覆盖上面算好的 active_users
+        c.execute("""INSERT OR IGNORE INTO stats_daily_users(day, user_id)
+                     SELECT DISTINCT substr(hour, 1, 10), user_id FROM temp.bf_q WHERE substr(hour, 1, 10)>=?""", (since,))
+        c.execute("""UPDATE stats_daily SET n=(SELECT COUNT(DISTINCT user_id) FROM temp.bf_q
+                                                WHERE substr(hour, 1, 10)=stats_daily.day)
+                     WHERE metric='active_users' AND day>=?""", (since,))
+        c.execute(f"""INSERT INTO stats_daily(day, metric, n)
+                      SELECT {_UDAY}, 'new_users', COUNT(*) FROM user_meta GROUP BY 1""")
+        c.execute(f"""INSERT INTO stats_hourly(hour, metric, n)
+                      SELECT {_UHOUR}, 'new_users', COUNT(*) FROM user_meta GROUP BY 1""")
+        c.commit()
+        c.execute("DROP TABLE temp.bf_q")
+        queries = c.execute("SELECT coalesce(SUM(n), 0) FROM stats_daily WHERE metric='queries'").fetchone()[0]
+        days = c.execute("SELECT COUNT(DISTINCT day) FROM stats_daily").fetchone()[0]
+        return {"queries": queries, "days": days, "seconds": time.perf_counter() - t0}
+
+    async def backfill(self) -> Dict[str, Any]:
+        """从 query_log / user_meta 全量重建汇总表，返回 {queries, days, seconds}。"""
+        return await self.pool.run(self._backfill, "rollups.backfill")
+
+    async def backfill_if_empty(self) -> bool:
+        """汇总表为空但已有历史明细时(首次升级)自动回填。"""
+        def _check(c: sqlite3.Connection) -> bool:
+            empty = c.execute("SELECT 1 FROM stats_daily LIMIT 1").fetchone() is None
+            return empty and c.execute("SELECT 1 FROM query_log LIMIT 1").fetchone() is not None
+        if not await self.pool.run(_check, "rollups.check"):
+            return False
+        await self.backfill()
+        return True
+
+    async def prune(self) -> int:
+        """清理早于 keep_user_days 的活跃用户去重记录(计数已在 stats_daily 中)。"""
+        since = (datetime.date.today() - datetime.timedelta(days=self.keep_user_days - 1)).isoformat()
+
+        def _do(c: sqlite3.Connection) -> int:
+            cur = c.execute("DELETE FROM stats_daily_users WHERE day<?", (since,))
+            c.commit()
+            return cur.rowcount
+        return await self.pool.run(_do, "rollups.prune")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                n = await self.prune()
+                if n:
+                    logger.info("Pruned %d stats_daily_users rows", n)
+            except Exception as e:
+                logger.warning("Rollup prune failed: %s", e)
+            await asyncio.sleep(self.prune_interval)
+
+    def start(self) -> None:
+        """后台定期 prune()：启动时一次，之后每 prune_interval 秒一次。"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="rollups-prune")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # ---- 查询 ----
+    def _summary(self, c: sqlite3.Connection, days: int, top: int) -> Dict[str, Any]:
+        today = datetime.date.today()
+        since = (today - datetime.timedelta(days=days - 1)).isoformat()
+        totals = {r["metric"]: r["n"] for r in c.execute(
+            "SELECT metric, SUM(n) AS n FROM stats_daily WHERE metric IN ('queries','new_users') GROUP BY metric")}
+        daily: Dict[str, Dict[str, int]] = {}
+        for r in c.execute("SELECT day, metric, n FROM stats_daily WHERE day>=? ORDER BY day", (since,)):
+            daily.setdefault(r["day"], {})[r["metric"]] = r["n"]
+        keywords = c.execute("""SELECT keyword, SUM(n) AS n FROM stats_daily_keywords
+                                WHERE day>=? AND keyword<>'' GROUP BY keyword ORDER BY n DESC LIMIT ?""",
+                             (since, top)).fetchall()
+        hour_since = (datetime.datetime.now() - datetime.timedelta(hours=23)).strftime("%Y-%m-%d %H")
+        hourly = c.execute("SELECT hour, n FROM stats_hourly WHERE metric='queries' AND hour>=? ORDER BY hour",
+                           (hour_since,)).fetchall()
+        return {
+            "users": totals.get("new_users", 0),
+            "queries": totals.get("queries", 0),
+            "daily": daily,
+            "top_keywords": [(r["keyword"], r["n"]) for r in keywords],
+            "hourly": [(r["hour"], r["n"]) for r in hourly],
+        }
+
+    async def summary(self, days: int = 7, top: int = 10) -> Dict[str, Any]:
+        return await self.pool.run(lambda c: self._summary(c, days, top), "rollups.summary")
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# 「查询」关键词检索索引
+#
+# - 名称归一化：NFKC、小写、去空白，通用后缀(银行/农村信用社/农村商业银行)折叠；
+#   查询词折叠后为空(只有"银行"这类通用称谓)时查 称谓 → 名称 表，按未折叠名称包含匹配列出相关条目
+# - 别名/简称：工行→工商银行、招行→招商银行 等，可运行时 add_alias()
+# - 拼音首字母：优先 pypinyin(可选依赖)，缺省时用 GB2312 一级字库区间推断
+# - 字符 n-gram 倒排索引：单字 + 双字，查询只看最稀有 gram 的倒排链
+# - add/remove/sync 增量维护，无需整表重建
+
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+try:  # 可选依赖
+    from pypinyin import Style, lazy_pinyin  # type: ignore
+except ImportError:  # pragma: no cover - 取决于部署环境
+    lazy_pinyin = None
+    Style = None
+
+# 通用称谓折叠：长写法 → 短写法(顺序有意义，先长后短)
+SUFFIX_FOLDS: Tuple[Tuple[str, str], ...] = (
+    ("农村商业银行", "农商"),
+    ("农商银行", "农商"),
+    ("农商行", "农商"),
+    ("农村信用合作联社", "农信"),
+    ("农村信用联社", "农信"),
+    ("农村信用社", "农信"),
+    ("信用社", "农信"),
+    ("商业银行", ""),
+    ("银行", ""),
+)
+# 折叠后为空的称谓(先长后短)：只含这些词的查询走 SearchIndex._generic
+GENERIC_TERMS: Tuple[str, ...] = tuple(long for long, short in SUFFIX_FOLDS if not short)
+
+# GB2312 一级汉字按拼音排序，首字母区间(起始区位码)
+_GB_INITIALS: Tuple[Tuple[int, str], ...] = (
+    (0xB0A1, "a"), (0xB0C5, "b"), (0xB2C1, "c"), (0xB4EE, "d"), (0xB6EA, "e"),
+    (0xB7A2, "f"), (0xB8C1, "g"), (0xB9FE, "h"), (0xBBF7, "j"), (0xBFA6, "k"),
+    (0xC0AC, "l"), (0xC2E8, "m"), (0xC4C3, "n"), (0xC5B6, "o"), (0xC5BE, "p"),
+    (0xC6DA, "q"), (0xC8BB, "r"), (0xC8F6, "s"), (0xCBFA, "t"), (0xCDDA, "w"),
+    (0xCEF4, "x"), (0xD1B9, "y"), (0xD4D1, "z"),
+)
+_GB_END = 0xD7F9
+# 常见多音字词的首字母纠正(仅 GB2312 推断时使用)
+_PHRASE_INITIALS: Dict[str, str] = {"重庆": "cq", "长沙": "cs", "长春": "cc", "厦门": "xm"}
+
+# 打分
+SCORE_EXACT = 100
+SCORE_ALIAS = 95
+SCORE_PREFIX = 80
+SCORE_CONTAINS = 60
+SCORE_INITIALS = 50
+SCORE_FUZZY = 30
+
+
+def normalize(text: str) -> str:
+    """NFKC + 小写 + 去空白。"""
+    s = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(s.split())
+
+
+def fold(text: str) -> str:
+    """归一化后再折叠通用称谓，用于匹配比较。"""
+    s = normalize(text)
+    for long, short in SUFFIX_FOLDS:
+        if long in s:
+            s = s.replace(long, short)
+    return s
+
+
+def _char_initial(ch: str) -> str:
+    if ch.isascii():
+        return ch if ch.isalnum() else ""
+    try:
+        code = int.from_bytes(ch.encode("gb2312"), "big")
+    except UnicodeEncodeError:
+        return ""
+    if not (_GB_INITIALS[0][0] <= code < _GB_END):
+        return ""  # 二级字库按部首排序，无法推断
+    letter = ""
+    for start, ini in _GB_INITIALS:
+        if code < start:
+            break
+        letter = ini
+    return letter
+
+
+def pinyin_initials(text: str) -> str:
+    s = normalize(text)
+    if lazy_pinyin is not None:
+        return "".join(p[:1] for p in lazy_pinyin(s, style=Style.FIRST_LETTER) if p).lower()
+    out = "".join(_char_initial(ch) for ch in s)
+    if len(out) == len(s):
+        for phrase, ini in _PHRASE_INITIALS.items():
+            i = s.find(phrase)
+            while i >= 0:
+                out = out[:i] + ini + out[i + len(ini):]
+                i = s.find(phrase, i + 1)
+    return out
+
+
+def grams(text: str) -> Set[str]:
+    """单字 + 双字 gram。"""
+    out = set(text)
+    out.update(text[i:i + 2] for i in range(len(text) - 1))
+    return out
+
+
+@dataclass
+class SearchHit:
+    name: str
+    score: int
+    payload: Any = None
+
+
+@dataclass
+class _Doc:
+    name: str
+    payload: Any
+    key: str
+    norm: str
+    initials: str
+    aliases: Set[str] = field(default_factory=set)
+    grams: Set[str] = field(default_factory=set)
+    generic: Tuple[str, ...] = ()
+
+
+class SearchIndex:
+    """名称 → payload 的检索索引；名称唯一。"""
+
+    def __init__(self, max_candidates: int = 256, max_initials: int = 8):
+        # 候选集上限：热门 gram 的倒排链可能很长，只取前 N 个参与打分，保证查询耗时不随目录增长
+        self.max_candidates = max_candidates
+        self.max_initials = max_initials
+        self._docs: Dict[str, _Doc] = {}
+        self._exact: Dict[str, Set[str]] = {}  # 折叠后的名称 → 名称
+        self._postings: Dict[str, Set[str]] = {}
+        self._initials: Dict[str, Set[str]] = {}
+        self._aliases: Dict[str, Set[str]] = {}  # 折叠后的别名 → 名称
+        self._generic: Dict[str, Set[str]] = {}  # 通用称谓 → 名称中含该称谓的条目
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._docs
+
+    # ---- 维护 ----
+    def add(self, name: str, payload: Any = None, aliases: Iterable[str] = ()) -> None:
+        old = self._docs.get(name)
+        if old is not None:
+            if old.payload == payload and not set(map(fold, aliases)) - old.aliases:
+                return
+            extra = old.aliases
+            self.remove(name)
+        else:
+            extra = set()
+        key = fold(name)
+        doc = _Doc(name=name, payload=payload, key=key, norm=normalize(name), initials=pinyin_initials(key))
+        doc.grams = grams(key)
+        doc.generic = tuple(t for t in GENERIC_TERMS if t in doc.norm)
+        self._docs[name] = doc
+        self._exact.setdefault(key, set()).add(name)
+        for g in doc.grams:
+            self._postings.setdefault(g, set()).add(name)
+        for t in doc.generic:
+            self._generic.setdefault(t, set()).add(name)
+        for i in range(1, min(len(doc.initials), self.max_initials) + 1):
+            self._initials.setdefault(doc.initials[:i], set()).add(name)
+        for a in set(map(fold, aliases)) | extra:
+            self._link_alias(a, name)
+
+    def remove(self, name: str) -> None:
+        doc = self._docs.pop(name, None)
+        if doc is None:
+            return
+        self._discard(self._exact, doc.key, name)
+        for g in doc.grams:
+            self._discard(self._postings, g, name)
+        for t in doc.generic:
+            self._discard(self._generic, t, name)
+        for i in range(1, min(len(doc.initials), self.max_initials) + 1):
+            self._discard(self._initials, doc.initials[:i], name)
+        for a in doc.aliases:
+            self._discard(self._aliases, a, name)
+
+    def add_alias(self, alias: str, name: str) -> None:
+        if name in self._docs:
+            self._link_alias(fold(alias), name)
+
+    def sync(self, entries: Iterable[Tuple[str, Any]]) -> Tuple[int, int]:
+        """以 entries 为准增量同步：只增删/更新有变化的条目，返回 (变更数, 删除数)。"""
+        want = dict(entries)
+        removed = [n for n in self._docs if n not in want]
+        for n in removed:
+            self.remove(n)
+        changed = 0
+        for n, payload in want.items():
+            doc = self._docs.get(n)
+            if doc is None or doc.payload != payload:
+                self.add(n, payload)
+                changed += 1
+        return changed, len(removed)
+
+    def _link_alias(self, alias: str, name: str) -> None:
+        if not alias:
+            return
+        self._docs[name].aliases.add(alias)
+        self._aliases.setdefault(alias, set()).add(name)
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], key: str, name: str) -> None:
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.discard(name)
+            if not bucket:
+                del index[key]
+
+    # ---- 查询 ----
+    def _candidates(self, q: str) -> Set[str]:
+        qg = grams(q)
+        lists = sorted((self._postings.get(g, ()) for g in qg), key=len)
+        if not lists:
+            return set()
+        if lists[0]:
+            # 精确路径：从最短倒排链出发求交；过长时只校验前 N 个
+            head, rest = lists[0], lists[1:]
+            if len(head) <= self.max_candidates:
+                out = head.intersection(*rest)
+            else:
+                out = set()
+                for i, n in enumerate(head):
+                    if i >= self.max_candidates:
+                        break
+                    if all(n in other for other in rest):
+                        out.add(n)
+            if out:
+                return out
+        # 模糊路径：至少命中一半双字 gram(每条倒排链同样限长)
+        bigrams = [g for g in qg if len(g) == 2] or list(qg)
+        need = max(1, (len(bigrams) + 1) // 2)
+        counts: Dict[str, int] = {}
+        for g in bigrams:
+            for i, n in enumerate(self._postings.get(g, ())):
+                if i >= self.max_candidates:
+                    break
+                counts[n] = counts.get(n, 0) + 1
+        return {n for n, c in counts.items() if c >= need}
+
+    def _score(self, doc: _Doc, q: str, alias_hit: bool) -> int:
+        if doc.key == q or doc.norm == q:
+            return SCORE_EXACT
+        if alias_hit:
+            return SCORE_ALIAS
+        if doc.key.startswith(q):
+            return SCORE_PREFIX
+        if q in doc.key:
+            return SCORE_CONTAINS
+        if doc.initials.startswith(q):
+            return SCORE_INITIALS
+        overlap = len(grams(q) & doc.grams)
+        return int(SCORE_FUZZY * overlap / max(1, len(grams(q))))
+
+    def search(self, query: str, limit: int = 20) -> List[SearchHit]:
+        q = fold(query)
+        if not q:
+            return self._search_generic(normalize(query), limit)
+        alias_names = self._aliases.get(q, set())
+        names = set(alias_names)
+        names |= self._exact.get(q, set())
+        names |= self._candidates(q)
+        if q.isascii() and q.isalnum():
+            for i, n in enumerate(self._initials.get(q[:self.max_initials], ())):
+                if i >= self.max_candidates:
+                    break
+                names.add(n)
+        hits = []
+        for n in names:
+            doc = self._docs[n]
+            score = self._score(doc, q, n in alias_names)
+            if score > 0:
+                hits.append(SearchHit(n, score, doc.payload))
+        hits.sort(key=lambda h: (-h.score, len(h.name), h.name))
+        return hits[:limit]
+
+    def _search_generic(self, q: str, limit: int) -> List[SearchHit]:
+        """查询词只有通用称谓(如"银行")、折叠后为空：从称谓 → 名称表取候选(与其他路径一样限长)，
+        再校验未折叠名称包含查询词。这类词没有区分度，统一给 SCORE_FUZZY，不会被当成唯一命中。"""
+        term = next((t for t in GENERIC_TERMS if t in q), None)
+        if term is None:
+            return []
+        hits = []
+        for i, n in enumerate(self._generic.get(term, ())):
+            if i >= self.max_candidates:
+                break
+            doc = self._docs[n]
+            if q in doc.norm:
+                hits.append(SearchHit(n, SCORE_FUZZY, doc.payload))
+        hits.sort(key=lambda h: (len(h.name), h.name))
+        return hits[:limit]
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# settings 表进程内缓存(写穿透)
+#
+# - 启动时整表载入内存，读取零 I/O
+# - set/set_many 为协程：同一事务内写库并递增 settings_version(在池线程里执行，不占用事件循环)，再更新内存
+# - 可选 TTL：到期后仅读取一行 settings_version，与本地版本不同才整表重载，
+#   让共享同一个 DB 文件的多个进程低成本感知外部修改
+
+import time
+import sqlite3
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+VERSION_DDL = "CREATE TABLE IF NOT EXISTS settings_version(id INTEGER PRIMARY KEY CHECK(id=1), v INTEGER NOT NULL)"
+
+
+class SettingsCache:
+    """
+    settings 表的内存镜像。run_sync(fn) 需在某个连接上执行 fn(conn)，如 SQLitePool.run_sync(启动载入、TTL 检查)；
+    run(fn, label) 为其协程版本，如 SQLitePool.run，写入走它，连接池忙时也不会阻塞事件循环。
+    """
+
+    def __init__(self, run_sync: Callable[[Callable[[sqlite3.Connection], Any]], Any],
+                 ttl: Optional[float] = None, run: Optional[Callable[..., Awaitable[Any]]] = None):
+        self._run = run_sync
+        self._run_async = run
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self._data: Dict[str, Optional[str]] = {}
+        self._loaded = False
+        self._db_version = 0
+        self._checked_at = 0.0
+        # 本地修改计数：任何写入/重载都会 +1，供键盘等派生缓存判断是否失效
+        self.version = 0
+        self.hits = 0
+        self.reloads = 0
+        self.version_checks = 0
+
+    # ---- 表结构 ----
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection) -> None:
+        conn.execute(VERSION_DDL)
+        conn.execute("INSERT OR IGNORE INTO settings_version(id, v) VALUES(1, 0)")
+
+    @staticmethod
+    def _read_version(conn: sqlite3.Connection) -> int:
+        try:
+            row = conn.execute("SELECT v FROM settings_version WHERE id=1").fetchone()
+        except sqlite3.OperationalError:
+            return 0
+        return row[0] if row else 0
+
+    # ---- 载入/失效 ----
+    @classmethod
+    def _read_all(cls, c: sqlite3.Connection) -> Tuple[int, Dict[str, Optional[str]]]:
+        try:
+            rows = c.execute("SELECT key, value FROM settings").fetchall()
+        except sqlite3.OperationalError:
+            # 首次启动、init_db 尚未建表
+            rows = []
+        return cls._read_version(c), {r[0]: r[1] for r in rows}
+
+    def load(self) -> None:
+        self._loaded_from(self._run(self._read_all))
+
+    def _loaded_from(self, snapshot: Tuple[int, Dict[str, Optional[str]]]) -> None:
+        self._db_version, self._data = snapshot
+        self._loaded = True
+        self._checked_at = time.monotonic()
+        self.reloads += 1
+        self.version += 1
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """丢弃缓存：不带 key 时整表重载，带 key 时只回源这一项。"""
+        if key is None:
+            self.load()
+            return
+        row = self._run(lambda c: c.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone())
+        if row is None:
+            self._data.pop(key, None)
+        else:
+            self._data[key] = row[0]
+        self.version += 1
+
+    def _maybe_refresh(self) -> None:
+        if not self._loaded:
+            self.load()
+            return
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.ttl:
+            return
+        self._checked_at = now
+        self.version_checks += 1
+        if self._run(self._read_version) != self._db_version:
+            self.load()
+
+    # ---- 读写 ----
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        self._maybe_refresh()
+        self.hits += 1
+        return self._data[key] if key in self._data else default
+
+    def all(self) -> Dict[str, Optional[str]]:
+        self._maybe_refresh()
+        return dict(self._data)
+
+    async def _call(self, fn: Callable[[sqlite3.Connection], Any], label: str) -> Any:
+        if self._run_async is None:
+            return self._run(fn)
+        return await self._run_async(fn, label)
+
+    async def set(self, key: str, value: Optional[str]) -> None:
+        await self.set_many([(key, value)])
+
+    async def set_many(self, items: Iterable[Tuple[str, Optional[str]]]) -> None:
+        items = list(items)
+        if not items:
+            return
+
+        def _do(c: sqlite3.Connection) -> int:
+            c.executemany("""INSERT INTO settings(key, value) VALUES(?,?)
+                             ON CONFLICT(key) DO UPDATE SET value=excluded.value""", items)
+            self.ensure_schema(c)
+            c.execute("UPDATE settings_version SET v=v+1 WHERE id=1")
+            c.commit()
+            return self._read_version(c)
+
+        new_version = await self._call(_do, "settings.set")
+        # 若期间有其他进程(或本进程并发的另一次写入)写入，版本会跳号：整表重载以拿到对方的修改
+        if self._loaded and new_version == self._db_version + 1:
+            self._db_version = new_version
+            self._data.update(items)
+            self.version += 1
+        else:
+            self._loaded_from(await self._call(self._read_all, "settings.load"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._data),
+            "hits": self.hits,
+            "reloads": self.reloads,
+            "version_checks": self.version_checks,
+            "db_version": self._db_version,
+            "ttl": self.ttl,
+        }
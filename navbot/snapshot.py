@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+# 数据库在线快照与导出
+#
+# - snapshot：SQLite 在线备份 API，按页分步复制(每步之间释放锁，写入不被长时间阻塞)，得到一致的副本
+# - 压缩：优先 zstd(可选依赖 zstandard)，否则 gzip；流式压缩，不把整库读进内存
+# - 分卷：超过上传上限时切成 .001/.002 …，`cat 文件.* > 文件` 即可还原
+# - 定时快照 + 保留最近 N 份
+# - 单表导出：JSONL / CSV(gzip)，逐行流式写出
+#
+# 所有文件操作都在专用线程中执行，事件循环只等待结果。
+
+import csv
+import gzip
+import json
+import time
+import shutil
+import asyncio
+import logging
+import sqlite3
+import datetime
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:  # 可选依赖
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover - 取决于部署环境
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK = 1 << 20
+UPLOAD_LIMIT = 49 * 1024 * 1024  # Bot API sendDocument 上限 50MB，留余量
+
+
+def _compress(src: Path, dest_base: Path) -> Path:
+    """流式压缩 src，返回压缩后文件路径(.zst 或 .gz)。"""
+    if zstandard is not None:
+        dest = dest_base.with_name(dest_base.name + ".zst")
+        cctx = zstandard.ZstdCompressor(level=10, threads=-1)
+        with open(src, "rb") as fin, open(dest, "wb") as fout:
+            cctx.copy_stream(fin, fout, read_size=CHUNK, write_size=CHUNK)
+    else:
+        dest = dest_base.with_name(dest_base.name + ".gz")
+        with open(src, "rb") as fin, gzip.open(dest, "wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, CHUNK)
+    return dest
+
+
+def split_file(path: Path, limit: int) -> List[Path]:
+    """超过 limit 字节时切成 path.001、path.002 …(删除原文件)，否则原样返回。"""
+    if path.stat().st_size <= limit:
+        return [path]
+    parts: List[Path] = []
+    with open(path, "rb") as fin:
+        i = 1
+        while True:
+            part = path.with_name(f"{path.name}.{i:03d}")
+            written = 0
+            with open(part, "wb") as fout:
+                while written < limit:
+                    buf = fin.read(min(CHUNK, limit - written))
+                    if not buf:
+                        break
+                    fout.write(buf)
+                    written += len(buf)
+            if written == 0:
+                part.unlink()
+                break
+            parts.append(part)
+            i += 1
+    path.unlink()
+    return parts
+
+
+class _Restarted(Exception):
+    pass
+
+
+def backup_db(src_path: str, dest_path: Path, pages: int = 512, step_sleep: float = 0.002,
+              max_restarts: int = 3) -> Dict[str, Any]:
+    """
+    在线备份：每步复制 pages 页，步与步之间短暂让出。
+    源库在备份期间被其他连接写入时 SQLite 会从头重做；持续写入下重做超过 max_restarts 次，
+    改为单步一次性复制(WAL 模式下读事务不阻塞写入方)。
+    """
+    t0 = time.perf_counter()
+    steps = restarts = 0
+    last_remaining: Optional[int] = None
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _Restarted()
+        last_remaining = remaining
+        if step_sleep:
+            time.sleep(step_sleep)
+
+    src = sqlite3.connect(src_path, timeout=30)
+    dest = sqlite3.connect(str(dest_path))
+    try:
+        try:
+            src.backup(dest, pages=pages, progress=progress)
+        except _Restarted:
+            src.backup(dest, pages=-1)
+        dest.execute("PRAGMA journal_mode=DELETE")  # 副本是单文件，不带 -wal
+    finally:
+        dest.close()
+        src.close()
+    return {"seconds": time.perf_counter() - t0, "steps": steps, "restarts": restarts,
+            "bytes": dest_path.stat().st_size}
+
+
+class Snapshotter:
+    def __init__(self, db_path: str, out_dir: str = "./backups", keep: int = 7,
+                 split_limit: int = UPLOAD_LIMIT, prefix: str = "navbot"):
+        self.db_path = db_path
+        self.out_dir = Path(out_dir)
+        self.keep = max(1, keep)
+        self.split_limit = split_limit
+        self.prefix = prefix
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot")
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.last: Optional[Dict[str, Any]] = None
+
+    async def _in_thread(self, fn: Any, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # ---- 快照 ----
+    def _snapshot(self, out_dir: Path) -> Dict[str, Any]:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        base = out_dir / f"{self.prefix}-{stamp}.db"
+        with tempfile.TemporaryDirectory(prefix="navbot-snap-") as tmp:
+            raw = Path(tmp) / base.name
+            info = backup_db(self.db_path, raw)
+            t0 = time.perf_counter()
+            packed = _compress(raw, base)
+        info["compress_seconds"] = time.perf_counter() - t0
+        info["compressed_bytes"] = packed.stat().st_size
+        info["files"] = [str(p) for p in split_file(packed, self.split_limit)]
+        return info
+
+    async def snapshot(self, export: bool = False) -> Dict[str, Any]:
+        """
+        生成一份压缩快照，返回 {files, bytes, compressed_bytes, seconds, steps, ...}。
+        export=True 时写到临时目录(发送后由 cleanup() 删除)，否则写入 out_dir 并执行保留策略。
+        """
+        if export:
+            return await self._in_thread(self._snapshot, Path(tempfile.mkdtemp(prefix="navbot-export-")))
+        info = await self._in_thread(self._snapshot, self.out_dir)
+        self.last = info
+        await self._in_thread(self._prune)
+        return info
+
+    def _prune(self) -> List[str]:
+        """按时间戳保留最近 keep 份(分卷算一份)。"""
+        sets: Dict[str, List[Path]] = {}
+        for p in self.out_dir.glob(f"{self.prefix}-*.db.*"):
+            sets.setdefault(p.name.split(".db.")[0], []).append(p)
+        removed: List[str] = []
+        for stamp in sorted(sets)[:-self.keep]:
+            for p in sets[stamp]:
+                p.unlink(missing_ok=True)
+                removed.append(p.name)
+        return removed
+
+    # ---- 单表导出 ----
+    def _dump_table(self, table: str, fmt: str, out_dir: Path) -> Dict[str, Any]:
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=30)
+        try:
+            tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            if table not in tables:
+                raise ValueError(f"unknown table: {table}")
+            cur = conn.execute(f'SELECT * FROM "{table}"')
+            cols = [d[0] for d in cur.description]
+            stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            path = out_dir / f"{table}-{stamp}.{fmt}.gz"
+            rows = 0
+            with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+                if fmt == "csv":
+                    w = csv.writer(f)
+                    w.writerow(cols)
+                    for batch in iter(lambda: cur.fetchmany(1000), []):
+                        w.writerows([["" if v is None else (v.hex() if isinstance(v, bytes) else v) for v in r]
+                                     for r in batch])
+                        rows += len(batch)
+                else:
+                    for batch in iter(lambda: cur.fetchmany(1000), []):
+                        for r in batch:
+                            f.write(json.dumps({k: (v.hex() if isinstance(v, bytes) else v) for k, v in zip(cols, r)},
+                                               ensure_ascii=False, separators=(",", ":")))
+                            f.write("\n")
+                        rows += len(batch)
+        finally:
+            conn.close()
+        return {"files": [str(p) for p in split_file(path, self.split_limit)], "rows": rows}
+
+    async def dump_table(self, table: str, fmt: str = "jsonl") -> Dict[str, Any]:
+        """把单表导出到临时目录，返回 {files, rows}；表名必须是库中已存在的表。"""
+        if fmt not in ("jsonl", "csv"):
+            raise ValueError("fmt must be jsonl or csv")
+        return await self._in_thread(self._dump_table, table, fmt, Path(tempfile.mkdtemp(prefix="navbot-export-")))
+
+    # ---- 定时 ----
+    async def _run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                info = await self.snapshot()
+                logger.info("Snapshot written: %s (%.1f MB → %.1f MB, %.1fs)", info["files"],
+                            info["bytes"] / 1e6, info["compressed_bytes"] / 1e6, info["seconds"])
+            except Exception:
+                logger.exception("scheduled snapshot failed")
+
+    def start(self, interval_hours: float) -> None:
+        if interval_hours <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(interval_hours * 3600), name="snapshots")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+
+def cleanup(files: List[str]) -> None:
+    """删除临时导出文件及其所在的临时目录(若已空)。"""
+    for f in files:
+        p = Path(f)
+        p.unlink(missing_ok=True)
+        try:
+            p.parent.rmdir()
+        except OSError:
+            pass
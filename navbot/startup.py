@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# 启动：版本化的表结构迁移 + 启动阶段计时
+#
+# 迁移
+# - 版本号记在 PRAGMA user_version(库文件头里的一个整数，读取不查任何表)
+# - 已是最新版本时，启动只做这一次读取；否则在 BEGIN IMMEDIATE 下逐个执行未应用的迁移，
+#   每个迁移执行完即写入新版本号并提交。多个实例同时启动(滚动重启)时，后拿到写锁的实例
+#   会重新读取版本号，发现已迁移便直接跳过
+# - 迁移函数内不要 commit(会提前结束事务、让版本号与表结构不一致)；迁移抛错时整步回滚
+# - 新增/修改表结构时在列表末尾追加一个迁移，已发布的迁移不要再改
+# - 库版本高于代码(回滚到旧版本代码)时只告警，不阻止启动
+#
+# 计时
+# - StartupTimer.phase("名称") 记录各启动阶段耗时；attach_first_update(dp) 记录处理首条更新的时间点
+#
+#     MIGRATIONS = [Migration(1, "baseline", _m001), Migration(2, "media", _m002)]
+#     with pool.connection() as c:
+#         migrate(c, MIGRATIONS)
+
+import time
+import logging
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, migrations: Sequence[Migration]) -> Dict[str, Any]:
+    """把库迁移到最新版本，返回 {"from", "to", "applied": [(版本, 名称, 秒)]}。"""
+    versions = [m.version for m in migrations]
+    if versions != list(range(1, len(versions) + 1)):
+        raise ValueError(f"migration versions must be 1..N without gaps: {versions}")
+    latest = versions[-1] if versions else 0
+    current = schema_version(conn)
+    report: Dict[str, Any] = {"from": current, "to": current, "applied": []}
+    if current == latest:
+        return report
+    if current > latest:
+        logger.warning("Database schema v%d is newer than this build (v%d)", current, latest)
+        return report
+    for m in migrations[current:]:
+        t0 = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        if schema_version(conn) >= m.version:
+            conn.rollback()  # 其他实例已迁移
+            continue
+        try:
+            m.apply(conn)  # 迁移函数自己不 commit，整步在本事务里
+            conn.execute(f"PRAGMA user_version={int(m.version)}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        dt = time.perf_counter() - t0
+        report["applied"].append((m.version, m.name, dt))
+        logger.info("Migrated database to v%d (%s) in %.0f ms", m.version, m.name, dt * 1e3)
+    report["to"] = schema_version(conn)
+    return report
+
+
+class StartupTimer:
+    def __init__(self, t0: Optional[float] = None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.phases: List[Tuple[str, float]] = []
+        self.ready_at: Optional[float] = None
+        self.first_update_at: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - t))
+
+    def mark(self, name: str) -> None:
+        """记录从计时起点到现在的耗时(如模块导入)。"""
+        self.phases.append((name, time.perf_counter() - self.t0))
+
+    def ready(self) -> None:
+        """启动关键路径结束(即将开始接收更新)。"""
+        self.ready_at = time.perf_counter() - self.t0
+
+    def attach_first_update(self, dp: Any) -> None:
+        """在 dp.update 上挂一个一次性外层中间件，处理完首条更新后记录时间并自行卸载。"""
+        async def first_update(handler: Callable[..., Any], event: Any, data: Dict[str, Any]) -> Any:
+            try:
+                return await handler(event, data)
+            finally:
+                if self.first_update_at is None:
+                    self.first_update_at = time.perf_counter() - self.t0
+                    dp.update.outer_middleware.unregister(first_update)
+                    logger.info("First update handled %.0f ms after start", self.first_update_at * 1e3)
+        dp.update.outer_middleware(first_update)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "phases_ms": {name: round(dt * 1e3, 1) for name, dt in self.phases},
+            "ready_ms": None if self.ready_at is None else round(self.ready_at * 1e3, 1),
+            "first_update_ms": None if self.first_update_at is None else round(self.first_update_at * 1e3, 1),
+        }
+
+    def log(self) -> None:
+        parts = ", ".join(f"{name} {dt * 1e3:.1f}" for name, dt in self.phases)
+        logger.info("Startup ready in %.0f ms (%s ms)", (self.ready_at or 0) * 1e3, parts)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# 共享状态后端：FSM 草稿、冷却时间、轮询计数
+#
+# 多个机器人进程(如负载均衡后的多个 webhook 实例)共用同一个后端即可保持一致：
+#   - FSM 状态与数据：aiogram BaseStorage 实现，重启后进行中的广告草稿不丢失
+#   - cooldown(key, seconds)：原子地「检查并占用」冷却窗口，同一窗口内只有一个调用方拿到 True
+#   - incr(key)：原子自增，返回新值(客服轮询分配等)
+#
+# 默认 SQLite(与主库同文件，WAL 下多进程安全)；STATE_BACKEND=redis 时使用 Redis(可选依赖 redis)。
+
+import json
+import time
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS fsm_state(
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        updated_at REAL
+    )""",
+    """CREATE TABLE IF NOT EXISTS state_cooldowns(
+        key TEXT PRIMARY KEY,
+        until REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS state_counters(
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )""",
+)
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class StateStore(ABC):
+    """后端接口；SQLiteStateStore / RedisStateStore 实现。"""
+
+    @abstractmethod
+    async def cooldown(self, key: str, seconds: float) -> bool:
+        """冷却已过则占用新窗口并返回 True，否则 False(原子操作)。"""
+
+    @abstractmethod
+    async def reset_cooldown(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1) -> int:
+        """原子自增并返回新值；不存在时从 0 开始。"""
+
+    @abstractmethod
+    def fsm_storage(self) -> BaseStorage:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+# ========== SQLite ==========
+class SQLiteFSMStorage(BaseStorage):
+    """aiogram FSM 存储，落在 SQLitePool 所在的库。"""
+
+    def __init__(self, pool: Any, key_builder: Optional[KeyBuilder] = None):
+        self.pool = pool
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.pool.execute(
+            """INSERT INTO fsm_state(key, state, updated_at) VALUES(?,?,?)
+               ON CONFLICT(key) DO UPDATE SET state=excluded.state, updated_at=excluded.updated_at""",
+            (self.key_builder.build(key), _state_name(state), time.time()))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self.pool.fetchone("SELECT state FROM fsm_state WHERE key=?", (self.key_builder.build(key),))
+        return row["state"] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self.pool.execute(
+            """INSERT INTO fsm_state(key, data, updated_at) VALUES(?,?,?)
+               ON CONFLICT(key) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at""",
+            (self.key_builder.build(key), json.dumps(dict(data), ensure_ascii=False), time.time()))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self.pool.fetchone("SELECT data FROM fsm_state WHERE key=?", (self.key_builder.build(key),))
+        return json.loads(row["data"]) if row else {}
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        # 读-改-写放在同一个 IMMEDIATE 事务里，并发更新不同字段不会互相覆盖
+        k = self.key_builder.build(key)
+        patch = dict(data)
+
+        def _do(c: sqlite3.Connection) -> Dict[str, Any]:
+            c.execute("BEGIN IMMEDIATE")  # 出错时连接归还池时自动回滚
+            row = c.execute("SELECT data FROM fsm_state WHERE key=?", (k,)).fetchone()
+            current = json.loads(row["data"]) if row else {}
+            current.update(patch)
+            c.execute("""INSERT INTO fsm_state(key, data, updated_at) VALUES(?,?,?)
+                         ON CONFLICT(key) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at""",
+                      (k, json.dumps(current, ensure_ascii=False), time.time()))
+            c.commit()
+            return current
+        return await self.pool.run(_do, "fsm.update_data")
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteStateStore(StateStore):
+    def __init__(self, pool: Any):
+        self.pool = pool
+        self._fsm = SQLiteFSMStorage(pool)
+
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection) -> None:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+
+    async def cooldown(self, key: str, seconds: float) -> bool:
+        now = time.time()
+        # 单条 UPSERT：只有窗口已过期时才会改写，changes()==1 即占用成功
+        def _do(c: sqlite3.Connection) -> bool:
+            cur = c.execute("""INSERT INTO state_cooldowns(key, until) VALUES(?,?)
+                               ON CONFLICT(key) DO UPDATE SET until=excluded.until
+                               WHERE state_cooldowns.until <= ?""", (key, now + seconds, now))
+            c.commit()
+            return cur.rowcount == 1
+        return await self.pool.run(_do, "state.cooldown")
+
+    async def reset_cooldown(self, key: str) -> None:
+        await self.pool.execute("DELETE FROM state_cooldowns WHERE key=?", (key,))
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        def _do(c: sqlite3.Connection) -> int:
+            row = c.execute("""INSERT INTO state_counters(key, value) VALUES(?,?)
+                               ON CONFLICT(key) DO UPDATE SET value=value+excluded.value
+                               RETURNING value""", (key, amount)).fetchone()
+            c.commit()
+            return row[0]
+        return await self.pool.run(_do, "state.incr")
+
+    def fsm_storage(self) -> BaseStorage:
+        return self._fsm
+
+
+# ========== Redis(可选) ==========
+class RedisStateStore(StateStore):
+    """需要 `pip install redis`；FSM 直接用 aiogram 自带的 RedisStorage。"""
+
+    def __init__(self, url: str, prefix: str = "navbot"):
+        from redis.asyncio import Redis  # 可选依赖，仅在选用时导入
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        self.redis = Redis.from_url(url)
+        self.prefix = prefix
+        self._fsm = RedisStorage(self.redis, key_builder=DefaultKeyBuilder(prefix=f"{prefix}:fsm", with_destiny=True))
+
+    def _key(self, kind: str, key: str) -> str:
+        return f"{self.prefix}:{kind}:{key}"
+
+    async def cooldown(self, key: str, seconds: float) -> bool:
+        return bool(await self.redis.set(self._key("cd", key), 1, nx=True, px=max(1, int(seconds * 1000))))
+
+    async def reset_cooldown(self, key: str) -> None:
+        await self.redis.delete(self._key("cd", key))
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        return int(await self.redis.incrby(self._key("ctr", key), amount))
+
+    def fsm_storage(self) -> BaseStorage:
+        return self._fsm
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+def make_state_store(backend: str, pool: Any, redis_url: str = "") -> StateStore:
+    backend = (backend or "sqlite").lower()
+    if backend == "sqlite":
+        return SQLiteStateStore(pool)
+    if backend == "redis":
+        if not redis_url:
+            raise RuntimeError("Missing env REDIS_URL (required when STATE_BACKEND=redis)")
+        return RedisStateStore(redis_url)
+    raise RuntimeError(f"Unknown STATE_BACKEND: {backend}")
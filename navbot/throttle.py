@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# 防刷限速：按 用户 × handler 类别 的令牌桶，挂在 dp.message / dp.callback_query 的外层中间件上
+#
+# - 类别：/start 等命令按 commands 映射(其余命令归 "command")、非命令文本 "query"(查询/关键词)、
+#   其他消息 "message"、内联按钮回调 "callback"；rules 里没有的类别不限速
+# - 每个类别一条规则 Rule(rate 个/秒, burst 桶容量)；同一用户各类别的桶互不影响
+# - 被限速的回调只回一个 cq.answer 提示(按钮不再转圈)，不进 handler、不查库；
+#   被限速的消息直接丢弃，每段连续被限速期间只在私聊里提示一次
+# - 状态：LRU 有界表，键为 user_id × 类别数 + 类别序号(int，不建元组)，值为 __slots__ 小对象；
+#   超过 maxsize 时淘汰最久未活动的用户(被淘汰等于桶已回满，不会误伤)，用户再多内存也不涨
+# - exempt(uid) 只在将要限速时调用(如 OWNER 不限速)，正常路径不多一次设置查询
+#
+#     throttle = Throttle({"query": Rule(0.5, 5), "callback": Rule(2, 10)}, maxsize=100_000)
+#     throttle.install(dp)
+
+import time
+import logging
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, Message
+
+logger = logging.getLogger(__name__)
+
+PASS = 0
+DROP = 1
+NOTIFY = 2  # 本段限速的第一次：提示用户一次
+
+
+class Rule(NamedTuple):
+    rate: float   # 每秒补充的令牌数
+    burst: float  # 桶容量：允许的连续操作次数
+
+
+DEFAULT_RULES: Dict[str, Rule] = {
+    "start": Rule(0.2, 3),
+    "command": Rule(1.0, 5),
+    "query": Rule(0.5, 5),
+    "message": Rule(1.0, 5),
+    "callback": Rule(2.0, 10),
+}
+
+
+def parse_rules(raw: str, base: Optional[Dict[str, Rule]] = None) -> Dict[str, Rule]:
+    """'query=0.5:5,callback=2:10' 覆盖 base 中的规则；rate<=0 表示该类别不限速。格式不对的项忽略。"""
+    out = dict(base if base is not None else DEFAULT_RULES)
+    for part in raw.split(","):
+        name, _, value = part.partition("=")
+        rate, _, burst = value.partition(":")
+        try:
+            rule = Rule(float(rate), float(burst or 1))
+        except ValueError:
+            continue
+        name = name.strip()
+        if not name:
+            continue
+        if rule.rate <= 0:
+            out.pop(name, None)
+        else:
+            out[name] = Rule(rule.rate, max(1.0, rule.burst))
+    return out
+
+
+class _Bucket:
+    __slots__ = ("tokens", "stamp", "noticed")
+
+    def __init__(self, tokens: float, stamp: float):
+        self.tokens = tokens
+        self.stamp = stamp
+        self.noticed = False
+
+
+class Throttle:
+    def __init__(self, rules: Optional[Dict[str, Rule]] = None, maxsize: int = 100_000,
+                 exempt: Optional[Callable[[int], bool]] = None, commands: Optional[Dict[str, str]] = None,
+                 callback_text: str = "操作太频繁，请稍后再试", message_text: str = "⏳ 操作太频繁，请稍后再试。"):
+        rules = DEFAULT_RULES if rules is None else rules
+        self.rules = dict(rules)
+        self._index = {name: (i, r.rate, r.burst) for i, (name, r) in enumerate(self.rules.items())}
+        self._n = max(1, len(self.rules))
+        self.maxsize = maxsize
+        self.exempt = exempt
+        self.commands = commands if commands is not None else {"start": "start", "menu": "start"}
+        self.callback_text = callback_text
+        self.message_text = message_text
+        self._buckets: "OrderedDict[int, _Bucket]" = OrderedDict()
+        self._installed: List[Any] = []
+        self.passed = 0
+        self.throttled: Counter = Counter()
+        self.notices = 0
+        self.exempted = 0
+        self.evicted = 0
+
+    # ---- 令牌桶 ----
+    def hit(self, user_id: int, kind: str) -> int:
+        """消耗 user_id 在 kind 类别的一个令牌，返回 PASS / DROP / NOTIFY。"""
+        rule = self._index.get(kind)
+        if rule is None:
+            return PASS
+        idx, rate, burst = rule
+        key = user_id * self._n + idx
+        now = time.monotonic()
+        b = self._buckets.get(key)
+        if b is None:
+            self._buckets[key] = _Bucket(burst - 1.0, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+            return PASS
+        self._buckets.move_to_end(key)
+        tokens = b.tokens + (now - b.stamp) * rate
+        b.tokens = burst if tokens > burst else tokens
+        b.stamp = now
+        if b.tokens >= 1.0:
+            b.tokens -= 1.0
+            b.noticed = False
+            return PASS
+        if b.noticed:
+            return DROP
+        b.noticed = True
+        return NOTIFY
+
+    def classify(self, event: Any) -> Optional[str]:
+        if isinstance(event, CallbackQuery):
+            return "callback"
+        if isinstance(event, Message):
+            text = event.text or ""
+            if text.startswith("/"):
+                name = text[1:].split(maxsplit=1)[0].split("@", 1)[0] if len(text) > 1 else ""
+                return self.commands.get(name, "command")
+            return "query" if text else "message"
+        return None
+
+    # ---- 中间件 ----
+    async def middleware(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event: Any,
+                         data: Dict[str, Any]) -> Any:
+        user = getattr(event, "from_user", None)
+        kind = self.classify(event) if user is not None else None
+        verdict = self.hit(user.id, kind) if kind is not None else PASS
+        if verdict == PASS:
+            self.passed += 1
+            return await handler(event, data)
+        if self.exempt is not None and self.exempt(user.id):
+            self.exempted += 1
+            return await handler(event, data)
+        self.throttled[kind] += 1
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(self.callback_text)
+            elif verdict == NOTIFY and event.chat.type == "private":
+                self.notices += 1
+                await event.answer(self.message_text)
+        except TelegramAPIError as e:  # 回调过期等，提示发不出去不影响限速
+            logger.debug("Throttle notice failed: %s", e)
+        return None
+
+    def install(self, dp: Any) -> None:
+        for observer in (dp.message, dp.callback_query):
+            observer.outer_middleware(self.middleware)
+            self._installed.append(observer.outer_middleware)
+
+    def uninstall(self) -> None:
+        for manager in self._installed:
+            manager.unregister(self.middleware)
+        self._installed = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tracked": len(self._buckets), "passed": self.passed, "throttled": sum(self.throttled.values()),
+                "by_kind": dict(self.throttled), "notices": self.notices, "exempted": self.exempted,
+                "evicted": self.evicted}
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Webhook 运行模式：aiohttp 服务器
+#
+# - POST {path}：校验 X-Telegram-Bot-Api-Secret-Token，更新入有界队列后立即 200
+#   (队列满时返回 503，Telegram 会稍后重投)
+# - N 个 worker 并发执行 dp.feed_update
+# - GET /healthz 存活探针；GET /readyz 就绪探针(启动完成且未进入排空阶段)
+# - 停机：先标记排空(/readyz 503、拒收新更新)，等待队列处理完或超时，再停 worker
+
+import hmac
+import signal
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = "/tg/webhook", secret: str = "",
+                 workers: int = 16, queue_size: int = 1000, drain_timeout: float = 25.0):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.workers = max(1, workers)
+        self.drain_timeout = drain_timeout
+        self._queue: "asyncio.Queue[Update]" = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._runner: Optional[web.AppRunner] = None
+        self.ready = False
+        self.draining = False
+        self.received = 0
+        self.handled = 0
+        self.rejected = 0
+        self.errors = 0
+
+    # ---- HTTP ----
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self._on_update)
+        app.router.add_get("/healthz", self._on_health)
+        app.router.add_get("/readyz", self._on_ready)
+        return app
+
+    async def _on_update(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if self.draining:
+            return web.Response(status=503)
+        try:
+            data = await request.json()
+            update = Update.model_validate(data, context={"bot": self.bot})
+        except Exception:
+            return web.Response(status=400)
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return web.Response(status=503)
+        self.received += 1
+        return web.Response(status=200)
+
+    async def _on_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def _on_ready(self, request: web.Request) -> web.Response:
+        ok = self.ready and not self.draining
+        return web.json_response({"ready": ok, **self.stats()}, status=200 if ok else 503)
+
+    # ---- worker ----
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.handled += 1
+            except Exception:
+                self.errors += 1
+                logger.exception("webhook update %s failed", update.update_id)
+            finally:
+                self._queue.task_done()
+
+    # ---- 生命周期 ----
+    async def start(self, host: str, port: int) -> None:
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(), name=f"webhook-worker-{i}") for i in range(self.workers)]
+        self._runner = web.AppRunner(self.app(), handle_signals=False)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.ready = True
+        logger.info("Webhook server listening on %s:%s%s (%d workers)", host, port, self.path, self.workers)
+
+    async def stop(self) -> None:
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("webhook drain timed out with %d updates pending", self._queue.qsize())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        self.ready = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._queue.qsize(), "received": self.received, "handled": self.handled,
+                "rejected": self.rejected, "errors": self.errors}
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, base_url: str, path: str, secret: str,
+                      host: str, port: int, workers: int, drain_timeout: float = 25.0) -> None:
+    """注册 webhook 并运行到收到 SIGINT/SIGTERM，然后排空退出。
+    退出时不删除 webhook(滚动重启/多实例时其他实例还在接收)；改回轮询时由轮询启动前 delete_webhook()。"""
+    server = WebhookServer(dp, bot, path=path, secret=secret, workers=workers, drain_timeout=drain_timeout)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    workflow = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow)
+    await server.start(host, port)
+    await bot.set_webhook(url=base_url.rstrip("/") + path, secret_token=secret or None,
+                          allowed_updates=dp.resolve_used_update_types())
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, **workflow)
+        await bot.session.close()
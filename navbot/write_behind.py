@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# 分析类写入的异步批量落库(write-behind)
+#
+# - handler 只做 submit()：入内存队列即返回，不在回复链路上等待 fsync
+# - 后台任务每 flush_interval 秒或攒满 max_batch 行时，按库分组 executemany，一个库一次提交
+# - 队列有界：submit() 满则丢弃并计数；put() 则等待空位(背压)
+# - stop() 会把剩余事件全部落库，正常停机不丢数据
+
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_STOP = ("", ())  # 停止哨兵
+
+
+class WriteBehind:
+    def __init__(self, flush_interval: float = 0.5, max_batch: int = 500, maxsize: int = 10000):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.maxsize = maxsize
+        self._sinks: Dict[str, Tuple[Any, str]] = {}  # 事件名 → (SQLitePool, SQL)
+        self._q: "asyncio.Queue[Tuple[str, Tuple[Any, ...]]]" = asyncio.Queue(maxsize=maxsize)
+        self._wake = asyncio.Event()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.commits = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    def register(self, name: str, pool: Any, sql: str) -> None:
+        """登记事件类型：name 对应的参数元组将以 sql 写入 pool 所在的库。"""
+        self._sinks[name] = (pool, sql)
+
+    # ---- 入队 ----
+    def submit(self, name: str, params: Iterable[Any]) -> bool:
+        """非阻塞入队；队列满时丢弃并返回 False。"""
+        if name not in self._sinks:
+            raise KeyError(f"unregistered write-behind event: {name}")
+        try:
+            self._q.put_nowait((name, tuple(params)))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        if self._q.qsize() >= self.max_batch:
+            self._wake.set()
+        return True
+
+    async def put(self, name: str, params: Iterable[Any]) -> None:
+        """入队，队列满时等待(背压)。"""
+        if name not in self._sinks:
+            raise KeyError(f"unregistered write-behind event: {name}")
+        await self._q.put((name, tuple(params)))
+        self.enqueued += 1
+        if self._q.qsize() >= self.max_batch:
+            self._wake.set()
+
+    # ---- 落库 ----
+    def _drain(self, batch: List[Tuple[str, Tuple[Any, ...]]]) -> bool:
+        """从队列补满 batch；遇到停止哨兵返回 True。"""
+        while len(batch) < self.max_batch:
+            try:
+                item = self._q.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is _STOP:
+                return True
+            batch.append(item)
+        return False
+
+    async def _flush(self, batch: List[Tuple[str, Tuple[Any, ...]]]) -> None:
+        # 按库分组，同库的多种事件在同一事务内写入
+        by_pool: Dict[int, Tuple[Any, Dict[str, List[Tuple[Any, ...]]]]] = {}
+        for name, params in batch:
+            pool, sql = self._sinks[name]
+            by_pool.setdefault(id(pool), (pool, {}))[1].setdefault(sql, []).append(params)
+        t0 = time.perf_counter()
+        for pool, groups in by_pool.values():
+            def _write(c, groups=groups) -> None:
+                for sql, rows in groups.items():
+                    c.executemany(sql, rows)
+                c.commit()
+            rows = sum(len(v) for v in groups.values())
+            try:
+                await pool.run(_write, "write_behind")
+                self.flushed += rows
+                self.commits += 1
+            except Exception as e:
+                self.failed += rows
+                logger.warning("write-behind flush failed (%d rows): %s", rows, e)
+        self.batches += 1
+        self.last_flush_ms = (time.perf_counter() - t0) * 1000
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._q.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            if self._q.qsize() < self.max_batch - 1:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            stopping = self._drain(batch)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    # ---- 生命周期 ----
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="write-behind")
+
+    async def stop(self) -> None:
+        """停止后台任务并落库全部剩余事件。"""
+        if self._task is not None and not self._task.done():
+            # 用哨兵而非 cancel：正在进行的 flush 会完整提交
+            await self._q.put(_STOP)
+            self._wake.set()
+            await self._task
+        self._task = None
+        while not self._q.empty():
+            batch: List[Tuple[str, Tuple[Any, ...]]] = []
+            self._drain(batch)
+            if batch:
+                await self._flush(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._q.qsize(),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "commits": self.commits,
+            "batches": self.batches,
+            "last_flush_ms": self.last_flush_ms,
+        }